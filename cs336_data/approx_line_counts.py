@@ -0,0 +1,177 @@
+import math
+
+import numpy as np
+
+# every slot is a 2-bit saturating counter, four to a byte: 0, 1, 2 and "3 or more"
+COUNTER_BITS = 2
+SLOTS_PER_BYTE = 8 // COUNTER_BITS
+COUNTER_MAX = (1 << COUNTER_BITS) - 1
+DEFAULT_NUM_HASHES = 4
+
+
+def bloom_parameters(expected_items: int, false_positive_rate: float) -> tuple[int, int]:
+    """Slots and hash functions for a counting Bloom filter with the given false-positive target.
+
+    A line that occurs once is wrongly counted as a duplicate when every one
+    of its slots was also hit by another line, which is the usual Bloom
+    filter false positive, so the textbook sizing applies.
+    """
+    if not 0 < false_positive_rate < 1:
+        raise ValueError(f"false_positive_rate must be in (0, 1), got {false_positive_rate}")
+    num_slots = math.ceil(-expected_items * math.log(false_positive_rate) / math.log(2) ** 2)
+    num_hashes = max(1, round(num_slots / max(expected_items, 1) * math.log(2)))
+    return num_slots, num_hashes
+
+
+def expected_false_positive_rate(num_slots: int, num_hashes: int, num_items: int) -> float:
+    return (1 - math.exp(-num_hashes * num_items / num_slots)) ** num_hashes
+
+
+def table_nbytes(num_slots: int) -> int:
+    return -(-num_slots // SLOTS_PER_BYTE)
+
+
+def _mix64(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer, gives the second hash for double hashing
+    x = x ^ (x >> np.uint64(30))
+    x = x * np.uint64(0xBF58476D1CE4E5B9)
+    x = x ^ (x >> np.uint64(27))
+    x = x * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class CountingBloomFilter:
+    """Approximate line counts in 2-bit saturating counters, packed four to a byte.
+
+    Every line hash (the uint64 from exact_deduplication.hash_lines) is mapped
+    to `num_hashes` slots by double hashing, and its count is the minimum of
+    those counters. Counts are never underestimated, so a duplicated line is
+    never kept; a line seen once is dropped only if all of its slots collide.
+    With num_hashes=1 this is the direct-mapped table of the shared dedup
+    mode at a quarter of the memory per slot.
+
+    `buffer` (e.g. SharedMemory.buf) lets other processes look counts up in
+    the same table. Updates are not atomic: only one process should add.
+    """
+
+    def __init__(self, num_slots: int, num_hashes: int = DEFAULT_NUM_HASHES, buffer=None):
+        self.num_slots = num_slots
+        self.num_hashes = num_hashes
+        if buffer is None:
+            self.table = np.zeros(table_nbytes(num_slots), dtype=np.uint8)
+        else:
+            self.table = np.ndarray((table_nbytes(num_slots),), dtype=np.uint8, buffer=buffer)
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes
+
+    def slots(self, hashes: np.ndarray) -> np.ndarray:
+        """(len(hashes), num_hashes) slot indices."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        if self.num_hashes == 1:
+            return (hashes % np.uint64(self.num_slots))[:, None]
+        step = _mix64(hashes) | np.uint64(1)
+        multipliers = np.arange(self.num_hashes, dtype=np.uint64)
+        # uint64 arithmetic wraps, which is fine for hashing
+        return (hashes[:, None] + step[:, None] * multipliers) % np.uint64(self.num_slots)
+
+    def _read(self, slots: np.ndarray) -> np.ndarray:
+        shifts = ((slots % SLOTS_PER_BYTE) * COUNTER_BITS).astype(np.uint8)
+        return (self.table[slots // SLOTS_PER_BYTE] >> shifts) & COUNTER_MAX
+
+    def add(self, hashes: np.ndarray, counts: np.ndarray | None = None):
+        """Add every hash `counts` times (once by default)."""
+        if len(hashes) == 0:
+            return
+        # counters saturate, so an increment never needs more than COUNTER_BITS bits: pack it
+        # below the slot and sort the keys directly, which is much faster than an argsort
+        keys = self.slots(hashes) << np.uint64(COUNTER_BITS)
+        if counts is None:
+            keys |= np.uint64(1)
+        else:
+            keys |= np.minimum(np.asarray(counts), COUNTER_MAX).astype(np.uint64)[:, None]
+        keys = np.sort(keys.ravel())
+        # sum the increments of equal slots, then of slots sharing a byte, so each byte is written once
+        slots = keys >> np.uint64(COUNTER_BITS)
+        starts = np.flatnonzero(np.concatenate(([True], slots[1:] != slots[:-1])))
+        slots = slots[starts]
+        increments = np.add.reduceat((keys & np.uint64(COUNTER_MAX)).astype(np.int64), starts)
+
+        current = self._read(slots).astype(np.int64)
+        updated = np.minimum(current + increments, COUNTER_MAX)
+        deltas = (updated - current) << ((slots % SLOTS_PER_BYTE) * COUNTER_BITS).astype(np.int64)
+        byte_index = slots // SLOTS_PER_BYTE
+        byte_starts = np.flatnonzero(np.concatenate(([True], byte_index[1:] != byte_index[:-1])))
+        # counters in a byte are disjoint bit fields, so adding the deltas never carries
+        self.table[byte_index[byte_starts]] += np.add.reduceat(deltas, byte_starts).astype(np.uint8)
+
+    def counts(self, hashes: np.ndarray) -> np.ndarray:
+        """Estimated count of every hash, saturated at COUNTER_MAX."""
+        if len(hashes) == 0:
+            return np.empty(0, dtype=np.uint8)
+        return self._read(self.slots(hashes)).min(axis=1)
+
+    def fill_ratio(self) -> float:
+        """Fraction of non-zero counters."""
+        occupied = 0
+        for shift in range(0, 8, COUNTER_BITS):
+            occupied += np.count_nonzero((self.table >> shift) & COUNTER_MAX)
+        # padding slots of the last byte are always zero
+        return occupied / self.num_slots
+
+
+def collision_rate(bloom: CountingBloomFilter, hashes: np.ndarray, exact_counts: np.ndarray) -> tuple[float, int]:
+    """Fraction of the lines that occur exactly once which the filter counts as duplicates.
+
+    Returns (rate, number of lines seen once) so callers can judge the sample size.
+    """
+    once = hashes[exact_counts == 1]
+    if len(once) == 0:
+        return 0.0, 0
+    return float(np.mean(bloom.counts(once) != 1)), len(once)
+
+
+def benchmark_approx_counts(distinct_lines: int = 5_000_000, memory_mb: float = 64, seed: int = 42):
+    """Collision rate of the int8 table against packed counters and counting Bloom filters.
+
+    Line multiplicities are zipf-like, as for boilerplate lines. The int8
+    table of the shared dedup mode is direct-mapped, so its collision rate
+    is the one of a 2-bit num_hashes=1 filter with the same number of slots.
+    """
+    import time
+
+    rng = np.random.default_rng(seed)
+    hashes = rng.integers(0, np.iinfo(np.uint64).max, distinct_lines, dtype=np.uint64, endpoint=True)
+    counts = np.minimum(rng.zipf(2.0, distinct_lines), 1000)
+    budget = int(memory_mb * 1024 ** 2)
+    print(f"{distinct_lines:,} distinct lines, {np.mean(counts == 1):.1%} of them occur once")
+
+    configs = [
+        ("int8 table", budget, 1, budget),
+        ("2-bit, 1/4 memory", budget, 1, budget // 4),
+        ("2-bit, same memory", budget * SLOTS_PER_BYTE, 1, budget),
+    ]
+    for num_hashes in (2, 4, 7):
+        configs.append((f"bloom k={num_hashes}", budget * SLOTS_PER_BYTE, num_hashes, budget))
+    for name, num_slots, num_hashes, nbytes in configs:
+        bloom = CountingBloomFilter(num_slots, num_hashes)
+        start_time = time.perf_counter()
+        bloom.add(hashes, counts)
+        add_time = time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        rate, _ = collision_rate(bloom, hashes, counts)
+        lookup_time = time.perf_counter() - start_time
+        expected = expected_false_positive_rate(num_slots, num_hashes, distinct_lines)
+        print(f"{name:>20}: {nbytes / 1024 ** 2:7.1f} MB, collision rate {rate:.3e} (expected {expected:.3e}), "
+              f"add {add_time:.2f}s, lookup {lookup_time:.2f}s")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Compare approximate line-count tables at a memory budget.")
+    arg_parser.add_argument("--distinct_lines", type=int, default=5_000_000)
+    arg_parser.add_argument("--memory_mb", type=float, default=64)
+    args = arg_parser.parse_args()
+    benchmark_approx_counts(args.distinct_lines, args.memory_mb)
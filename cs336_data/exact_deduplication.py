@@ -1,30 +1,117 @@
+import itertools
 import os
 
+import mmh3
+import numpy as np
 
-def exact_deduplication(input_files, output_dir):
-    max_lines = 100_000_000
-    line_count = [0] * max_lines
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+# 128-bit keys are the two 64-bit halves of MurmurHash3 x64 128, compared lexicographically
+HASH128_DTYPE = np.dtype([("h0", np.uint64), ("h1", np.uint64)])
+
+
+def hash_lines(lines, hash_bits: int = 64) -> np.ndarray:
+    """Stable MurmurHash3 of every line: uint64 for 64 bits, HASH128_DTYPE for 128 bits."""
+    if hash_bits == 64:
+        return np.fromiter((mmh3.hash64(line, signed=False)[0] for line in lines), dtype=np.uint64)
+    if hash_bits == 128:
+        halves = itertools.chain.from_iterable(mmh3.hash64(line, signed=False) for line in lines)
+        return np.fromiter(halves, dtype=np.uint64).view(HASH128_DTYPE)
+    raise ValueError(f"hash_bits must be 64 or 128, got {hash_bits}")
+
+
+def reduce_counts(hashes: np.ndarray, counts: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Sort hashes and sum the counts of equal ones. Returns (unique sorted hashes, counts)."""
+    if len(hashes) == 0:
+        return hashes, counts
+    order = np.argsort(hashes, kind="stable")
+    hashes = hashes[order]
+    starts = np.flatnonzero(np.concatenate(([True], hashes[1:] != hashes[:-1])))
+    return hashes[starts], np.add.reduceat(counts[order], starts)
+
+
+def count_line_hashes(input_files, hash_bits: int = 64) -> tuple[np.ndarray, np.ndarray]:
+    """Count every distinct line across `input_files`, keyed by its hash.
+
+    Each file is reduced to its distinct hashes, and the per-file tables are
+    merged with a single sort at the end, so memory grows with the sum of the
+    files' distinct lines and never holds more than one file's raw hashes.
+    """
+    file_tables = [hash_lines([], hash_bits)]
+    file_table_counts = [np.empty(0, dtype=np.uint32)]
     for path in input_files:
-        with open(path, "r") as file:
-            for line in file:
-                line_hash = hash(line) % max_lines
-                line_count[line_hash] += 1
+        with open(path) as file:
+            file_hashes = hash_lines(file, hash_bits)
+        file_hashes, file_counts = np.unique(file_hashes, return_counts=True)
+        file_tables.append(file_hashes)
+        file_table_counts.append(file_counts.astype(np.uint32))
+    return reduce_counts(np.concatenate(file_tables), np.concatenate(file_table_counts))
+
+
+def lookup_counts(unique_hashes: np.ndarray, counts: np.ndarray, hashes: np.ndarray) -> np.ndarray:
+    """Counts of `hashes` in the sorted table; every looked-up hash must be present."""
+    return counts[np.searchsorted(unique_hashes, hashes)]
+
+
+def exact_deduplication(input_files, output_dir, hash_bits: int = 64):
+    """Write every input file to `output_dir` keeping only the lines that occur once across all files."""
+    os.makedirs(output_dir, exist_ok=True)
+    unique_hashes, counts = count_line_hashes(input_files, hash_bits)
     for path in input_files:
         output_path = os.path.join(output_dir, os.path.basename(path))
-        with open(path, "r") as infile, open(output_path, "w") as outfile:
-            for line in infile:
-                line_hash = hash(line) % max_lines
-                if line_count[line_hash] == 1:
-                    outfile.write(line)
+        with open(path) as infile:
+            lines = infile.readlines()
+        keep = lookup_counts(unique_hashes, counts, hash_lines(lines, hash_bits)) == 1
+        with open(output_path, "w") as outfile:
+            outfile.writelines(itertools.compress(lines, keep))
+
+
+def benchmark_exact_dedup(num_files: int = 20, lines_per_file: int = 100_000, distinct_lines: int = 500_000,
+                          hash_bits: int = 64, seed: int = 42):
+    """Deduplicate synthetic files and check the result against an exact string count."""
+    import collections
+    import tempfile
+    import time
+
+    rng = np.random.default_rng(seed)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_files = []
+        for i in range(num_files):
+            # zipf-like line ids: a few very common lines (boilerplate) and a long tail of unique ones
+            line_ids = np.minimum(rng.zipf(1.2, lines_per_file), distinct_lines)
+            path = os.path.join(tmp_dir, f"doc{i}.txt")
+            with open(path, "w") as f:
+                f.writelines(f"line {line_id} of some synthetic document text\n" for line_id in line_ids)
+            input_files.append(path)
+        total_mb = sum(os.path.getsize(p) for p in input_files) / 1024 ** 2
+
+        start_time = time.perf_counter()
+        exact_deduplication(input_files, os.path.join(tmp_dir, "out"), hash_bits)
+        elapsed = time.perf_counter() - start_time
+        unique_hashes, counts = count_line_hashes(input_files, hash_bits)
+        table_bytes = unique_hashes.nbytes + counts.nbytes
+
+        string_counts = collections.Counter()
+        for path in input_files:
+            with open(path) as f:
+                string_counts.update(f)
+        expected_kept = sum(1 for count in string_counts.values() if count == 1)
+        kept = 0
+        for path in input_files:
+            with open(os.path.join(tmp_dir, "out", os.path.basename(path))) as f:
+                kept += sum(1 for _ in f)
+
+    total_lines = num_files * lines_per_file
+    print(f"{num_files} files, {total_lines:,} lines ({total_mb:.1f} MB), {len(string_counts):,} distinct")
+    print(f"{hash_bits}-bit: {elapsed:.2f}s ({total_lines / elapsed:,.0f} lines/s), count table {table_bytes / 1024 ** 2:.1f} MB")
+    print(f"Kept {kept:,} lines, exact string count keeps {expected_kept:,}")
 
 
 if __name__ == "__main__":
-    input_files = [
-        "data/doc3.txt",
-        # Add more input file paths as needed
-        "data/doc4.txt",
-    ]
-    output_dir = "data/deduplicated_output/"
-    exact_deduplication(input_files, output_dir)
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Benchmark exact line deduplication on synthetic files.")
+    arg_parser.add_argument("--num_files", type=int, default=20)
+    arg_parser.add_argument("--lines_per_file", type=int, default=100_000)
+    arg_parser.add_argument("--distinct_lines", type=int, default=500_000)
+    arg_parser.add_argument("--hash_bits", type=int, default=64, choices=[64, 128])
+    args = arg_parser.parse_args()
+    benchmark_exact_dedup(args.num_files, args.lines_per_file, args.distinct_lines, args.hash_bits)
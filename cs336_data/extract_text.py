@@ -1,33 +1,166 @@
+import concurrent.futures
+from collections import defaultdict, deque
+from collections.abc import Iterator
+
+import regex as re
 from fastwarc.warc import ArchiveIterator, WarcRecordType
 from resiliparse.parse import encoding
 from resiliparse.extract.html2text import extract_plain_text
 from rich.progress import track
 
 
-def extract_warc(content_bytes: bytes) -> str:
+CHARSET_RE = re.compile(rb"""charset\s*=\s*["']?\s*([a-zA-Z0-9_:.\-]+)""", re.IGNORECASE)
+META_SNIFF_BYTES = 1024
+
+decode_tier_counter: dict[str, int] = defaultdict(int)
+
+
+def _declared_charset(content_type: str | None, content_bytes: bytes) -> tuple[str, str] | None:
+    if content_type:
+        match = CHARSET_RE.search(content_type.encode("ascii", errors="ignore"))
+        if match:
+            charset = encoding.map_encoding_to_html5(match.group(1).decode("ascii"), fallback_utf8=False)
+            if charset:
+                return "header", charset
+    head = content_bytes[:META_SNIFF_BYTES]
+    if b"<meta" in head.lower():
+        match = CHARSET_RE.search(head)
+        if match:
+            charset = encoding.map_encoding_to_html5(match.group(1).decode("ascii"), fallback_utf8=False)
+            if charset:
+                return "meta", charset
+    return None
+
+
+def decode_bytes(content_bytes: bytes, content_type: str | None = None) -> str:
+    """Decode a payload, running full encoding detection only as a last resort.
+
+    Tiers are tried in order: strict UTF-8, the charset declared in the HTTP
+    Content-Type header or a <meta> tag, resiliparse detection, and finally
+    UTF-8 with replacement. Hits per tier are counted in decode_tier_counter.
+    """
+    try:
+        text = content_bytes.decode("utf-8")
+        decode_tier_counter["utf8"] += 1
+        return text
+    except UnicodeDecodeError:
+        pass
+
+    declared = _declared_charset(content_type, content_bytes)
+    if declared is not None:
+        tier, charset = declared
+        try:
+            text = content_bytes.decode(charset)
+            decode_tier_counter[tier] += 1
+            return text
+        except (UnicodeDecodeError, LookupError):
+            pass
+
     encode = encoding.detect_encoding(content_bytes)
     try:
-        content = content_bytes.decode(encode)
+        text = content_bytes.decode(encode)
+        decode_tier_counter["detect"] += 1
+        return text
     except (UnicodeDecodeError, LookupError):
-        if __file__ == "__main__":
-            print(f"Failed to decode with {encode}, falling back to utf-8 with replacement.")
-        content = content_bytes.decode("utf-8", errors="replace")
+        decode_tier_counter["replace"] += 1
+        return content_bytes.decode("utf-8", errors="replace")
+
+
+def pop_decode_stats() -> dict[str, int]:
+    """Return the per-tier decode counts of this process and reset them."""
+    stats = dict(decode_tier_counter)
+    decode_tier_counter.clear()
+    return stats
+
+
+def extract_warc(content_bytes: bytes, content_type: str | None = None) -> str:
+    content = decode_bytes(content_bytes, content_type)
     text = extract_plain_text(content)
     return text
 
 
+def iter_warc_payloads(
+    warc_path: str, record_type: WarcRecordType = WarcRecordType.response
+) -> Iterator[tuple[str, str, str | None, bytes]]:
+    """Yield (record_id, url, content_type, payload) for every record of the given type."""
+    with open(warc_path, "rb") as f:
+        for record in ArchiveIterator(f, record_types=record_type):
+            url: str = record.headers.get("WARC-Target-URI", "unknown")  # type: ignore
+            content_type = record.http_headers.get("Content-Type") if record.http_headers else None
+            yield record.record_id, url, content_type, record.reader.read()
+
+
+def _extract_batch(payloads: list[tuple[bytes, str | None]]) -> list[str]:
+    return [extract_warc(payload, content_type) for payload, content_type in payloads]
+
+
+def iter_extracted_text(
+    warc_path: str,
+    executor: concurrent.futures.ProcessPoolExecutor,
+    record_type: WarcRecordType = WarcRecordType.response,
+    batch_size: int = 64,
+    max_pending: int = 64,
+) -> Iterator[tuple[str, str, str]]:
+    """Stream (record_id, url, text) through extract_warc on a process pool.
+
+    Records are shipped to workers in batches of `batch_size` and at most
+    `max_pending` batches are in flight, so memory stays bounded no matter
+    how large the WARC file is. Results are yielded in file order.
+    """
+    pending: deque[tuple[list[tuple[str, str]], concurrent.futures.Future]] = deque()
+    keys: list[tuple[str, str]] = []
+    payloads: list[tuple[bytes, str | None]] = []
+
+    def drain(limit: int) -> Iterator[tuple[str, str, str]]:
+        while len(pending) > limit:
+            batch_keys, future = pending.popleft()
+            for (record_id, url), text in zip(batch_keys, future.result()):
+                yield record_id, url, text
+
+    for record_id, url, content_type, payload in iter_warc_payloads(warc_path, record_type):
+        keys.append((record_id, url))
+        payloads.append((payload, content_type))
+        if len(payloads) >= batch_size:
+            pending.append((keys, executor.submit(_extract_batch, payloads)))
+            keys, payloads = [], []
+            yield from drain(max_pending - 1)
+    if payloads:
+        pending.append((keys, executor.submit(_extract_batch, payloads)))
+    yield from drain(0)
+
+
 if __name__ == "__main__":
     import argparse
+    import json
+    import os
     import sys
+    import time
     args = argparse.ArgumentParser(description="Extract text from WARC file.")
     args.add_argument("warc_path", type=str, help="Path to the input WARC file.")
-    args.add_argument("output_path", type=str, help="Path to the output text file.")
+    args.add_argument("output_path", type=str, help="Path to the output JSONL file.")
+    args.add_argument("-m", "--max_workers", type=int, default=len(os.sched_getaffinity(0)),
+                      help="Maximum number of worker processes")
+    args.add_argument("--batch_size", type=int, default=64, help="Records per worker task")
+    args.add_argument("--max_pending", type=int, default=None,
+                      help="Maximum number of batches in flight (default: 4 * max_workers)")
+    args.add_argument("--wet", action="store_true", help="Read WET conversion records instead of WARC responses")
     parsed_args = args.parse_args(sys.argv[1:])
     warc_path = parsed_args.warc_path
     output_path = parsed_args.output_path
+    record_type = WarcRecordType.conversion if parsed_args.wet else WarcRecordType.response
+    max_pending = parsed_args.max_pending or 4 * parsed_args.max_workers
 
-    with open(warc_path, "rb") as f:
-        line_count: int = sum(1 for _ in ArchiveIterator(f))
-    print(f"Total WARC records: {line_count}")
-    
-
+    start_time = time.time()
+    record_count = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=parsed_args.max_workers) as executor, \
+            open(output_path, "w", encoding="utf-8") as out_f:
+        stream = iter_extracted_text(
+            warc_path, executor, record_type,
+            batch_size=parsed_args.batch_size, max_pending=max_pending,
+        )
+        for record_id, url, text in track(stream, description="Extracting..."):
+            out_f.write(json.dumps({"record_id": record_id, "url": url, "text": text}, ensure_ascii=False) + "\n")
+            record_count += 1
+    elapsed_time = time.time() - start_time
+    print(f"Extracted {record_count} records to {output_path} in {elapsed_time:.2f} seconds "
+          f"({record_count / max(elapsed_time, 1e-9):.1f} records/second).")
@@ -1,18 +1,55 @@
 import concurrent.futures
+import contextlib
 import gc
+import glob
 import os
 import pathlib
 import random
+import shutil
 from tqdm import tqdm
 from fastwarc.warc import ArchiveIterator, WarcRecordType
-from resiliparse.parse import encoding
 from collections import defaultdict
+from collections.abc import Iterator
+import mmh3
+import tldextract
 from warcio.warcwriter import WARCWriter
 from warcio.statusandheaders import StatusAndHeaders
 from dataclasses import dataclass
 import numpy as np
 from multiprocessing import shared_memory
 import multiprocessing
+from cs336_data.approx_line_counts import (
+    DEFAULT_NUM_HASHES,
+    SLOTS_PER_BYTE,
+    CountingBloomFilter,
+    bloom_parameters,
+    collision_rate,
+    expected_false_positive_rate,
+    table_nbytes,
+)
+from cs336_data.exact_deduplication import HASH128_DTYPE, hash_lines, reduce_counts
+from cs336_data.extract_text import decode_bytes, pop_decode_stats
+from cs336_data.line_hash_index import COUNT_CAP, LineHashIndex
+from cs336_data.minhash_deduplication import (
+    UnionFind,
+    band_hashes,
+    bucket_pairs,
+    cluster_representatives,
+    preprocess,
+    shingle_hashes,
+    signatures_from_keys,
+    text_shingles,
+)
+from cs336_data.model_registry import MODEL_VARIANTS, get_model, make_executor, report_worker_memory
+from cs336_data.record_guard import DEFAULT_CPU_BUDGET, DEFAULT_REGEX_TIMEOUT, QUARANTINE_SUFFIX, RecordGuard
+
+
+# (band, bucket hash, doc) tuples of the out-of-core MinHash dedup; doc is shard index << 32 | record index
+MINHASH_BUCKET_DTYPE = np.dtype([("band", np.uint64), ("bucket", np.uint64), ("doc", np.uint64)])
+RECORD_INDEX_MASK = np.uint64(0xFFFFFFFF)
+
+# bundled public suffix list only: workers must not go to the network
+DOMAIN_EXTRACTOR = tldextract.TLDExtract(suffix_list_urls=())
 
 
 @dataclass
@@ -23,85 +60,114 @@ class Record:
 
 
 def decode_content(content_bytes: bytes) -> str:
-    encode = encoding.detect_encoding(content_bytes)
-    try:
-        text = content_bytes.decode(encode)
-    except (UnicodeDecodeError, LookupError):
-        if __file__ == "__main__":
-            print(
-                f"Failed to decode with {encode}, falling back to utf-8 with replacement."
-            )
-        text = content_bytes.decode("utf-8", errors="replace")
-    return text
+    # WET conversion records are UTF-8, so the strict UTF-8 tier almost always hits
+    return decode_bytes(content_bytes)
 
 
 def write_record(writer: WARCWriter, record: Record):
+    write_record_bytes(writer, record.url, record.content.encode("utf-8"))
+
+
+def write_record_bytes(writer: WARCWriter, url: str, content_bytes: bytes):
     from io import BytesIO
 
-    content_bytes = record.content.encode("utf-8")
     r = writer.create_warc_record(
-        record.url, record_type="conversion", payload=BytesIO(content_bytes)
+        url, record_type="conversion", payload=BytesIO(content_bytes)
     )
     writer.write_record(r)
 
 
-def process_single_wet_file(input_path: str, output_path: str):
-    from cs336_data.language_identification import detect_language
-    from cs336_data.mask_pii import mask_email, mask_phone_numbers, mask_ip_addresses
-    from cs336_data.harmful_content import classify_nsfw, classify_toxicity
-    from cs336_data.quality_filters import gopher_quality_filter
-
-    filter_counter = defaultdict(int)
-    with open(input_path, "rb") as infile, open(output_path, "wb") as warc_stream:
-        writer = WARCWriter(warc_stream, gzip=True)
-        for i, record in enumerate(ArchiveIterator(infile)):
+def iter_record_chunks(input_path: str, chunk_size: int) -> Iterator[list[Record]]:
+    chunk: list[Record] = []
+    with open(input_path, "rb") as infile:
+        for record in ArchiveIterator(infile):
             if record.record_type != WarcRecordType.conversion:
                 continue
-            record_id = record.record_id
             content_bytes = record.reader.read()
-            text = decode_content(content_bytes)
+            url: str = record.headers.get("WARC-Target-URI", "unknown")  # type: ignore
+            chunk.append(Record(url=url, recoder_id=record.record_id, content=decode_content(content_bytes)))
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
 
-            filter_counter["01_total"] += 1
-            lang, confidence = detect_language(text)
-            if lang != "en" or confidence < 0.8:
-                filter_counter["02_language"] += 1
-                continue
 
-            """
-            do we need to mask PII when I only care about validation loss?
-            """
-            # text, _ = mask_email(text)
-            # text, _ = mask_phone_numbers(text)
-            # text, _ = mask_ip_addresses(text)
-
-            """
-            do we need to filter harmful content when I only care about validation loss?
-            """
-            # nsfw, conf = classify_nsfw(text)
-            # if nsfw == "nsfw" and conf > 0.8:
-            #     filter_counter["nsfw"] += 1
-            #     continue
-
-            # toxicity, conf = classify_toxicity(text)
-            # if toxicity == "toxic" and conf > 0.8:
-            #     filter_counter["toxic"] += 1
-            #     continue
-
-            passed, reason = gopher_quality_filter(text)
-            if not passed:
-                filter_counter[f"03_quality"] += 1
-                continue
+def process_single_wet_file(
+    input_path: str,
+    output_path: str,
+    chunk_size: int = 256,
+    sampled_langid: bool = False,
+    regex_timeout: float | None = DEFAULT_REGEX_TIMEOUT,
+    cpu_budget: float | None = DEFAULT_CPU_BUDGET,
+    harmful: bool = True,
+    gopher_repetition: bool = False,
+):
+    from cs336_data.language_identification import detect_language_batch, detect_language_sampled_batch
+    from cs336_data.mask_pii import mask_pii
+    from cs336_data.harmful_content import classify_harmful_batch
+    from cs336_data.quality_filters import gopher_full_filter, gopher_quality_filter_fast
 
-            filter_counter["04_filter_passed"] += 1
+    quality_filter = gopher_full_filter if gopher_repetition else gopher_quality_filter_fast
 
-            url: str = record.headers.get("WARC-Target-URI", "unknown")  # type: ignore
-            rec = Record(
-                url=url,
-                recoder_id=record_id,
-                content=text,
-            )
-            write_record(writer, rec)
+    filter_counter = defaultdict(int)
+    pop_decode_stats()
+    # Records that blow a stage's regex timeout or CPU budget are skipped and listed next to the output
+    guard = RecordGuard(output_path + QUARANTINE_SUFFIX, regex_timeout=regex_timeout, cpu_budget=cpu_budget)
+    with guard, open(output_path, "wb") as warc_stream:
+        writer = WARCWriter(warc_stream, gzip=True)
+        for chunk in iter_record_chunks(input_path, chunk_size):
+            texts = [rec.content for rec in chunk]
+            if sampled_langid:
+                langs, confidences = detect_language_sampled_batch(texts, threshold=0.8)
+            else:
+                langs, confidences = detect_language_batch(texts)
+            masked: list[Record] = []
+            for rec, lang, confidence in zip(chunk, langs, confidences):
+                text = rec.content
 
+                filter_counter["01_total"] += 1
+                if lang != "en" or confidence < 0.8:
+                    filter_counter["02_language"] += 1
+                    continue
+
+                ok, result = guard.run(rec.recoder_id, "mask_pii", mask_pii, text, timeout=regex_timeout)
+                if not ok:
+                    filter_counter["05_quarantined"] += 1
+                    continue
+                text, email_count, phone_count, ip_count = result
+                filter_counter["pii_email"] += email_count
+                filter_counter["pii_phone"] += phone_count
+                filter_counter["pii_ip"] += ip_count
+                rec.content = text
+                masked.append(rec)
+
+            if harmful and masked:
+                # toxicity only runs on the records the NSFW model keeps
+                scores = classify_harmful_batch([rec.content for rec in masked], threshold=0.8)
+                filter_counter["nsfw"] += int((scores["nsfw"] > 0.8).sum())
+                filter_counter["toxic"] += int((scores["toxicity"] > 0.8).sum())
+                masked = [rec for rec, is_harmful in zip(masked, scores["harmful"]) if not is_harmful]
+
+            for rec in masked:
+                # The stdlib re scans in this stage cannot be interrupted by the CPU budget; they are linear
+                # and gopher_quality_filter_fast bounds the text they see to MAX_SCANNED_CHARS instead.
+                ok, result = guard.run(rec.recoder_id, "quality", quality_filter, rec.content)
+                if not ok:
+                    filter_counter["05_quarantined"] += 1
+                    continue
+                passed, reason = result
+                if not passed:
+                    filter_counter[f"03_quality"] += 1
+                    continue
+
+                filter_counter["04_filter_passed"] += 1
+                write_record(writer, rec)
+
+    for tier, count in pop_decode_stats().items():
+        filter_counter[f"decode_{tier}"] += count
+    for key, count in guard.counter.items():
+        filter_counter[key] += count
     return output_path, filter_counter
 
 
@@ -181,11 +247,448 @@ def exact_line_deduplication_single_file(
     return filter_counter
 
 
+def line_hash_spool_paths(spool_dir: str, input_path: str) -> tuple[str, str]:
+    name = os.path.basename(input_path)
+    return os.path.join(spool_dir, name + ".hashes.npy"), os.path.join(spool_dir, name + ".counts.npy")
+
+
+def record_spool_paths(spool_dir: str, input_path: str) -> tuple[str, str, str]:
+    """Decoded lines of a shard: UTF-8 bytes, per-line/per-record offsets, and record ids/urls."""
+    name = os.path.join(spool_dir, os.path.basename(input_path))
+    return name + ".lines.bin", name + ".lines.npz", name + ".records.tsv"
+
+
+def line_hash_map(input_path: str, spool_dir: str, spool_records: bool = False) -> tuple[str, int]:
+    """Map step: write the sorted distinct line hashes of one shard and their counts (saturated at 2).
+
+    With `spool_records`, the decoded lines are also written uncompressed
+    with their hashes and byte offsets, so phase 2 never has to decompress
+    and decode the shard again.
+    """
+    all_hashes: list[np.ndarray] = []
+    all_lengths: list[np.ndarray] = []
+    record_line_counts: list[int] = []
+    total_lines = 0
+    lines_path, offsets_path, records_path = record_spool_paths(spool_dir, input_path)
+    with contextlib.ExitStack() as stack:
+        file = stack.enter_context(open(input_path, "rb"))
+        if spool_records:
+            lines_file = stack.enter_context(open(lines_path, "wb"))
+            records_file = stack.enter_context(open(records_path, "w", encoding="utf-8"))
+        for record in ArchiveIterator(file):
+            if record.record_type != WarcRecordType.conversion:
+                continue
+            lines = decode_content(record.reader.read()).splitlines()
+            total_lines += len(lines)
+            if not spool_records:
+                all_hashes.append(hash_lines(lines))
+                continue
+            line_bytes = [line.encode("utf-8") for line in lines]
+            all_hashes.append(hash_lines(line_bytes))
+            all_lengths.append(np.fromiter(map(len, line_bytes), dtype=np.int64, count=len(line_bytes)))
+            record_line_counts.append(len(line_bytes))
+            lines_file.write(b"".join(line_bytes))
+            url: str = record.headers.get("WARC-Target-URI", "unknown")  # type: ignore
+            records_file.write(f"{record.record_id}\t{url.replace(chr(9), '%09')}\n")
+    hashes = np.concatenate(all_hashes) if all_hashes else np.empty(0, dtype=np.uint64)
+    if spool_records:
+        lengths = np.concatenate(all_lengths) if all_lengths else np.empty(0, dtype=np.int64)
+        np.savez(
+            offsets_path,
+            line_hashes=hashes,
+            line_ends=np.cumsum(lengths),
+            record_line_ends=np.cumsum(np.array(record_line_counts, dtype=np.int64)),
+        )
+    hashes, counts = np.unique(hashes, return_counts=True)
+    hashes_path, counts_path = line_hash_spool_paths(spool_dir, input_path)
+    np.save(hashes_path, hashes)
+    np.save(counts_path, np.minimum(counts, 2).astype(np.uint8))
+    return input_path, total_lines
+
+
+def partition_bounds(num_partitions: int) -> list[int]:
+    return [(i << 64) // num_partitions for i in range(num_partitions + 1)]
+
+
+def line_hash_reduce(spool_paths: list[tuple[str, str]], partition: int, num_partitions: int, output_path: str) -> tuple[int, int]:
+    """Reduce step: merge one hash range of every shard and write the hashes seen twice or more.
+
+    Shards are memory-mapped and each one contributes only the slice of its
+    sorted array that falls in this partition, found by binary search.
+    Returns (distinct lines, duplicated lines) in the partition.
+    """
+    bounds = partition_bounds(num_partitions)
+    low, high = bounds[partition], bounds[partition + 1]
+    slices_hashes: list[np.ndarray] = []
+    slices_counts: list[np.ndarray] = []
+    for hashes_path, counts_path in spool_paths:
+        hashes = np.load(hashes_path, mmap_mode="r")
+        counts = np.load(counts_path, mmap_mode="r")
+        begin = np.searchsorted(hashes, np.uint64(low))
+        end = len(hashes) if high >= 1 << 64 else np.searchsorted(hashes, np.uint64(high))
+        slices_hashes.append(np.asarray(hashes[begin:end]))
+        slices_counts.append(np.asarray(counts[begin:end]))
+    hashes, counts = reduce_counts(
+        np.concatenate(slices_hashes), np.concatenate(slices_counts).astype(np.uint32)
+    )
+    duplicates = hashes[counts >= 2]
+    np.save(output_path, duplicates)
+    return len(hashes), len(duplicates)
+
+
+def exact_line_deduplication_mapreduce_file(input_path: str, output_path: str, duplicates_path: str):
+    """Phase 2 of the map-reduce mode: drop lines whose hash is in the sorted duplicate set."""
+    filter_counter = defaultdict(int)
+    duplicates = np.load(duplicates_path, mmap_mode="r")
+    with open(input_path, "rb") as infile, open(output_path, "wb") as outfile:
+        writer = WARCWriter(outfile, gzip=True)
+        for record in ArchiveIterator(infile):
+            if record.record_type != WarcRecordType.conversion:
+                continue
+            lines = decode_content(record.reader.read()).splitlines()
+            filter_counter["dedup_total"] += 1
+
+            hashes = hash_lines(lines)
+            positions = np.searchsorted(duplicates, hashes)
+            is_duplicate = np.zeros(len(hashes), dtype=bool)
+            in_range = positions < len(duplicates)
+            is_duplicate[in_range] = duplicates[positions[in_range]] == hashes[in_range]
+            deduped_text = "\n".join(line for line, dup in zip(lines, is_duplicate) if not dup)
+
+            if not deduped_text.strip():
+                filter_counter["dedup_filtered"] += 1
+                continue
+            filter_counter["dedup_passed"] += 1
+
+            url: str = record.headers.get("WARC-Target-URI", "unknown")  # type: ignore
+            write_record(writer, Record(url=url, recoder_id=record.record_id, content=deduped_text))
+    return filter_counter
+
+
+def exact_line_deduplication_spooled_file(input_path: str, output_path: str, duplicates_path: str, spool_dir: str):
+    """Phase 2 from the spool written by line_hash_map: a count lookup and byte-slice copies, no gzip decode."""
+    filter_counter = defaultdict(int)
+    duplicates = np.load(duplicates_path, mmap_mode="r")
+    lines_path, offsets_path, records_path = record_spool_paths(spool_dir, input_path)
+    offsets = np.load(offsets_path)
+    line_hashes = offsets["line_hashes"]
+    line_ends = offsets["line_ends"]
+    line_starts = line_ends - np.diff(line_ends, prepend=0)
+    record_line_ends = offsets["record_line_ends"]
+
+    # one vectorized lookup for every line of the shard
+    positions = np.searchsorted(duplicates, line_hashes)
+    keep = np.ones(len(line_hashes), dtype=bool)
+    in_range = positions < len(duplicates)
+    keep[in_range] = duplicates[positions[in_range]] != line_hashes[in_range]
+
+    with open(lines_path, "rb") as f:
+        data = f.read()
+    with open(records_path, encoding="utf-8") as records_file, open(output_path, "wb") as outfile:
+        writer = WARCWriter(outfile, gzip=True)
+        record_start = 0
+        for record_end, record_line in zip(record_line_ends.tolist(), records_file):
+            filter_counter["dedup_total"] += 1
+            kept = np.flatnonzero(keep[record_start:record_end]) + record_start
+            record_start = record_end
+            content_bytes = b"\n".join(data[start:end] for start, end in zip(line_starts[kept].tolist(), line_ends[kept].tolist()))
+
+            # str.strip, as in the other modes, also treats non-ASCII whitespace as empty
+            if not content_bytes.decode("utf-8").strip():
+                filter_counter["dedup_filtered"] += 1
+                continue
+            filter_counter["dedup_passed"] += 1
+            url = record_line.rstrip("\n").split("\t", 1)[1]
+            write_record_bytes(writer, url, content_bytes)
+    return filter_counter
+
+
+def line_hash_counts(input_path: str) -> tuple[np.ndarray, np.ndarray, int]:
+    """Sorted distinct line hashes of one shard, their counts, and the number of lines."""
+    all_hashes: list[np.ndarray] = []
+    with open(input_path, "rb") as file:
+        for record in ArchiveIterator(file):
+            if record.record_type != WarcRecordType.conversion:
+                continue
+            all_hashes.append(hash_lines(decode_content(record.reader.read()).splitlines()))
+    hashes = np.concatenate(all_hashes) if all_hashes else np.empty(0, dtype=np.uint64)
+    unique_hashes, counts = np.unique(hashes, return_counts=True)
+    return unique_hashes, counts, len(hashes)
+
+
+def exact_line_deduplication_approx_file(
+    input_path: str, output_path: str, shm_name: str, num_slots: int, num_hashes: int
+):
+    """Phase 2 of the approximate mode: keep the lines the shared counting Bloom filter has seen once."""
+    filter_counter = defaultdict(int)
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        bloom = CountingBloomFilter(num_slots, num_hashes, buffer=shm.buf)
+        with open(input_path, "rb") as infile, open(output_path, "wb") as outfile:
+            writer = WARCWriter(outfile, gzip=True)
+            for record in ArchiveIterator(infile):
+                if record.record_type != WarcRecordType.conversion:
+                    continue
+                lines = decode_content(record.reader.read()).splitlines()
+                filter_counter["dedup_total"] += 1
+
+                keep = bloom.counts(hash_lines(lines)) == 1
+                deduped_text = "\n".join(line for line, kept in zip(lines, keep) if kept)
+
+                if not deduped_text.strip():
+                    filter_counter["dedup_filtered"] += 1
+                    continue
+                filter_counter["dedup_passed"] += 1
+
+                url: str = record.headers.get("WARC-Target-URI", "unknown")  # type: ignore
+                write_record(writer, Record(url=url, recoder_id=record.record_id, content=deduped_text))
+        del bloom
+    finally:
+        shm.close()
+    return filter_counter
+
+
+def registered_domain(url: str) -> str:
+    """Registered domain of a URL (news.bbc.co.uk -> bbc.co.uk), or the host for IPs and bare hostnames."""
+    extracted = DOMAIN_EXTRACTOR(url)
+    return extracted.top_domain_under_public_suffix or extracted.domain
+
+
+def domain_line_keys(domain: str, line_hashes: np.ndarray) -> np.ndarray:
+    keys = np.empty(len(line_hashes), dtype=HASH128_DTYPE)
+    keys["h0"] = mmh3.hash64(domain, signed=False)[0]
+    keys["h1"] = line_hashes
+    return keys
+
+
+def domain_lines_map(input_path: str, spool_dir: str) -> tuple[str, int]:
+    """Map step: write the sorted (domain, line hash) pairs of one shard, each pair once per record.
+
+    Counting pairs once per record means a line has to be on several pages
+    of a domain to be boilerplate, repeating within one page is not enough.
+    """
+    all_keys: list[np.ndarray] = []
+    with open(input_path, "rb") as file:
+        for record in ArchiveIterator(file):
+            if record.record_type != WarcRecordType.conversion:
+                continue
+            url: str = record.headers.get("WARC-Target-URI", "unknown")  # type: ignore
+            lines = decode_content(record.reader.read()).splitlines()
+            all_keys.append(domain_line_keys(registered_domain(url), np.unique(hash_lines(lines))))
+    keys = np.sort(np.concatenate(all_keys)) if all_keys else np.empty(0, dtype=HASH128_DTYPE)
+    np.save(os.path.join(spool_dir, os.path.basename(input_path) + ".domain_lines.npy"), keys)
+    return input_path, len(keys)
+
+
+def domain_boilerplate_reduce(
+    spool_paths: list[str], partition: int, num_partitions: int, output_path: str, min_pages: int
+) -> tuple[int, int]:
+    """Reduce step: keep the (domain, line) pairs of one domain-hash range found on `min_pages` or more pages."""
+    bounds = partition_bounds(num_partitions)
+    low, high = bounds[partition], bounds[partition + 1]
+    slices: list[np.ndarray] = []
+    for path in spool_paths:
+        keys = np.load(path, mmap_mode="r")
+        domains = keys["h0"]
+        begin = np.searchsorted(domains, np.uint64(low))
+        end = len(keys) if high >= 1 << 64 else np.searchsorted(domains, np.uint64(high))
+        slices.append(np.asarray(keys[begin:end]))
+    keys = np.concatenate(slices) if slices else np.empty(0, dtype=HASH128_DTYPE)
+    keys, pages = reduce_counts(keys, np.ones(len(keys), dtype=np.uint32))
+    boilerplate = keys[pages >= min_pages]
+    np.save(output_path, boilerplate)
+    return len(keys), len(boilerplate)
+
+
+def strip_domain_boilerplate_file(input_path: str, output_path: str, boilerplate_path: str):
+    """Drop the lines that are boilerplate of the record's domain. Returns counts and per-domain bytes."""
+    filter_counter = defaultdict(int)
+    domain_bytes: dict[str, int] = defaultdict(int)
+    domain_removed: dict[str, int] = defaultdict(int)
+    boilerplate = np.load(boilerplate_path, mmap_mode="r")
+    with open(input_path, "rb") as infile, open(output_path, "wb") as outfile:
+        writer = WARCWriter(outfile, gzip=True)
+        for record in ArchiveIterator(infile):
+            if record.record_type != WarcRecordType.conversion:
+                continue
+            url: str = record.headers.get("WARC-Target-URI", "unknown")  # type: ignore
+            domain = registered_domain(url)
+            lines = decode_content(record.reader.read()).splitlines()
+            filter_counter["boilerplate_total"] += 1
+
+            keys = domain_line_keys(domain, hash_lines(lines))
+            positions = np.searchsorted(boilerplate, keys)
+            is_boilerplate = np.zeros(len(keys), dtype=bool)
+            in_range = positions < len(boilerplate)
+            is_boilerplate[in_range] = boilerplate[positions[in_range]] == keys[in_range]
+            kept_lines = []
+            for line, removed in zip(lines, is_boilerplate):
+                line_bytes = len(line.encode("utf-8"))
+                domain_bytes[domain] += line_bytes
+                if removed:
+                    domain_removed[domain] += line_bytes
+                else:
+                    kept_lines.append(line)
+            text = "\n".join(kept_lines)
+
+            if not text.strip():
+                filter_counter["boilerplate_filtered"] += 1
+                continue
+            filter_counter["boilerplate_passed"] += 1
+            write_record(writer, Record(url=url, recoder_id=record.record_id, content=text))
+    return filter_counter, dict(domain_bytes), dict(domain_removed)
+
+
+def minhash_spool_paths(spool_dir: str, input_path: str) -> tuple[str, str]:
+    name = os.path.join(spool_dir, os.path.basename(input_path))
+    return name + ".signatures.npy", name + ".buckets.npy"
+
+
+def minhash_map(
+    input_path: str,
+    shard_index: int,
+    spool_dir: str,
+    num_hashes: int,
+    num_bands: int,
+    ngram_size: int,
+    batch_size: int = 1000,
+) -> tuple[str, int]:
+    """Map step: write the MinHash signature of every record and its sorted (band, bucket, doc) tuples.
+
+    Records are shingled and signed `batch_size` at a time, so memory is
+    bounded by a batch of shingle sets plus the shard's signatures. Records
+    without shingles keep their index but get no buckets.
+    """
+    signature_batches: list[np.ndarray] = []
+    has_shingles: list[bool] = []
+    batch: list[np.ndarray] = []
+    with open(input_path, "rb") as file:
+        for record in ArchiveIterator(file):
+            if record.record_type != WarcRecordType.conversion:
+                continue
+            keys = shingle_hashes(text_shingles(preprocess(decode_content(record.reader.read())), ngram_size))
+            batch.append(keys)
+            has_shingles.append(len(keys) > 0)
+            if len(batch) == batch_size:
+                signature_batches.append(signatures_from_keys(batch, num_hashes))
+                batch = []
+    if batch:
+        signature_batches.append(signatures_from_keys(batch, num_hashes))
+    signatures = np.concatenate(signature_batches) if signature_batches else np.empty((0, num_hashes), dtype=np.uint32)
+    signatures_path, buckets_path = minhash_spool_paths(spool_dir, input_path)
+    np.save(signatures_path, signatures)
+
+    docs = np.flatnonzero(np.array(has_shingles, dtype=bool)).astype(np.uint64)
+    buckets = np.empty(len(docs) * num_bands, dtype=MINHASH_BUCKET_DTYPE)
+    buckets["band"] = np.tile(np.arange(num_bands, dtype=np.uint64), len(docs))
+    buckets["bucket"] = band_hashes(signatures[docs.astype(np.int64)], num_bands).ravel()
+    buckets["doc"] = np.repeat(np.uint64(shard_index << 32) | docs, num_bands)
+    np.save(buckets_path, np.sort(buckets))
+    return input_path, len(signatures)
+
+
+def signature_rows(signature_paths: list[str], docs: np.ndarray) -> np.ndarray:
+    """Signatures of global doc ids, read from the memory-mapped per-shard spool."""
+    shards = (docs >> np.uint64(32)).astype(np.int64)
+    records = (docs & RECORD_INDEX_MASK).astype(np.int64)
+    rows = None
+    for shard in np.unique(shards).tolist():
+        shard_signatures = np.load(signature_paths[shard], mmap_mode="r")
+        if rows is None:
+            rows = np.empty((len(docs), shard_signatures.shape[1]), dtype=np.uint32)
+        in_shard = shards == shard
+        rows[in_shard] = shard_signatures[records[in_shard]]
+    return rows if rows is not None else np.empty((0, 0), dtype=np.uint32)
+
+
+def minhash_band_reduce(
+    spool_paths: list[tuple[str, str]],
+    band: int,
+    partition: int,
+    partitions_per_band: int,
+    output_path: str,
+    threshold: float,
+    max_bucket_size: int | None = None,
+) -> tuple[int, int]:
+    """Reduce step: group one bucket-hash range of one band by sorting, and verify its candidate pairs.
+
+    Every shard contributes the slice of its sorted tuples that falls in the
+    range, found by binary search. Pairs are verified with the Jaccard
+    similarity estimated from the spooled signatures, and the ones at or
+    above `threshold` are written as (doc, doc) edges. Returns
+    (candidate pairs, edges).
+    """
+    bounds = partition_bounds(partitions_per_band)
+    low = np.array((band, bounds[partition], 0), dtype=MINHASH_BUCKET_DTYPE)
+    if bounds[partition + 1] >= 1 << 64:
+        high = np.array((band + 1, 0, 0), dtype=MINHASH_BUCKET_DTYPE)
+    else:
+        high = np.array((band, bounds[partition + 1], 0), dtype=MINHASH_BUCKET_DTYPE)
+    slices: list[np.ndarray] = []
+    for _, buckets_path in spool_paths:
+        buckets = np.load(buckets_path, mmap_mode="r")
+        slices.append(np.asarray(buckets[np.searchsorted(buckets, low):np.searchsorted(buckets, high)]))
+    tuples = np.sort(np.concatenate(slices)) if slices else np.empty(0, dtype=MINHASH_BUCKET_DTYPE)
+
+    bucket_ids, docs = tuples["bucket"], tuples["doc"]
+    starts = np.flatnonzero(np.concatenate(([True], bucket_ids[1:] != bucket_ids[:-1]))) if len(tuples) else np.empty(0, dtype=np.int64)
+    ends = np.append(starts[1:], len(tuples))
+    first_parts: list[np.ndarray] = []
+    second_parts: list[np.ndarray] = []
+    for start, end in zip(starts[ends - starts >= 2].tolist(), ends[ends - starts >= 2].tolist()):
+        first, second = bucket_pairs(docs[start:end], max_bucket_size)
+        first_parts.append(first)
+        second_parts.append(second)
+    if first_parts:
+        pairs = np.unique(np.stack([np.concatenate(first_parts), np.concatenate(second_parts)], axis=1), axis=0)
+    else:
+        pairs = np.empty((0, 2), dtype=np.uint64)
+
+    signature_paths = [signatures_path for signatures_path, _ in spool_paths]
+    if len(pairs):
+        similarity = np.mean(signature_rows(signature_paths, pairs[:, 0]) == signature_rows(signature_paths, pairs[:, 1]), axis=1)
+        edges = pairs[similarity >= threshold]
+    else:
+        edges = pairs
+    np.save(output_path, edges)
+    return len(pairs), len(edges)
+
+
+def minhash_rewrite_file(input_path: str, shard_index: int, output_path: str, drop_path: str):
+    """Rewrite pass: copy every record of the shard that is not on the drop list, byte for byte."""
+    filter_counter = defaultdict(int)
+    drops = np.load(drop_path, mmap_mode="r")
+    begin = np.searchsorted(drops, np.uint64(shard_index << 32))
+    end = np.searchsorted(drops, np.uint64((shard_index + 1) << 32))
+    dropped = set((np.asarray(drops[begin:end]) & RECORD_INDEX_MASK).tolist())
+    with open(input_path, "rb") as infile, open(output_path, "wb") as outfile:
+        writer = WARCWriter(outfile, gzip=True)
+        record_index = 0
+        for record in ArchiveIterator(infile):
+            if record.record_type != WarcRecordType.conversion:
+                continue
+            content_bytes = record.reader.read()
+            filter_counter["minhash_total"] += 1
+            if record_index in dropped:
+                filter_counter["minhash_dropped"] += 1
+            else:
+                filter_counter["minhash_kept"] += 1
+                url: str = record.headers.get("WARC-Target-URI", "unknown")  # type: ignore
+                write_record_bytes(writer, url, content_bytes)
+            record_index += 1
+    return filter_counter
+
+
 def filter(
     wet_filepaths: list[str],
     executor: concurrent.futures.ProcessPoolExecutor,
     output_path: str,
     check_existing: bool = False,
+    sampled_langid: bool = False,
+    regex_timeout: float | None = DEFAULT_REGEX_TIMEOUT,
+    cpu_budget: float | None = DEFAULT_CPU_BUDGET,
+    harmful: bool = True,
+    gopher_repetition: bool = False,
 ):
     futures = []
     for wet_filepath in wet_filepaths:
@@ -198,6 +701,11 @@ def filter(
             process_single_wet_file,
             wet_filepath,
             output_wet_filepath,
+            sampled_langid=sampled_langid,
+            regex_timeout=regex_timeout,
+            cpu_budget=cpu_budget,
+            harmful=harmful,
+            gopher_repetition=gopher_repetition,
         )
         # Store the futures
         futures.append(future)
@@ -305,21 +813,404 @@ def dedup(
         print("Shared memory cleaned up.")
 
 
-global_model = None
+def dedup_mapreduce(
+    executor: concurrent.futures.ProcessPoolExecutor,
+    input_path: str,
+    output_path: str,
+    limit: int = 10000,
+    num_partitions: int = 64,
+    spool_dir: str | None = None,
+    spool_records: bool = True,
+    keep_spool: bool = False,
+):
+    """Exact line dedup without shared state, reproducible for any number of workers.
+
+    Map: every shard writes its sorted distinct line hashes to `spool_dir`.
+    Reduce: every partition of the 64-bit hash space is merged across shards
+    and keeps the hashes that occur at least twice. The partitions are
+    disjoint and sorted, so their concatenation is the global duplicate set
+    that phase 2 binary-searches.
+
+    With `spool_records`, the map step also spools every shard's decoded
+    lines, and phase 2 rewrites shards from that spool instead of decoding
+    the gzip input a second time. Spool files are removed at the end unless
+    `keep_spool`.
+    """
+    all_input_files = sorted(glob.glob(os.path.join(input_path, "*.warc.wet.gz")))[:limit]
+    spool_dir = spool_dir or os.path.join(output_path, "_line_hashes")
+    os.makedirs(spool_dir, exist_ok=True)
+
+    futures = [executor.submit(line_hash_map, file_path, spool_dir, spool_records) for file_path in all_input_files]
+    total_lines = 0
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Map: hashing lines"):
+        total_lines += future.result()[1]
+    print(f"Total lines processed: {total_lines:,}")
+
+    spool_paths = [line_hash_spool_paths(spool_dir, file_path) for file_path in all_input_files]
+    partition_paths = [os.path.join(spool_dir, f"duplicates.{i:04d}.npy") for i in range(num_partitions)]
+    futures = [
+        executor.submit(line_hash_reduce, spool_paths, i, num_partitions, partition_paths[i])
+        for i in range(num_partitions)
+    ]
+    distinct_lines = duplicated_lines = 0
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Reduce: merging partitions"):
+        distinct, duplicated = future.result()
+        distinct_lines += distinct
+        duplicated_lines += duplicated
+    print(f"Distinct lines: {distinct_lines:,}, duplicated: {duplicated_lines:,} ({duplicated_lines / max(distinct_lines, 1):.2%})")
+
+    duplicates_path = os.path.join(spool_dir, "duplicates.npy")
+    np.save(duplicates_path, np.concatenate([np.load(path) for path in partition_paths]))
+
+    futures = []
+    os.makedirs(output_path, exist_ok=True)
+    for file_path in all_input_files:
+        deduped_output_path = os.path.join(output_path, os.path.basename(file_path))
+        if spool_records:
+            futures.append(executor.submit(
+                exact_line_deduplication_spooled_file, file_path, deduped_output_path, duplicates_path, spool_dir
+            ))
+        else:
+            futures.append(executor.submit(
+                exact_line_deduplication_mapreduce_file, file_path, deduped_output_path, duplicates_path
+            ))
+
+    filter_counter: dict[str, int] = defaultdict(int)
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Phase 2: Deduplicating"):
+        for key, value in future.result().items():
+            filter_counter[key] += value
+
+    print("Final dedup counts:")
+    total = max(filter_counter.values(), default=1)
+    for key, value in filter_counter.items():
+        print(f"{key}: {value:,} ({value/total:.2%})")
+    if not keep_spool:
+        shutil.rmtree(spool_dir)
+    return filter_counter
+
+
+def dedup_incremental(
+    executor: concurrent.futures.ProcessPoolExecutor,
+    input_path: str,
+    output_path: str,
+    index_dir: str,
+    limit: int = 10000,
+    spool_dir: str | None = None,
+    keep_spool: bool = False,
+):
+    """Exact line dedup of the shards not yet in the persistent line-hash index at `index_dir`.
+
+    Only new shards are hashed and rewritten: a line is kept if it occurs
+    once over every shard ever added, so the cost scales with the new batch,
+    not the whole crawl. Output written for earlier batches is not revisited,
+    so a line first seen there and repeated in this batch survives in its
+    earlier copy only. The new shards are added to the index once their
+    output is written, so an interrupted run is simply redone.
+    """
+    all_input_files = sorted(glob.glob(os.path.join(input_path, "*.warc.wet.gz")))[:limit]
+    index = LineHashIndex(index_dir)
+    new_names = set(index.new_shards([os.path.basename(path) for path in all_input_files]))
+    new_files = [path for path in all_input_files if os.path.basename(path) in new_names]
+    print(f"{len(new_files)} new shards, {len(all_input_files) - len(new_files)} already in the index "
+          f"({len(index.segments)} segments, {len(index):,} entries)")
+    if not new_files:
+        return defaultdict(int)
+    spool_dir = spool_dir or os.path.join(output_path, "_line_hashes")
+    os.makedirs(spool_dir, exist_ok=True)
+
+    futures = [executor.submit(line_hash_map, file_path, spool_dir, True) for file_path in new_files]
+    total_lines = 0
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Map: hashing new lines"):
+        total_lines += future.result()[1]
+    print(f"Total lines processed: {total_lines:,}")
+
+    spool_paths = [line_hash_spool_paths(spool_dir, file_path) for file_path in new_files]
+    batch_hashes, batch_counts = reduce_counts(
+        np.concatenate([np.load(hashes_path) for hashes_path, _ in spool_paths]),
+        np.concatenate([np.load(counts_path).astype(np.uint32) for _, counts_path in spool_paths]),
+    )
+    previous_counts = index.counts(batch_hashes)
+    total_counts = np.minimum(previous_counts + batch_counts, COUNT_CAP)
+    print(f"Distinct new-batch lines: {len(batch_hashes):,}, seen in earlier batches: "
+          f"{np.count_nonzero(previous_counts):,}, kept in earlier output but repeated now: "
+          f"{np.count_nonzero(previous_counts == 1):,}")
+    duplicates_path = os.path.join(spool_dir, "duplicates.npy")
+    np.save(duplicates_path, batch_hashes[total_counts >= 2])
+
+    futures = []
+    os.makedirs(output_path, exist_ok=True)
+    for file_path in new_files:
+        deduped_output_path = os.path.join(output_path, os.path.basename(file_path))
+        futures.append(executor.submit(
+            exact_line_deduplication_spooled_file, file_path, deduped_output_path, duplicates_path, spool_dir
+        ))
+    filter_counter: dict[str, int] = defaultdict(int)
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Phase 2: Deduplicating"):
+        for key, value in future.result().items():
+            filter_counter[key] += value
+
+    index.add([os.path.basename(path) for path in new_files], batch_hashes, batch_counts)
+    print(f"Index now has {len(index.shards)} shards in {len(index.segments)} segments "
+          f"({index.nbytes() / 1024**2:.1f} MB)")
+    print("Final dedup counts:")
+    total = max(filter_counter.values(), default=1)
+    for key, value in filter_counter.items():
+        print(f"{key}: {value:,} ({value/total:.2%})")
+    if not keep_spool:
+        shutil.rmtree(spool_dir)
+    return filter_counter
+
+
+def dedup_approx(
+    executor: concurrent.futures.ProcessPoolExecutor,
+    input_path: str,
+    output_path: str,
+    limit: int = 10000,
+    memory_bytes: int = 1 << 30,
+    num_hashes: int = DEFAULT_NUM_HASHES,
+    expected_lines: int | None = None,
+    false_positive_rate: float | None = None,
+    sample_bits: int = 10,
+):
+    """Approximate line dedup in a counting Bloom filter of 2-bit counters in shared memory.
+
+    Workers hash their shards and the parent folds the distinct hashes into
+    the filter, so there are no concurrent writes. Given `expected_lines`
+    (distinct lines) and `false_positive_rate`, the filter is sized for that
+    target; otherwise it fills `memory_bytes` with `num_hashes` hash functions.
+
+    Lines whose hash has its top `sample_bits` bits zero are also counted
+    exactly, to measure how many lines seen once the filter drops.
+    """
+    all_input_files = glob.glob(os.path.join(input_path, "*.warc.wet.gz"))[:limit]
+    if expected_lines is not None and false_positive_rate is not None:
+        num_slots, num_hashes = bloom_parameters(expected_lines, false_positive_rate)
+    else:
+        num_slots = memory_bytes * SLOTS_PER_BYTE
+    print(f"Creating counting Bloom filter: {num_slots:,} slots, {num_hashes} hashes, {table_nbytes(num_slots) / 1024**3:.2f} GB...")
+    shm = shared_memory.SharedMemory(create=True, size=table_nbytes(num_slots))
+    try:
+        bloom = CountingBloomFilter(num_slots, num_hashes, buffer=shm.buf)
+        bloom.table[:] = 0
+
+        futures = [executor.submit(line_hash_counts, file_path) for file_path in all_input_files]
+        total_lines = 0
+        sample_hashes: list[np.ndarray] = []
+        sample_counts: list[np.ndarray] = []
+        sample_shift = np.uint64(64 - sample_bits)
+        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Phase 1: Counting lines"):
+            hashes, counts, num_lines = future.result()
+            total_lines += num_lines
+            bloom.add(hashes, counts)
+            sampled = (hashes >> sample_shift) == 0
+            sample_hashes.append(hashes[sampled])
+            sample_counts.append(counts[sampled].astype(np.uint32))
+        print(f"Total lines processed: {total_lines:,}")
+
+        sample_hashes_all, sample_counts_all = reduce_counts(np.concatenate(sample_hashes), np.concatenate(sample_counts))
+        estimated_distinct = len(sample_hashes_all) << sample_bits
+        rate, sampled_once = collision_rate(bloom, sample_hashes_all, sample_counts_all)
+        print(f"Filter fill ratio: {bloom.fill_ratio():.2%}, estimated distinct lines: {estimated_distinct:,}")
+        print(f"Collision rate (lines seen once counted as duplicates): {rate:.3e} measured on {sampled_once:,} "
+              f"sampled lines, {expected_false_positive_rate(num_slots, num_hashes, estimated_distinct):.3e} expected")
+
+        futures = []
+        os.makedirs(output_path, exist_ok=True)
+        for file_path in all_input_files:
+            deduped_output_path = os.path.join(output_path, os.path.basename(file_path))
+            futures.append(executor.submit(
+                exact_line_deduplication_approx_file, file_path, deduped_output_path, shm.name, num_slots, num_hashes
+            ))
+        filter_counter: dict[str, int] = defaultdict(int)
+        for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Phase 2: Deduplicating"):
+            for key, value in future.result().items():
+                filter_counter[key] += value
+
+        print("Final dedup counts:")
+        total = max(filter_counter.values(), default=1)
+        for key, value in filter_counter.items():
+            print(f"{key}: {value:,} ({value/total:.2%})")
+        del bloom
+    finally:
+        shm.close()
+        shm.unlink()
+    return filter_counter
+
+
+def strip_boilerplate(
+    executor: concurrent.futures.ProcessPoolExecutor,
+    input_path: str,
+    output_path: str,
+    limit: int = 10000,
+    min_pages: int = 2,
+    num_partitions: int = 64,
+    report_top: int = 20,
+):
+    """Remove lines repeated on `min_pages` or more pages of the same registered domain.
+
+    Map-reduce like dedup_mapreduce, keyed by (domain hash, line hash): every
+    reduce task holds only one range of domains, so memory is bounded by
+    the largest partition rather than the corpus. Bytes removed per domain
+    are written to boilerplate_by_domain.tsv in `output_path`.
+    """
+    all_input_files = sorted(glob.glob(os.path.join(input_path, "*.warc.wet.gz")))[:limit]
+    spool_dir = os.path.join(output_path, "_domain_lines")
+    os.makedirs(spool_dir, exist_ok=True)
+
+    futures = [executor.submit(domain_lines_map, file_path, spool_dir) for file_path in all_input_files]
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Map: hashing domain lines"):
+        future.result()
+
+    spool_paths = [os.path.join(spool_dir, os.path.basename(path) + ".domain_lines.npy") for path in all_input_files]
+    partition_paths = [os.path.join(spool_dir, f"boilerplate.{i:04d}.npy") for i in range(num_partitions)]
+    futures = [
+        executor.submit(domain_boilerplate_reduce, spool_paths, i, num_partitions, partition_paths[i], min_pages)
+        for i in range(num_partitions)
+    ]
+    distinct_pairs = boilerplate_pairs = 0
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Reduce: counting per domain"):
+        distinct, boilerplate = future.result()
+        distinct_pairs += distinct
+        boilerplate_pairs += boilerplate
+    print(f"Distinct (domain, line) pairs: {distinct_pairs:,}, boilerplate: {boilerplate_pairs:,}")
+    boilerplate_path = os.path.join(spool_dir, "boilerplate.npy")
+    np.save(boilerplate_path, np.concatenate([np.load(path) for path in partition_paths]))
+
+    futures = []
+    for file_path in all_input_files:
+        futures.append(executor.submit(
+            strip_domain_boilerplate_file, file_path, os.path.join(output_path, os.path.basename(file_path)), boilerplate_path
+        ))
+    filter_counter: dict[str, int] = defaultdict(int)
+    domain_bytes: dict[str, int] = defaultdict(int)
+    domain_removed: dict[str, int] = defaultdict(int)
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Phase 2: Stripping boilerplate"):
+        counter, shard_bytes, shard_removed = future.result()
+        for key, value in counter.items():
+            filter_counter[key] += value
+        for domain, value in shard_bytes.items():
+            domain_bytes[domain] += value
+        for domain, value in shard_removed.items():
+            domain_removed[domain] += value
+    shutil.rmtree(spool_dir)
+
+    ranked = sorted(domain_bytes, key=lambda domain: (-domain_removed.get(domain, 0), domain))
+    with open(os.path.join(output_path, "boilerplate_by_domain.tsv"), "w", encoding="utf-8") as f:
+        f.write("domain\tbytes\tbytes_removed\n")
+        for domain in ranked:
+            f.write(f"{domain}\t{domain_bytes[domain]}\t{domain_removed.get(domain, 0)}\n")
+    total_bytes = sum(domain_bytes.values())
+    total_removed = sum(domain_removed.values())
+    print(f"Removed {total_removed:,} of {total_bytes:,} bytes ({total_removed / max(total_bytes, 1):.2%}) "
+          f"across {len(domain_removed):,} of {len(domain_bytes):,} domains")
+    for domain in ranked[:report_top]:
+        removed = domain_removed.get(domain, 0)
+        print(f"  {domain}: {removed:,} of {domain_bytes[domain]:,} bytes ({removed / max(domain_bytes[domain], 1):.1%})")
+    print("Final boilerplate counts:")
+    total = max(filter_counter.values(), default=1)
+    for key, value in filter_counter.items():
+        print(f"{key}: {value:,} ({value/total:.2%})")
+    return filter_counter
+
+
+def fuzzy_dedup(
+    executor: concurrent.futures.ProcessPoolExecutor,
+    input_path: str,
+    output_path: str,
+    limit: int = 10000,
+    num_hashes: int = 100,
+    num_bands: int = 10,
+    ngram_size: int = 5,
+    threshold: float = 0.8,
+    partitions_per_band: int = 8,
+    max_bucket_size: int | None = None,
+    keep_spool: bool = False,
+):
+    """Out-of-core MinHash near-duplicate removal over WET shards.
+
+    Map: every shard spools its record signatures and sorted
+    (band, bucket, doc) tuples. Reduce: every (band, bucket-hash range)
+    task merges its slice of every shard, groups it by sorting and verifies
+    the candidate pairs against the signatures. The parent unions the
+    verified edges, keeps the first record of every cluster and writes the
+    rest to minhash_drop.npy (sorted doc ids, shard index << 32 | record
+    index), which the rewrite pass applies. Map and reduce memory do not
+    grow with the number of shards. The parent streams the edge files one
+    at a time, twice: its memory is one edge file plus, for every record
+    with at least one near-duplicate edge, its doc id and a union-find
+    entry (17 bytes); records without edges cost nothing.
+    """
+    all_input_files = sorted(glob.glob(os.path.join(input_path, "*.warc.wet.gz")))[:limit]
+    if len(all_input_files) >= 1 << 32:
+        raise ValueError("Doc ids only have room for 2^32 shards")
+    spool_dir = os.path.join(output_path, "_minhash")
+    os.makedirs(spool_dir, exist_ok=True)
+
+    futures = {
+        executor.submit(minhash_map, file_path, i, spool_dir, num_hashes, num_bands, ngram_size): i
+        for i, file_path in enumerate(all_input_files)
+    }
+    records_per_shard = np.zeros(len(all_input_files), dtype=np.int64)
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Map: MinHash signatures"):
+        records_per_shard[futures[future]] = future.result()[1]
+    print(f"Total records: {records_per_shard.sum():,}")
+
+    spool_paths = [minhash_spool_paths(spool_dir, file_path) for file_path in all_input_files]
+    futures = []
+    edge_paths = []
+    for band in range(num_bands):
+        for partition in range(partitions_per_band):
+            edge_paths.append(os.path.join(spool_dir, f"edges.{band:03d}.{partition:04d}.npy"))
+            futures.append(executor.submit(
+                minhash_band_reduce, spool_paths, band, partition, partitions_per_band, edge_paths[-1],
+                threshold, max_bucket_size,
+            ))
+    candidate_pairs = 0
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Reduce: grouping buckets"):
+        candidate_pairs += future.result()[0]
+
+    # records without edges are always kept, so the union-find only covers the edge endpoints,
+    # in doc id order: a cluster's smallest index is then its first record
+    endpoints = np.unique(np.concatenate([np.empty(0, dtype=np.uint64)] + [np.load(path).ravel() for path in edge_paths]))
+    union_find = UnionFind(len(endpoints))
+    num_edges = 0
+    for path in edge_paths:
+        edges = np.searchsorted(endpoints, np.load(path))
+        num_edges += len(edges)
+        for first, second in edges.tolist():
+            union_find.union(first, second)
+    keep = np.zeros(len(endpoints), dtype=bool)
+    keep[cluster_representatives(union_find.roots())] = True
+    drops = endpoints[~keep]
+    drop_path = os.path.join(output_path, "minhash_drop.npy")
+    np.save(drop_path, drops)
+    print(f"Candidate pairs over all bands: {candidate_pairs:,}, near-duplicate edges: {num_edges:,}, "
+          f"dropping {len(drops):,} of {records_per_shard.sum():,} records")
+
+    futures = []
+    for i, file_path in enumerate(all_input_files):
+        futures.append(executor.submit(
+            minhash_rewrite_file, file_path, i, os.path.join(output_path, os.path.basename(file_path)), drop_path
+        ))
+    filter_counter: dict[str, int] = defaultdict(int)
+    for future in tqdm(concurrent.futures.as_completed(futures), total=len(futures), desc="Rewrite: dropping near-duplicates"):
+        for key, value in future.result().items():
+            filter_counter[key] += value
+
+    print("Final fuzzy dedup counts:")
+    total = max(filter_counter.values(), default=1)
+    for key, value in filter_counter.items():
+        print(f"{key}: {value:,} ({value/total:.2%})")
+    if not keep_spool:
+        shutil.rmtree(spool_dir)
+    return filter_counter
 
 
 def predict_c4_like(text: str) -> tuple[str, float]:
     from cs336_data.gen_fasttext import preprocess_text
-    import fasttext
 
     text = preprocess_text(text)
-    global global_model
-    if global_model is None:
-        dir_path = os.path.dirname(os.path.abspath(__file__))
-        global_model = fasttext.load_model(
-            os.path.join(dir_path, "../../model/qc_model.bin")
-        )
-    model = global_model
+    model = get_model("qc")
     output = model.predict(text)
     label = output[0][0].replace("__label__", "")  # type: ignore
     confidence = output[1][0]
@@ -399,7 +1290,6 @@ def filter_by_model(
 
 
 if __name__ == "__main__":
-    import glob
     from rich import print
     import argparse
     import time
@@ -414,6 +1304,40 @@ if __name__ == "__main__":
     arg_parser.add_argument(
         "--by_model", action="store_true", help="Whether to apply filtering by model"
     )
+    arg_parser.add_argument(
+        "--boilerplate",
+        action="store_true",
+        help="Strip lines repeated across pages of the same domain before deduplication",
+    )
+    arg_parser.add_argument(
+        "--boilerplate_min_pages",
+        type=int,
+        default=2,
+        help="Pages of a domain a line must be on to count as that domain's boilerplate",
+    )
+    arg_parser.add_argument(
+        "--fuzzy_dedup",
+        action="store_true",
+        help="Remove near-duplicate documents with out-of-core MinHash after exact line dedup",
+    )
+    arg_parser.add_argument(
+        "--minhash_threshold",
+        type=float,
+        default=0.8,
+        help="Estimated Jaccard similarity at which two documents are near-duplicates",
+    )
+    arg_parser.add_argument(
+        "--minhash_num_hashes", type=int, default=100, help="MinHash signature length for fuzzy dedup"
+    )
+    arg_parser.add_argument(
+        "--minhash_num_bands",
+        type=int,
+        default=10,
+        help="LSH bands for fuzzy dedup, of num_hashes // num_bands rows each",
+    )
+    arg_parser.add_argument(
+        "--minhash_ngram_size", type=int, default=5, help="Word n-gram length of the MinHash shingles"
+    )
     arg_parser.add_argument(
         "-m", "--max_workers", type=int, default=32, help="Maximum number of worker processes"
     )
@@ -422,6 +1346,89 @@ if __name__ == "__main__":
         action="store_true",
         help="Whether to skip processing files that already exist in the output directory",
     )
+    arg_parser.add_argument(
+        "--report_memory",
+        action="store_true",
+        help="Print per-worker RSS/PSS after the workers have started",
+    )
+    arg_parser.add_argument(
+        "--sampled_langid",
+        action="store_true",
+        help="Identify language from sampled spans, falling back to the full text near the threshold",
+    )
+    arg_parser.add_argument(
+        "--dedup_mode",
+        type=str,
+        default="mapreduce",
+        choices=["mapreduce", "shared", "approx", "incremental"],
+        help="Exact map-reduce line dedup (the default), the original shared-memory hash table (the default "
+        "before map-reduce; lossy on hash collisions), a counting Bloom filter, "
+        "or exact dedup of only the shards not yet in --dedup_index",
+    )
+    arg_parser.add_argument(
+        "--dedup_index",
+        type=str,
+        default="data/line_hash_index/",
+        help="In incremental mode, the persistent line-hash index shared by all crawl batches",
+    )
+    arg_parser.add_argument(
+        "--approx_memory_mb",
+        type=int,
+        default=1024,
+        help="In approx mode, memory for the 2-bit counters (four per byte)",
+    )
+    arg_parser.add_argument(
+        "--approx_num_hashes",
+        type=int,
+        default=DEFAULT_NUM_HASHES,
+        help="In approx mode, hash functions per line; 1 gives plain packed counters",
+    )
+    arg_parser.add_argument(
+        "--approx_fp_rate",
+        type=float,
+        default=None,
+        help="In approx mode, size the filter for this collision rate (needs --approx_expected_lines)",
+    )
+    arg_parser.add_argument(
+        "--approx_expected_lines",
+        type=int,
+        default=None,
+        help="In approx mode, expected number of distinct lines",
+    )
+    arg_parser.add_argument(
+        "--no_spool",
+        action="store_true",
+        help="In mapreduce mode, decode the input again in phase 2 instead of spooling decoded lines to disk",
+    )
+    arg_parser.add_argument(
+        "--model_variant",
+        type=str,
+        default="bin",
+        choices=MODEL_VARIANTS,
+        help="Load the full (bin) or quantized (ftz) classifiers; auto prefers ftz when it exists",
+    )
+    arg_parser.add_argument(
+        "--skip_harmful",
+        action="store_true",
+        help="Do not run the NSFW and toxicity classifiers",
+    )
+    arg_parser.add_argument(
+        "--gopher_repetition",
+        action="store_true",
+        help="Also apply the Gopher repetition rules (duplicate lines, paragraphs and n-grams) in the quality stage",
+    )
+    arg_parser.add_argument(
+        "--regex_timeout",
+        type=float,
+        default=DEFAULT_REGEX_TIMEOUT,
+        help="Regex timeout in seconds before a record is quarantined: for the whole record in mask_pii, per call elsewhere",
+    )
+    arg_parser.add_argument(
+        "--cpu_budget",
+        type=float,
+        default=DEFAULT_CPU_BUDGET,
+        help="CPU seconds a single stage may spend on one record before it is quarantined",
+    )
     arg_parser.add_argument(
         "--threshold",
         type=float,
@@ -442,17 +1449,38 @@ if __name__ == "__main__":
     wet_filepaths = wet_filepaths[: args.limit]
     num_cpus = min(len(os.sched_getaffinity(0)), int(len(wet_filepaths) / 2))
     num_cpus = min(num_cpus, args.max_workers)
-    # Set up the executor
-    executor = concurrent.futures.ProcessPoolExecutor(max_workers=num_cpus)
+    # Set up the executor. Models are loaded once here and shared copy-on-write by the forked workers.
+    model_names: list[str] = []
+    if args.filter:
+        model_names.append("lid")
+        if not args.skip_harmful:
+            model_names.extend(["nsfw", "toxicity"])
+    if args.by_model:
+        model_names.append("qc")
+    executor = make_executor(num_cpus, model_names, args.model_variant)
+    if args.report_memory:
+        report_worker_memory(executor, num_cpus)
     output_directory_path = "data/filtered_01/"
+    output_directory_path_boilerplate = "data/filtered_01_boilerplate/"
     output_directory_path_dedup = "data/filtered_01_deduped/"
+    output_directory_path_fuzzy = "data/filtered_01_fuzzy_deduped/"
     output_directory_path_by_model = "data/filtered_01_by_model/"
     print(f"Processing {len(wet_filepaths)} WET files using {num_cpus} CPUs.")
     os.makedirs(output_directory_path, exist_ok=True)
 
     if args.filter:
         start_time = time.time()
-        filter(wet_filepaths, executor, output_directory_path, check_existing=args.check_existing)
+        filter(
+            wet_filepaths,
+            executor,
+            output_directory_path,
+            check_existing=args.check_existing,
+            sampled_langid=args.sampled_langid,
+            regex_timeout=args.regex_timeout,
+            cpu_budget=args.cpu_budget,
+            harmful=not args.skip_harmful,
+            gopher_repetition=args.gopher_repetition,
+        )
         end_time = time.time()
         elapsed_time = end_time - start_time
         print(
@@ -467,14 +1495,58 @@ if __name__ == "__main__":
         Filtering took 310.87 seconds. Throughput: 0.32 WET files/second.
         """
 
-    if args.dedup:
+    dedup_input_path = output_directory_path
+    if args.boilerplate:
         start_time = time.time()
-        dedup(
+        strip_boilerplate(
             executor,
             output_directory_path,
-            output_directory_path_dedup,
+            output_directory_path_boilerplate,
             limit=args.limit,
+            min_pages=args.boilerplate_min_pages,
         )
+        dedup_input_path = output_directory_path_boilerplate
+        elapsed_time = time.time() - start_time
+        print(
+            f"Boilerplate removal took {elapsed_time:.2f} seconds. Throughput: {len(wet_filepaths)/elapsed_time:.2f} WET files/second."
+        )
+
+    if args.dedup:
+        start_time = time.time()
+        if args.dedup_mode == "mapreduce":
+            dedup_mapreduce(
+                executor,
+                dedup_input_path,
+                output_directory_path_dedup,
+                limit=args.limit,
+                spool_records=not args.no_spool,
+            )
+        elif args.dedup_mode == "incremental":
+            dedup_incremental(
+                executor,
+                dedup_input_path,
+                output_directory_path_dedup,
+                args.dedup_index,
+                limit=args.limit,
+            )
+        elif args.dedup_mode == "approx":
+            dedup_approx(
+                executor,
+                dedup_input_path,
+                output_directory_path_dedup,
+                limit=args.limit,
+                memory_bytes=args.approx_memory_mb * 1024**2,
+                num_hashes=args.approx_num_hashes,
+                expected_lines=args.approx_expected_lines,
+                false_positive_rate=args.approx_fp_rate,
+            )
+        else:
+            dedup(
+                executor,
+                dedup_input_path,
+                output_directory_path_dedup,
+                limit=args.limit,
+            )
         end_time = time.time()
         elapsed_time = end_time - start_time
         print(
@@ -498,10 +1570,29 @@ if __name__ == "__main__":
         Deduplication took 263.37 seconds. Throughput: 5.32 WET files/second.
         """
 
+    by_model_input_path = output_directory_path_dedup
+    if args.fuzzy_dedup:
+        start_time = time.time()
+        fuzzy_dedup(
+            executor,
+            output_directory_path_dedup,
+            output_directory_path_fuzzy,
+            limit=args.limit,
+            num_hashes=args.minhash_num_hashes,
+            num_bands=args.minhash_num_bands,
+            ngram_size=args.minhash_ngram_size,
+            threshold=args.minhash_threshold,
+        )
+        by_model_input_path = output_directory_path_fuzzy
+        elapsed_time = time.time() - start_time
+        print(
+            f"Fuzzy deduplication took {elapsed_time:.2f} seconds. Throughput: {len(wet_filepaths)/elapsed_time:.2f} WET files/second."
+        )
+
     if args.by_model:
         start_time = time.time()
         filter_by_model(
-            output_directory_path_dedup,
+            by_model_input_path,
             executor,
             output_directory_path_by_model,
             limit=args.limit,
@@ -4,6 +4,7 @@ import datasets
 from fastwarc import ArchiveIterator, WarcRecordType
 from cs336_data.gen_fasttext import preprocess_text
 from cs336_data.filter_CC.filter_01 import decode_content
+from cs336_data.warc_index import count_records
 import os
 
 def gen_fasttext_pos_data(data):
@@ -49,10 +50,7 @@ if __name__ == "__main__":
     # depend on filter_01 output
     warc_wets = glob.glob("data/filtered_01_deduped/*.warc.wet.gz")
     first_one = warc_wets[0]
-    line_count = 0
-    with open(first_one, "rb") as f:
-        for record in ArchiveIterator(f):
-            line_count += 1
+    line_count = count_records(first_one, build=True)
     estimated_line_count = int(line_count * 1.05)
 
     prob = pos_count * 2 / estimated_line_count
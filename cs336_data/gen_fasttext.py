@@ -4,6 +4,7 @@ import regex as re
 from cs336_data.extract_text import extract_warc
 from cs336_data.language_identification import detect_language
 from cs336_data.quality_filters import gopher_quality_filter
+from cs336_data.warc_index import count_records
 
 
 def preprocess_text(text: str) -> str:
@@ -61,8 +62,7 @@ if __name__ == "__main__":
     output_path = args.output_path
     is_positive = not bool(args.negative)
 
-    with open(warc_path, "rb") as f:
-        line_count: int = sum(1 for _ in ArchiveIterator(f))
+    line_count: int = count_records(warc_path, build=True)
 
-    print(f"Total {"positive" if is_positive else "negative"} records in WARC: {line_count} ")
+    print(f"Total {'positive' if is_positive else 'negative'} records in WARC: {line_count} ")
     generate_fasttext_pos_data(warc_path, output_path, line_count, args.negative)
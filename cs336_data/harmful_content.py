@@ -1,17 +1,18 @@
-import fasttext
+import numpy as np
+
+from cs336_data.model_registry import get_model
+
+# Label each binary model gives to harmful text
+HARMFUL_LABELS = {"nsfw": "nsfw", "toxicity": "toxic"}
+HARMFUL_THRESHOLD = 0.8
+# Per-document score table: probability of the harmful label from each model, NaN when the model was skipped
+HARMFUL_SCORES_DTYPE = np.dtype([("nsfw", np.float32), ("toxicity", np.float32), ("harmful", np.bool_)])
 
-global_models: dict = {}
 
 def _get_model(model_name: str):
-    global global_models
-    if model_name not in global_models:
-        if model_name == "nsfw":
-            global_models[model_name] = fasttext.load_model("model/jigsaw_fasttext_bigrams_nsfw_final.bin")
-        elif model_name == "toxicity":
-            global_models[model_name] = fasttext.load_model("model/jigsaw_fasttext_bigrams_hatespeech_final.bin")
-        else:
-            raise ValueError(f"Unknown model name: {model_name}")
-    return global_models[model_name]
+    if model_name not in ("nsfw", "toxicity"):
+        raise ValueError(f"Unknown model name: {model_name}")
+    return get_model(model_name)
 
 def classify_nsfw(text: str) -> tuple[str, float]:
     text = text.replace("\n", " ").strip()
@@ -31,7 +32,95 @@ def classify_toxicity(text: str) -> tuple[str, float]:
     return label, confidence
 
 
+def harmful_probability_batch(model_name: str, texts: list[str], batch_size: int = 1024) -> np.ndarray:
+    """Probability of the harmful label for texts that are already normalized (no newlines)."""
+    model = _get_model(model_name)
+    harmful_label = "__label__" + HARMFUL_LABELS[model_name]
+    probabilities = np.empty(len(texts), dtype=np.float32)
+    for begin in range(0, len(texts), batch_size):
+        labels, confidences = model.predict(texts[begin:begin + batch_size])
+        for i, (doc_labels, doc_confidences) in enumerate(zip(labels, confidences), start=begin):
+            # both models are binary, so the other label's probability is the complement
+            confidence = doc_confidences[0]
+            probabilities[i] = confidence if doc_labels[0] == harmful_label else 1.0 - confidence
+    return probabilities
+
+
+def classify_harmful_batch(
+    texts: list[str],
+    threshold: float = HARMFUL_THRESHOLD,
+    short_circuit: bool = True,
+    batch_size: int = 1024,
+) -> np.ndarray:
+    """Score texts with the NSFW model, then the toxicity model, in batches.
+
+    Texts are normalized once for both models. With `short_circuit`, texts
+    the NSFW model already rejects skip the toxicity model and keep a NaN
+    toxicity score. A text is harmful when either probability exceeds
+    `threshold`, the same rule as checking classify_nsfw/classify_toxicity
+    for label and confidence > threshold.
+    """
+    normalized = [text.replace("\n", " ").strip() for text in texts]
+    scores = np.zeros(len(texts), dtype=HARMFUL_SCORES_DTYPE)
+    scores["nsfw"] = harmful_probability_batch("nsfw", normalized, batch_size)
+    nsfw_rejected = scores["nsfw"] > threshold
+    scores["toxicity"] = np.nan
+    if short_circuit:
+        remaining = np.flatnonzero(~nsfw_rejected)
+    else:
+        remaining = np.arange(len(texts))
+    if len(remaining) > 0:
+        scores["toxicity"][remaining] = harmful_probability_batch(
+            "toxicity", [normalized[i] for i in remaining], batch_size
+        )
+    # NaN compares False, so skipped texts are decided by the NSFW score alone
+    scores["harmful"] = nsfw_rejected | (scores["toxicity"] > threshold)
+    return scores
+
+
+def benchmark_harmful(wet_path: str, max_records: int = 20000, threshold: float = HARMFUL_THRESHOLD):
+    import time
+    from fastwarc.warc import ArchiveIterator, WarcRecordType
+    from cs336_data.extract_text import decode_bytes
+
+    texts: list[str] = []
+    with open(wet_path, "rb") as f:
+        for record in ArchiveIterator(f, record_types=WarcRecordType.conversion):
+            texts.append(decode_bytes(record.reader.read()))
+            if len(texts) >= max_records:
+                break
+    _get_model("nsfw")
+    _get_model("toxicity")
+
+    start_time = time.perf_counter()
+    single_harmful = []
+    for text in texts:
+        label, conf = classify_nsfw(text)
+        is_harmful = label == "nsfw" and conf > threshold
+        if not is_harmful:
+            label, conf = classify_toxicity(text)
+            is_harmful = label == "toxic" and conf > threshold
+        single_harmful.append(is_harmful)
+    single_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    scores = classify_harmful_batch(texts, threshold=threshold)
+    batch_time = time.perf_counter() - start_time
+
+    print(f"Records: {len(texts)}, harmful: {int(scores['harmful'].sum())}, "
+          f"toxicity skipped: {int(np.isnan(scores['toxicity']).sum())}")
+    print(f"One by one: {single_time:.2f}s ({len(texts) / single_time:.0f} records/s)")
+    print(f"Cascade:    {batch_time:.2f}s ({len(texts) / batch_time:.0f} records/s), speedup {single_time / batch_time:.2f}x")
+    print(f"Decision agreement: {np.mean(scores['harmful'] == np.array(single_harmful)):.4%}")
+
+
 if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1:
+        # python -m cs336_data.harmful_content <shard.warc.wet.gz>
+        benchmark_harmful(sys.argv[1])
+        sys.exit(0)
+
     from fastwarc.warc import ArchiveIterator, WarcRecordType
     from rich.progress import track
     import random
@@ -1,23 +1,140 @@
-import fasttext
+from collections.abc import Iterable
+import numpy as np
 from cs336_data.extract_text import extract_warc
+from cs336_data.model_registry import get_model
+
+
+def _get_model():
+    return get_model("lid")
 
-global_model = None
 
 def detect_language(text: str) -> tuple[str, float]:
     text = text.replace("\n", " ").strip()
-    global global_model
-    if global_model is None:
-        import os
-        current_dir = os.path.dirname(__file__)
-        global_model = fasttext.load_model(os.path.join(current_dir, "../model/lid.176.bin"))
-    model = global_model
+    model = _get_model()
     output = model.predict(text)
     lang = output[0][0].replace("__label__", "")
     confidence = output[1][0]
     return lang, confidence
 
 
+def detect_language_batch(
+    texts: Iterable[str], k: int = 1, batch_size: int = 1024
+) -> tuple[np.ndarray, np.ndarray]:
+    """Classify many texts with fastText's list-mode predict.
+
+    Returns (labels, confidences). With k == 1 both arrays have shape (n,),
+    otherwise (n, k), ordered by decreasing confidence.
+    """
+    model = _get_model()
+    all_labels: list[list[str]] = []
+    all_confidences: list[np.ndarray] = []
+
+    def flush(batch: list[str]):
+        labels, confidences = model.predict(batch, k=k)
+        for doc_labels, doc_confidences in zip(labels, confidences):
+            all_labels.append([label.removeprefix("__label__") for label in doc_labels])
+            all_confidences.append(doc_confidences)
+
+    batch: list[str] = []
+    for text in texts:
+        batch.append(text.replace("\n", " ").strip())
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    if not all_labels:
+        shape = (0,) if k == 1 else (0, k)
+        return np.empty(shape, dtype=object), np.empty(shape, dtype=np.float32)
+    labels_array = np.array(all_labels, dtype=object)
+    confidences_array = np.array(all_confidences, dtype=np.float32)
+    if k == 1:
+        return labels_array[:, 0], confidences_array[:, 0]
+    return labels_array, confidences_array
+
+
+def sample_spans(text: str, prefix_chars: int = 1000, num_windows: int = 2, window_chars: int = 300) -> str:
+    """Return a bounded prefix of `text` plus `num_windows` evenly spaced windows from the rest."""
+    if len(text) <= prefix_chars + num_windows * window_chars:
+        return text
+    spans = [text[:prefix_chars]]
+    rest = len(text) - prefix_chars
+    stride = rest // (num_windows + 1)
+    for i in range(1, num_windows + 1):
+        start = prefix_chars + i * stride - window_chars // 2
+        spans.append(text[start:start + window_chars])
+    return " ".join(spans)
+
+
+def detect_language_sampled_batch(
+    texts: list[str],
+    prefix_chars: int = 1000,
+    num_windows: int = 2,
+    window_chars: int = 300,
+    threshold: float = 0.8,
+    margin: float = 0.1,
+    batch_size: int = 1024,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Like detect_language_batch, but classify only sampled spans of each text.
+
+    Texts whose sampled confidence lands within `margin` of `threshold` are
+    re-classified on the full text, so the keep/drop decision at `threshold`
+    rarely differs from full-text classification.
+    """
+    samples = [sample_spans(text, prefix_chars, num_windows, window_chars) for text in texts]
+    labels, confidences = detect_language_batch(samples, batch_size=batch_size)
+    is_sampled = np.array([len(sample) < len(text) for sample, text in zip(samples, texts)], dtype=bool)
+    ambiguous = np.flatnonzero(is_sampled & (np.abs(confidences - threshold) < margin))
+    if len(ambiguous) > 0:
+        full_labels, full_confidences = detect_language_batch([texts[i] for i in ambiguous], batch_size=batch_size)
+        labels[ambiguous] = full_labels
+        confidences[ambiguous] = full_confidences
+    return labels, confidences
+
+
+def detect_language_sampled(text: str, **kwargs) -> tuple[str, float]:
+    labels, confidences = detect_language_sampled_batch([text], **kwargs)
+    return labels[0], float(confidences[0])
+
+
+def benchmark_sampled_langid(wet_path: str, max_records: int = 20000, threshold: float = 0.8, **kwargs):
+    import time
+    from fastwarc.warc import ArchiveIterator, WarcRecordType
+    from cs336_data.extract_text import decode_bytes
+
+    texts: list[str] = []
+    with open(wet_path, "rb") as f:
+        for record in ArchiveIterator(f, record_types=WarcRecordType.conversion):
+            texts.append(decode_bytes(record.reader.read()))
+            if len(texts) >= max_records:
+                break
+    _get_model()
+
+    start_time = time.perf_counter()
+    full_labels, full_confidences = detect_language_batch(texts)
+    full_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    sampled_labels, sampled_confidences = detect_language_sampled_batch(texts, threshold=threshold, **kwargs)
+    sampled_time = time.perf_counter() - start_time
+
+    full_keep = (full_labels == "en") & (full_confidences >= threshold)
+    sampled_keep = (sampled_labels == "en") & (sampled_confidences >= threshold)
+    print(f"Records: {len(texts)}, total chars: {sum(len(t) for t in texts):,}")
+    print(f"Full text: {full_time:.2f}s ({len(texts) / full_time:.0f} records/s)")
+    print(f"Sampled:   {sampled_time:.2f}s ({len(texts) / sampled_time:.0f} records/s), speedup {full_time / sampled_time:.2f}x")
+    print(f"Label agreement: {np.mean(full_labels == sampled_labels):.4%}")
+    print(f"Keep decision agreement (en, >= {threshold}): {np.mean(full_keep == sampled_keep):.4%}")
+
+
 if __name__ == "__main__":
+    import sys
+    if len(sys.argv) > 1:
+        # python -m cs336_data.language_identification <shard.warc.wet.gz>
+        benchmark_sampled_langid(sys.argv[1])
+        sys.exit(0)
+
     sample_text = "Bonjour tout le monde"
     lang, confidence = detect_language(sample_text)
     print(f"Detected language: {lang} with confidence {confidence}")
@@ -0,0 +1,169 @@
+import json
+import os
+
+import numpy as np
+
+from cs336_data.exact_deduplication import reduce_counts
+
+MANIFEST_NAME = "manifest.json"
+# counts are saturated: dedup only needs "seen once" and "seen twice or more"
+COUNT_CAP = 2
+DEFAULT_MERGE_RATIO = 2.0
+
+
+class LineHashIndex:
+    """On-disk line-hash counts that grow batch by batch, for incremental exact dedup.
+
+    Every added batch becomes a segment: a sorted array of distinct uint64
+    line hashes and their saturated counts, stored as .npy files and read
+    memory-mapped. The count of a hash is the sum over segments. Segments
+    are merged size-tiered (a segment is merged into the one before it
+    while that one is at most `merge_ratio` times larger), so a batch is
+    merged O(log total) times and there are O(log total) segments to look
+    up. The manifest also records which shards were added, so a crawl
+    batch only has to hash and rewrite the shards that are new.
+
+    Single writer: the manifest is replaced atomically after every change,
+    but concurrent add() calls are not supported.
+    """
+
+    def __init__(self, directory: str, merge_ratio: float = DEFAULT_MERGE_RATIO):
+        self.directory = directory
+        self.merge_ratio = merge_ratio
+        os.makedirs(directory, exist_ok=True)
+        manifest_path = os.path.join(directory, MANIFEST_NAME)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        else:
+            manifest = {"next_segment": 0, "segments": [], "shards": []}
+        self.next_segment: int = manifest["next_segment"]
+        self.segments: list[dict] = manifest["segments"]
+        self.shards: list[str] = manifest["shards"]
+        self._cache: dict[str, tuple[np.ndarray, np.ndarray]] = {}
+
+    def _segment_paths(self, name: str) -> tuple[str, str]:
+        return os.path.join(self.directory, name + ".hashes.npy"), os.path.join(self.directory, name + ".counts.npy")
+
+    def _load(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        if name not in self._cache:
+            hashes_path, counts_path = self._segment_paths(name)
+            self._cache[name] = np.load(hashes_path, mmap_mode="r"), np.load(counts_path, mmap_mode="r")
+        return self._cache[name]
+
+    def _write_manifest(self):
+        manifest_path = os.path.join(self.directory, MANIFEST_NAME)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump({"next_segment": self.next_segment, "segments": self.segments, "shards": self.shards}, f)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def _write_segment(self, hashes: np.ndarray, counts: np.ndarray) -> dict:
+        name = f"segment-{self.next_segment:06d}"
+        self.next_segment += 1
+        hashes_path, counts_path = self._segment_paths(name)
+        np.save(hashes_path, hashes)
+        np.save(counts_path, np.minimum(counts, COUNT_CAP).astype(np.uint8))
+        return {"name": name, "size": len(hashes)}
+
+    def _remove_segment(self, name: str):
+        self._cache.pop(name, None)
+        for path in self._segment_paths(name):
+            os.remove(path)
+
+    def new_shards(self, shard_names: list[str]) -> list[str]:
+        """The shards that have not been added yet, in the given order."""
+        added = set(self.shards)
+        return [name for name in shard_names if name not in added]
+
+    def add(self, shard_names: list[str], hashes: np.ndarray, counts: np.ndarray):
+        """Add the line hashes and counts of a batch of shards as a new segment, then merge."""
+        hashes, counts = reduce_counts(np.asarray(hashes, dtype=np.uint64), np.asarray(counts, dtype=np.uint32))
+        self.segments.append(self._write_segment(hashes, counts))
+        self.shards.extend(shard_names)
+        while len(self.segments) >= 2 and self.segments[-2]["size"] <= self.merge_ratio * self.segments[-1]["size"]:
+            self._merge_last(2)
+        self._write_manifest()
+
+    def _merge_last(self, num_segments: int):
+        merged = self.segments[-num_segments:]
+        parts = [self._load(segment["name"]) for segment in merged]
+        hashes, counts = reduce_counts(
+            np.concatenate([np.asarray(h) for h, _ in parts]),
+            np.concatenate([np.asarray(c, dtype=np.uint32) for _, c in parts]),
+        )
+        self.segments[-num_segments:] = [self._write_segment(hashes, counts)]
+        # the new segment has to be in the manifest before the old files go away
+        self._write_manifest()
+        for segment in merged:
+            self._remove_segment(segment["name"])
+
+    def compact(self):
+        """Merge every segment into one."""
+        if len(self.segments) > 1:
+            self._merge_last(len(self.segments))
+
+    def counts(self, hashes: np.ndarray) -> np.ndarray:
+        """Count of every hash over all added shards, saturated at COUNT_CAP (0 if never added)."""
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        total = np.zeros(len(hashes), dtype=np.uint8)
+        for segment in self.segments:
+            segment_hashes, segment_counts = self._load(segment["name"])
+            if len(segment_hashes) == 0:
+                continue
+            positions = np.minimum(np.searchsorted(segment_hashes, hashes), len(segment_hashes) - 1)
+            found = segment_hashes[positions] == hashes
+            total[found] += segment_counts[positions[found]]
+        return np.minimum(total, COUNT_CAP)
+
+    def __len__(self) -> int:
+        """Number of stored (hash, count) entries, an upper bound on the distinct lines."""
+        return sum(segment["size"] for segment in self.segments)
+
+    def nbytes(self) -> int:
+        return sum(os.path.getsize(path) for segment in self.segments for path in self._segment_paths(segment["name"]))
+
+
+def benchmark_index(num_batches: int = 20, lines_per_batch: int = 1_000_000, seed: int = 42):
+    """Add synthetic batches one by one and time each add and a lookup of the batch against the whole index.
+
+    Half of every batch is new lines, the other half zipf-distributed
+    boilerplate shared with the other batches.
+    """
+    import tempfile
+    import time
+
+    rng = np.random.default_rng(seed)
+    boilerplate = rng.integers(0, np.iinfo(np.uint64).max, lines_per_batch, dtype=np.uint64, endpoint=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = LineHashIndex(tmp_dir)
+        for batch in range(num_batches):
+            ids = np.minimum(rng.zipf(1.2, lines_per_batch // 2), lines_per_batch) - 1
+            fresh = rng.integers(0, np.iinfo(np.uint64).max, lines_per_batch // 2, dtype=np.uint64, endpoint=True)
+            hashes, counts = np.unique(np.concatenate([boilerplate[ids], fresh]), return_counts=True)
+            start_time = time.perf_counter()
+            index.add([f"batch{batch}"], hashes, counts)
+            add_time = time.perf_counter() - start_time
+            start_time = time.perf_counter()
+            duplicated = np.count_nonzero(index.counts(hashes) >= 2)
+            lookup_time = time.perf_counter() - start_time
+            print(f"batch {batch:3d}: add {add_time:.2f}s, lookup {lookup_time:.2f}s, {len(index.segments)} segments, "
+                  f"{len(index):,} entries ({index.nbytes() / 1024 ** 2:.1f} MB), {duplicated / len(hashes):.1%} duplicated")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Inspect, compact or benchmark a line-hash index.")
+    arg_parser.add_argument("index_dir", type=str, nargs="?", default=None, help="Index to inspect")
+    arg_parser.add_argument("--compact", action="store_true", help="Merge all segments into one")
+    arg_parser.add_argument("--num_batches", type=int, default=20)
+    arg_parser.add_argument("--lines_per_batch", type=int, default=1_000_000)
+    args = arg_parser.parse_args()
+    if args.index_dir is None:
+        benchmark_index(args.num_batches, args.lines_per_batch)
+    else:
+        index = LineHashIndex(args.index_dir)
+        if args.compact:
+            index.compact()
+        print(f"{len(index.shards)} shards, {len(index.segments)} segments, {len(index):,} entries, "
+              f"{index.nbytes() / 1024 ** 2:.1f} MB")
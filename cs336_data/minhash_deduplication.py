@@ -1,14 +1,43 @@
+import functools
 import os
-from typing import Self
+import sys
+from collections.abc import Callable, Iterable, Iterator
 import mmh3
+import numpy as np
 import regex as re
 import unicodedata
 from nltk import word_tokenize
 
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+@functools.cache
+def category_deletion_table(prefix: str) -> dict[int, None]:
+    """str.translate table deleting every code point whose Unicode category starts with `prefix`.
+
+    Built once per process from unicodedata (the same database the
+    per-character checks use), over all of Unicode, in about a second.
+    """
+    return {c: None for c in range(sys.maxunicode + 1) if unicodedata.category(chr(c)).startswith(prefix)}
+
+
 def remove_all_punct(s: str) -> str:
-    return "".join(ch for ch in s if not unicodedata.category(ch).startswith("P"))
+    return s.translate(category_deletion_table("P"))
 
 def preprocess(text: str) -> str:
+    """Lowercase, collapse whitespace, remove punctuation and strip accents.
+
+    Every step is one pass in C: translate tables replace the per-character
+    category checks, and ASCII text skips NFD and accent removal, which
+    cannot change it. Output is identical to preprocess_reference.
+    """
+    text = WHITESPACE_RE.sub(" ", text.lower())
+    text = text.translate(category_deletion_table("P"))
+    if text.isascii():
+        return text
+    return unicodedata.normalize("NFD", text).translate(category_deletion_table("Mn"))
+
+def preprocess_reference(text: str) -> str:
     # lowercase
     text = text.lower()
     
@@ -16,7 +45,7 @@ def preprocess(text: str) -> str:
     text = re.sub(r"\s+", " ", text)
 
     # Remove all punctuation
-    text = remove_all_punct(text)
+    text = "".join(ch for ch in text if not unicodedata.category(ch).startswith("P"))
 
     # Normalize unicode characters
     text = unicodedata.normalize("NFD", text)
@@ -38,85 +67,497 @@ def compute_minhash_signature(text: str, num_hashes: int, ngram_size: int) -> tu
     return signature, ngrams
 
 
-class Document:
-    def __init__(self, path: os.PathLike, ngrams: set[str]):
-        self.path = path
-        self.ngrams = ngrams
-        self.parent: Document = self
-    
-    def is_root(self) -> bool:
-        return self.parent == self
-    
-    def jaccard_similarity(self, other: Self) -> float:
-        intersection = len(self.ngrams.intersection(other.ngrams))
-        union = len(self.ngrams.union(other.ngrams))
-        return intersection / union if union > 0 else 0.0
-    
-    def find_root(self) -> Self:
-        if self.is_root():
-            return self
-        parent = self.parent.find_root()
-        self.parent = parent
-        return parent # type: ignore
-
-
-def deuplicate_documents(docs: list[Document], jaccard_threshold: float):
-    for i in range(len(docs)):
-        for j in range(i + 1, len(docs)):
-            doc1 = docs[i].find_root()
-            doc2 = docs[j].find_root()
-            if doc1 == doc2:
-                continue
-            similarity = doc1.jaccard_similarity(doc2)
-            if similarity >= jaccard_threshold:
-                doc2.parent = doc1
+# Universal hashing (a * x + b) mod 2^64, keeping the high 32 bits: the multiply-add-shift scheme,
+# 2-universal for 32-bit keys with 64-bit a and b. uint64 arithmetic already wraps mod 2^64, so each
+# permutation is one multiply, one add and one shift, with no 128-bit products as a prime modulus needs.
+EMPTY_SIGNATURE_VALUE = np.iinfo(np.uint32).max
 
 
-def minhash_deduplicate(input_files: list[os.PathLike], num_hashes: int, num_bands: int,
-                        ngram_size: int, jaccard_threshold: float, output_dir: os.PathLike):
-
-    band_buckets = [{} for _ in range(num_bands)]
-    rows_per_band = num_hashes // num_bands
-    for path in input_files:
-        with open(path, 'r') as f:
-            text = f.read()
-            text = preprocess(text)
-            signature, ngrams = compute_minhash_signature(text, num_hashes, ngram_size)
-            doc: Document = Document(path, ngrams)
-            for band in range(num_bands):
-                start = band * rows_per_band
-                end = start + rows_per_band
-                band_signature = tuple(signature[start:end])
-                bucket: list[Document] = band_buckets[band].setdefault(band_signature, [])
-                bucket.append(doc)
-
-    # Deduplicate documents within each bucket
-    for band in range(num_bands):
-        buckets = band_buckets[band] 
-        for signature in buckets:
-            docs = buckets[signature]
-            deuplicate_documents(docs, jaccard_threshold)
-    
-    output_docs: dict[os.PathLike, Document] = {}
+def minhash_permutations(num_hashes: int, seed: int = 42) -> tuple[np.ndarray, np.ndarray]:
+    """Coefficients (a, b) of `num_hashes` universal hash functions, shaped (num_hashes, 1)."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, np.iinfo(np.uint64).max, num_hashes, dtype=np.uint64, endpoint=True) | np.uint64(1)
+    b = rng.integers(0, np.iinfo(np.uint64).max, num_hashes, dtype=np.uint64, endpoint=True)
+    return a[:, None], b[:, None]
+
+
+def shingle_array(ngrams: Iterable[str]) -> np.ndarray:
+    """Sorted distinct 64-bit MurmurHash3 values of the shingles: a compact stand-in for the set of strings."""
+    return np.unique(np.fromiter((mmh3.hash64(t, signed=False)[0] for t in ngrams), dtype=np.uint64))
+
+
+def shingle_hashes(ngrams: Iterable[str]) -> np.ndarray:
+    """One 64-bit MurmurHash3 per shingle; its high 32 bits are the key the permutations act on."""
+    hashes = np.fromiter((mmh3.hash64(t, signed=False)[0] for t in ngrams), dtype=np.uint64)
+    return hashes >> np.uint64(32)
+
+
+def permute_hashes(a: np.ndarray, b: np.ndarray, x: np.ndarray) -> np.ndarray:
+    """(a * x + b) mod 2^64 for every coefficient pair (rows) and key (columns).
+
+    The hash value is the high 32 bits; the shift is monotonic, so callers
+    take minima first and shift only those.
+    """
+    y = a * x
+    y += b
+    return y
+
+
+def minhash_signatures(
+    shingle_sets: list[Iterable[str]], num_hashes: int, seed: int = 42, max_elements: int = 1 << 22
+) -> np.ndarray:
+    """MinHash signatures of a batch of shingle sets, shaped (num_docs, num_hashes), dtype uint32.
+
+    Every shingle is hashed once; the `num_hashes` permutations are applied
+    to all shingles of a chunk of documents at once, and each document's
+    minimum is taken with a reduceat over its slice. Chunks are sized so the
+    (num_hashes, shingles) matrix stays under `max_elements`. Documents
+    without shingles get EMPTY_SIGNATURE_VALUE everywhere.
+    """
+    return signatures_from_keys([shingle_hashes(ngrams) for ngrams in shingle_sets], num_hashes, seed, max_elements)
+
+
+def signatures_from_keys(
+    doc_hashes: list[np.ndarray], num_hashes: int, seed: int = 42, max_elements: int = 1 << 22
+) -> np.ndarray:
+    """minhash_signatures from each document's shingle keys (shingle_hashes, or a shingle_array >> 32)."""
+    a, b = minhash_permutations(num_hashes, seed)
+    signatures = np.full((len(doc_hashes), num_hashes), EMPTY_SIGNATURE_VALUE, dtype=np.uint32)
+    max_shingles = max(1, max_elements // num_hashes)
+    start = 0
+    while start < len(doc_hashes):
+        end, total = start, 0
+        while end < len(doc_hashes) and (end == start or total + len(doc_hashes[end]) <= max_shingles):
+            total += len(doc_hashes[end])
+            end += 1
+        chunk = [(i, hashes) for i, hashes in enumerate(doc_hashes[start:end], start) if len(hashes)]
+        if chunk:
+            x = np.concatenate([hashes for _, hashes in chunk])
+            permuted = permute_hashes(a, b, x[None, :])
+            offsets = np.cumsum([0] + [len(hashes) for _, hashes in chunk[:-1]])
+            minima = np.minimum.reduceat(permuted, offsets, axis=1) >> np.uint64(32)
+            signatures[[i for i, _ in chunk]] = minima.T.astype(np.uint32)
+        start = end
+    return signatures
+
+
+def text_shingles(text: str, ngram_size: int) -> set[str]:
+    """Word n-grams of `text`, as in compute_minhash_signature."""
+    tokens = word_tokenize(text)
+    return {" ".join(tokens[i:i + ngram_size]) for i in range(len(tokens) - ngram_size + 1)}
+
+
+def compute_minhash_signature_fast(
+    text: str, num_hashes: int, ngram_size: int, seed: int = 42
+) -> tuple[np.ndarray, set[str]]:
+    """compute_minhash_signature with one hash per shingle and vectorized permutations."""
+    ngrams = text_shingles(text, ngram_size)
+    return minhash_signatures([ngrams], num_hashes, seed)[0], ngrams
+
+
+def benchmark_preprocess(wet_path: str | None = None, max_records: int = 2000, num_docs: int = 200,
+                         doc_chars: int = 50000, seed: int = 42):
+    """Time preprocess against preprocess_reference on long documents and check that outputs are identical.
+
+    Uses the records of a WET shard when given, else the wiki reference
+    fixture and synthetic documents mixing English with accented,
+    Cyrillic, CJK and punctuation-heavy text.
+    """
+    import random
+    import time
+
+    fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "fixtures")
+    if wet_path is not None:
+        from fastwarc.warc import ArchiveIterator, WarcRecordType
+        from cs336_data.extract_text import decode_bytes
+
+        docs = []
+        with open(wet_path, "rb") as f:
+            for i, record in enumerate(ArchiveIterator(f, record_types=WarcRecordType.conversion)):
+                if i >= max_records:
+                    break
+                docs.append(decode_bytes(record.reader.read()))
+    else:
+        with open(os.path.join(fixtures, "high_quality_wiki_reference.txt"), encoding="utf-8") as f:
+            docs = [f.read()]
+        rng = random.Random(seed)
+        words = docs[0].split()[:5000] + [
+            "café", "naïve", "Ærøskøbing", "São", "Paulo", "Привет", "мир", "東京", "の", "天気",
+            "«quoted»", "—", "…", "¿qué?", "¡sí!", "“smart”", "‘quotes’", "Straße", "İstanbul",
+        ]
+        separators = [" ", " ", " ", "  ", "\n", "\t", "\u00a0", "\u3000"]
+        for _ in range(num_docs):
+            parts, length = [], 0
+            while length < doc_chars:
+                parts.append(rng.choice(words) + rng.choice(separators))
+                length += len(parts[-1])
+            docs.append("".join(parts))
+    total_chars = sum(map(len, docs))
+    ascii_docs = sum(doc.isascii() for doc in docs)
+
+    start_time = time.perf_counter()
+    category_deletion_table("P")
+    category_deletion_table("Mn")
+    table_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    reference = [preprocess_reference(doc) for doc in docs]
+    reference_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    fast = [preprocess(doc) for doc in docs]
+    fast_time = time.perf_counter() - start_time
+
+    mchars = total_chars / 1e6
+    print(f"{len(docs)} docs ({ascii_docs} ASCII), {total_chars:,} characters")
+    print(f"  reference: {reference_time:.2f}s ({mchars / reference_time:.1f} M chars/s)")
+    print(f"  fast:      {fast_time:.2f}s ({mchars / fast_time:.1f} M chars/s), {reference_time / fast_time:.1f}x faster, "
+          f"one-off tables {table_time:.2f}s")
+    print(f"  identical output: {fast == reference}")
+
+
+def benchmark_minhash(num_docs: int = 200, tokens_per_doc: int = 1000, num_hashes: int = 100,
+                      ngram_size: int = 5, vocab_size: int = 5000, seed: int = 42):
+    """Time per-seed mmh3 minhash against the vectorized signatures on synthetic documents.
+
+    Half of the documents are edited copies of the other half, so the
+    Jaccard estimates of both engines can be compared with the exact value.
+    """
+    import time
+
+    rng = np.random.default_rng(seed)
+    shingle_sets = _synthetic_shingle_sets(num_docs, tokens_per_doc, ngram_size, vocab_size, rng)
+
+    start_time = time.perf_counter()
+    reference = np.array([[minhash(ngrams, s) for s in range(num_hashes)] for ngrams in shingle_sets])
+    reference_time = time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    vectorized = minhash_signatures(shingle_sets, num_hashes, seed)
+    vectorized_time = time.perf_counter() - start_time
+
+    half = num_docs // 2
+    exact = np.array([len(shingle_sets[i] & shingle_sets[i + half]) / len(shingle_sets[i] | shingle_sets[i + half])
+                      for i in range(half)])
+    reference_error = np.abs(np.mean(reference[:half] == reference[half:], axis=1) - exact).mean()
+    vectorized_error = np.abs(np.mean(vectorized[:half] == vectorized[half:], axis=1) - exact).mean()
+    total_shingles = sum(len(ngrams) for ngrams in shingle_sets)
+    print(f"{num_docs} docs, {total_shingles:,} shingles, {num_hashes} hashes, mean pair Jaccard {exact.mean():.3f}")
+    print(f"  mmh3 per seed: {reference_time:.2f}s ({num_docs / reference_time:,.0f} docs/s), "
+          f"mean |Jaccard error| {reference_error:.4f}")
+    print(f"  vectorized:    {vectorized_time:.2f}s ({num_docs / vectorized_time:,.0f} docs/s), "
+          f"mean |Jaccard error| {vectorized_error:.4f}, {reference_time / vectorized_time:.1f}x faster")
+
+
+class UnionFind:
+    """Disjoint sets over 0..n-1 in NumPy arrays, with path compression and union by rank."""
+
+    def __init__(self, n: int):
+        self.parent = np.arange(n, dtype=np.int64)
+        self.rank = np.zeros(n, dtype=np.uint8)
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return int(root)
+
+    def union(self, i: int, j: int) -> bool:
+        """Merge the sets of i and j. Returns False if they were already one set."""
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i == root_j:
+            return False
+        if self.rank[root_i] < self.rank[root_j]:
+            root_i, root_j = root_j, root_i
+        self.parent[root_j] = root_i
+        if self.rank[root_i] == self.rank[root_j]:
+            self.rank[root_i] += 1
+        return True
+
+    def roots(self) -> np.ndarray:
+        """Root of every element."""
+        parent = self.parent
+        # pointer jumping until every element points at its root
+        while True:
+            grandparent = parent[parent]
+            if (grandparent == parent).all():
+                return parent
+            parent = grandparent
+
+
+def band_buckets(signatures: np.ndarray, num_bands: int) -> Iterator[np.ndarray]:
+    """Member indices of every LSH bucket with two or more documents, band by band."""
+    rows_per_band = signatures.shape[1] // num_bands
     for band in range(num_bands):
-        buckets = band_buckets[band] 
-        for signature in buckets:
-            docs: list[Document] = buckets[signature]
-            for doc in docs:
-                root: Document = doc.find_root()
-                if root.path in output_docs:
-                    continue
-                output_docs[root.path] = root
-    
+        rows = np.ascontiguousarray(signatures[:, band * rows_per_band:(band + 1) * rows_per_band])
+        keys = rows.view(np.dtype((np.void, rows.dtype.itemsize * rows_per_band))).ravel()
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        order = np.argsort(inverse, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        for start, count in zip(starts[counts >= 2].tolist(), counts[counts >= 2].tolist()):
+            yield order[start:start + count]
+
+
+def bucket_pairs(members: np.ndarray, max_bucket_size: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Pairs to verify in one bucket: all of them, or a star on the first member above `max_bucket_size`."""
+    if max_bucket_size is None or len(members) <= max_bucket_size:
+        i, j = np.triu_indices(len(members), k=1)
+        return members[i], members[j]
+    return np.full(len(members) - 1, members[0]), members[1:]
+
+
+def band_hashes(signatures: np.ndarray, num_bands: int) -> np.ndarray:
+    """64-bit hash of every band of every signature, shaped (num_docs, num_bands).
+
+    FNV-1a over the band's 32-bit values followed by a multiply-xorshift
+    finalizer, vectorized over documents, so buckets can be spooled and
+    sorted as fixed-size keys instead of kept in dicts of tuples.
+    """
+    rows_per_band = signatures.shape[1] // num_bands
+    bands = signatures[:, :rows_per_band * num_bands].reshape(len(signatures), num_bands, rows_per_band)
+    h = np.full((len(signatures), num_bands), 0xCBF29CE484222325, dtype=np.uint64)
+    for row in range(rows_per_band):
+        h ^= bands[:, :, row].astype(np.uint64)
+        h *= np.uint64(0x100000001B3)
+    h ^= h >> np.uint64(33)
+    h *= np.uint64(0xFF51AFD7ED558CCD)
+    h ^= h >> np.uint64(33)
+    return h
+
+
+def lsh_candidate_pairs(signatures: np.ndarray, num_bands: int, max_bucket_size: int | None = None) -> np.ndarray:
+    """Unique (i, j), i < j, pairs of documents that share a bucket in any band, shaped (num_pairs, 2).
+
+    With `max_bucket_size` set, larger buckets (typically boilerplate or
+    templated pages) pair every member with the bucket's first document
+    only, so they cost linear instead of quadratic time. That loses
+    recall: two near-duplicates that only meet in such buckets are never
+    compared when the first document is not similar to them.
+    """
+    n = len(signatures)
+    codes: list[np.ndarray] = []
+    for members in band_buckets(signatures, num_bands):
+        first, second = bucket_pairs(members, max_bucket_size)
+        codes.append(np.minimum(first, second) * n + np.maximum(first, second))
+    if not codes:
+        return np.empty((0, 2), dtype=np.int64)
+    codes_all = np.unique(np.concatenate(codes))
+    return np.stack([codes_all // n, codes_all % n], axis=1)
+
+
+def lsh_clusters(
+    signatures: np.ndarray,
+    num_bands: int,
+    similarity: Callable[[int, int], float],
+    threshold: float,
+    max_bucket_size: int | None = None,
+) -> tuple[np.ndarray, dict[str, int]]:
+    """Cluster documents whose verified similarity reaches `threshold` (single linkage).
+
+    Every candidate pair is verified at most once, and not at all when its
+    documents were already joined through other pairs. Returns the cluster
+    root of every document and counts of candidate and verified pairs.
+    """
+    union_find = UnionFind(len(signatures))
+    stats = {"candidate_pairs": 0, "verified_pairs": 0, "merged_pairs": 0}
+    for i, j in lsh_candidate_pairs(signatures, num_bands, max_bucket_size).tolist():
+        stats["candidate_pairs"] += 1
+        if union_find.find(i) == union_find.find(j):
+            continue
+        stats["verified_pairs"] += 1
+        if similarity(i, j) >= threshold:
+            union_find.union(i, j)
+            stats["merged_pairs"] += 1
+    return union_find.roots(), stats
+
+
+def cluster_representatives(roots: np.ndarray) -> np.ndarray:
+    """Smallest document index of every cluster, in increasing order."""
+    _, first = np.unique(roots, return_index=True)
+    return np.sort(first)
+
+
+def jaccard_similarity(a: set[str], b: set[str]) -> float:
+    union = len(a | b)
+    return len(a & b) / union if union > 0 else 0.0
+
+
+def jaccard_sorted(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard similarity of two sorted arrays of distinct values, by binary search of the shorter one."""
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) == 0:
+        return 0.0
+    positions = np.minimum(np.searchsorted(b, a), len(b) - 1)
+    intersection = int(np.count_nonzero(b[positions] == a))
+    return intersection / (len(a) + len(b) - intersection)
+
+
+def estimated_jaccard(signature_a: np.ndarray, signature_b: np.ndarray) -> float:
+    """Jaccard similarity estimated as the fraction of equal MinHash values.
+
+    A document without shingles has nothing in common with any other (0.0,
+    as jaccard_similarity), even though all such signatures are equal.
+    """
+    if (signature_a == EMPTY_SIGNATURE_VALUE).all() or (signature_b == EMPTY_SIGNATURE_VALUE).all():
+        return 0.0
+    return float(np.mean(signature_a == signature_b))
+
+
+SHINGLE_STORAGE = ("sets", "hashes", "none")
+
+
+def shingle_storage_similarity(
+    shingle_sets: Iterable[set[str]], num_hashes: int, shingle_storage: str = "hashes"
+) -> tuple[np.ndarray, Callable[[int, int], float], object]:
+    """Signatures and a pairwise similarity for documents kept in the given shingle storage.
+
+    "sets" keeps every shingle string and compares exact sets; "hashes"
+    keeps sorted uint64 shingle hashes (8 bytes per shingle) and compares
+    them exactly up to hash collisions; "none" keeps nothing but the
+    signatures and estimates Jaccard from them. `shingle_sets` is consumed
+    lazily, so only the chosen storage outlives this call. Returns
+    (signatures, similarity, storage).
+    """
+    if shingle_storage == "sets":
+        sets = list(shingle_sets)
+        return minhash_signatures(sets, num_hashes), lambda i, j: jaccard_similarity(sets[i], sets[j]), sets
+    if shingle_storage not in SHINGLE_STORAGE:
+        raise ValueError(f"shingle_storage must be one of {SHINGLE_STORAGE}, got {shingle_storage}")
+    arrays = [shingle_array(ngrams) for ngrams in shingle_sets]
+    signatures = signatures_from_keys([array >> np.uint64(32) for array in arrays], num_hashes)
+    if shingle_storage == "hashes":
+        return signatures, lambda i, j: jaccard_sorted(arrays[i], arrays[j]), arrays
+    return signatures, lambda i, j: estimated_jaccard(signatures[i], signatures[j]), None
+
+
+def minhash_deduplicate(input_files: list[os.PathLike], num_hashes: int, num_bands: int,
+                        ngram_size: int, jaccard_threshold: float, output_dir: os.PathLike,
+                        shingle_storage: str = "hashes"):
+    """Write one document of every cluster of near-duplicates (the first of `input_files`) to `output_dir`."""
+
+    def iter_shingle_sets():
+        for path in input_files:
+            with open(path) as f:
+                yield text_shingles(preprocess(f.read()), ngram_size)
+
+    signatures, similarity, _ = shingle_storage_similarity(iter_shingle_sets(), num_hashes, shingle_storage)
+    roots, _ = lsh_clusters(signatures, num_bands, similarity, jaccard_threshold)
+
     os.makedirs(output_dir, exist_ok=True)
-    for root_path in output_docs:
-        output_path = os.path.join(output_dir, os.path.basename(root_path))
-        with open(root_path, 'r') as src_file, open(output_path, 'w') as dst_file:
+    for index in cluster_representatives(roots).tolist():
+        output_path = os.path.join(output_dir, os.path.basename(input_files[index]))
+        with open(input_files[index]) as src_file, open(output_path, 'w') as dst_file:
             dst_file.write(src_file.read())
-            
+
+
+def _synthetic_shingle_sets(num_docs: int, tokens_per_doc: int, ngram_size: int, vocab_size: int,
+                            rng: np.random.Generator) -> list[set[str]]:
+    # the second half are copies of the first half with 5% of the tokens replaced
+    docs = [rng.integers(0, vocab_size, tokens_per_doc) for _ in range(num_docs // 2)]
+    for doc in docs[:]:
+        copy = doc.copy()
+        edits = rng.random(len(copy)) < 0.05
+        copy[edits] = rng.integers(0, vocab_size, np.count_nonzero(edits))
+        docs.append(copy)
+    shingle_sets = []
+    for doc in docs:
+        tokens = [str(token) for token in doc]
+        shingle_sets.append({" ".join(tokens[i:i + ngram_size]) for i in range(len(tokens) - ngram_size + 1)})
+    return shingle_sets
+
+
+def benchmark_shingle_storage(num_docs: int = 2000, tokens_per_doc: int = 1000, num_hashes: int = 100,
+                              num_bands: int = 20, ngram_size: int = 5, vocab_size: int = 5000,
+                              threshold: float = 0.5, seed: int = 42):
+    """Memory, build time and verification time of each shingle storage, and agreement with the sets."""
+    import gc
+    import time
+    import tracemalloc
+
+    rng = np.random.default_rng(seed)
+    token_docs = _synthetic_shingle_sets(num_docs, tokens_per_doc, ngram_size, vocab_size, rng)
+    # rebuild the string sets from fresh strings for every storage, so "sets" pays for its strings too
+    shingle_lists = [sorted(ngrams) for ngrams in token_docs]
+    del token_docs
+    reference = None
+    print(f"{num_docs} docs, {sum(len(shingles) for shingles in shingle_lists):,} shingles, {num_hashes} hashes")
+    for storage in SHINGLE_STORAGE:
+        gc.collect()
+        tracemalloc.start()
+        start_time = time.perf_counter()
+        fresh_sets = ({"".join(list(shingle)) for shingle in shingles} for shingles in shingle_lists)
+        signatures, similarity, kept = shingle_storage_similarity(fresh_sets, num_hashes, storage)
+        build_time = time.perf_counter() - start_time
+        gc.collect()
+        kept_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        pairs = lsh_candidate_pairs(signatures, num_bands)
+        start_time = time.perf_counter()
+        verdicts = np.array([similarity(i, j) >= threshold for i, j in pairs.tolist()], dtype=bool)
+        verify_time = time.perf_counter() - start_time
+        if reference is None:
+            reference = verdicts
+        agreement = np.mean(verdicts == reference) if len(verdicts) else 1.0
+        print(f"  {storage:>6}: {kept_bytes / 1024 ** 2:8.1f} MB kept, build {build_time:.2f}s, "
+              f"verify {len(pairs):,} pairs in {verify_time:.3f}s, verdicts agree with sets {agreement:.2%}")
+        del signatures, similarity, kept
+
+
+def benchmark_lsh(num_docs: int = 20000, num_templates: int = 20, num_hashes: int = 100, num_bands: int = 20,
+                  shingles_per_doc: int = 200, max_bucket_size: int | None = 64, seed: int = 42):
+    """Cluster a boilerplate-heavy synthetic corpus and compare the work with per-bucket all-pairs scans.
+
+    Most documents are a few-shingle variation of one of `num_templates`
+    templates, so every band has a handful of huge buckets, which is where
+    the opt-in `max_bucket_size` cap pays off.
+    """
+    import time
+
+    rng = np.random.default_rng(seed)
+    templates = [rng.integers(0, 1 << 30, shingles_per_doc) for _ in range(num_templates)]
+    shingle_sets = []
+    for _ in range(num_docs):
+        if rng.random() < 0.8:
+            shingles = templates[rng.integers(num_templates)].copy()
+            edits = rng.random(shingles_per_doc) < 0.02
+            shingles[edits] = rng.integers(0, 1 << 30, np.count_nonzero(edits))
+        else:
+            shingles = rng.integers(0, 1 << 30, shingles_per_doc)
+        shingle_sets.append({str(shingle) for shingle in shingles.tolist()})
+    signatures = minhash_signatures(shingle_sets, num_hashes, seed)
+
+    all_pairs = sum(len(members) * (len(members) - 1) // 2 for members in band_buckets(signatures, num_bands))
+    start_time = time.perf_counter()
+    roots, stats = lsh_clusters(
+        signatures, num_bands, lambda i, j: jaccard_similarity(shingle_sets[i], shingle_sets[j]), 0.8, max_bucket_size
+    )
+    elapsed = time.perf_counter() - start_time
+    print(f"{num_docs:,} docs, {num_bands} bands, max bucket size {max_bucket_size}: "
+          f"per-bucket scans would check {all_pairs:,} pairs")
+    print(f"  candidate pairs {stats['candidate_pairs']:,}, verified {stats['verified_pairs']:,}, "
+          f"merged {stats['merged_pairs']:,} in {elapsed:.2f}s -> {len(cluster_representatives(roots)):,} clusters")
 
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark":
+        # python -m cs336_data.minhash_deduplication benchmark [num_docs] [num_hashes]
+        benchmark_args = [int(arg) for arg in sys.argv[2:4]]
+        benchmark_minhash(*benchmark_args[:1], **({"num_hashes": benchmark_args[1]} if len(benchmark_args) > 1 else {}))
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark_preprocess":
+        # python -m cs336_data.minhash_deduplication benchmark_preprocess [shard.warc.wet.gz]
+        benchmark_preprocess(*sys.argv[2:3])
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark_storage":
+        # python -m cs336_data.minhash_deduplication benchmark_storage [num_docs]
+        benchmark_shingle_storage(*(int(arg) for arg in sys.argv[2:3]))
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == "benchmark_lsh":
+        # python -m cs336_data.minhash_deduplication benchmark_lsh [num_docs]
+        benchmark_lsh(*(int(arg) for arg in sys.argv[2:3]))
+        sys.exit(0)
+
     content = """This is a sample text! It includes punctuation, accents like café, and    irregular   spacing.
     Let's see how preprocessing works."""
     preprocessed = preprocess(content)
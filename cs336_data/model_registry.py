@@ -0,0 +1,151 @@
+import concurrent.futures
+import multiprocessing
+import os
+import time
+
+import fasttext
+
+MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "model")
+
+MODEL_FILES = {
+    "lid": "lid.176.bin",
+    "nsfw": "jigsaw_fasttext_bigrams_nsfw_final.bin",
+    "toxicity": "jigsaw_fasttext_bigrams_hatespeech_final.bin",
+    "wiki": "wiki_model.bin",
+    "qc": "qc_model.bin",
+}
+
+# "bin" is the full model, "ftz" its quantized variant next to it (see quantize_models.py),
+# and "auto" picks the quantized variant when it exists.
+MODEL_VARIANTS = ("bin", "ftz", "auto")
+
+global_models: dict = {}
+default_variant: str = os.environ.get("CS336_MODEL_VARIANT", "bin")
+
+
+def model_path(model_name: str, variant: str = "bin") -> str:
+    if model_name not in MODEL_FILES:
+        raise ValueError(f"Unknown model name: {model_name}")
+    filename = MODEL_FILES[model_name]
+    if variant == "ftz":
+        filename = os.path.splitext(filename)[0] + ".ftz"
+    elif variant != "bin":
+        raise ValueError(f"Unknown model variant: {variant}")
+    return os.path.join(MODEL_DIR, filename)
+
+
+def resolve_variant(model_name: str, variant: str | None = None) -> str:
+    variant = variant or default_variant
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model variant: {variant}")
+    if variant == "auto":
+        return "ftz" if os.path.exists(model_path(model_name, "ftz")) else "bin"
+    return variant
+
+
+def set_default_variant(variant: str):
+    """Choose the variant get_model loads when none is given. Forked workers inherit the choice."""
+    global default_variant
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"Unknown model variant: {variant}")
+    default_variant = variant
+
+
+def get_model(model_name: str, variant: str | None = None):
+    """Return the fastText model for `model_name`, loading it on first use in this process."""
+    key = (model_name, resolve_variant(model_name, variant))
+    if key not in global_models:
+        global_models[key] = fasttext.load_model(model_path(*key))
+    return global_models[key]
+
+
+def preload_models(model_names: list[str], variant: str | None = None):
+    if variant is not None:
+        set_default_variant(variant)
+    for model_name in model_names:
+        get_model(model_name)
+
+
+def make_executor(
+    max_workers: int, model_names: list[str], variant: str | None = None
+) -> concurrent.futures.ProcessPoolExecutor:
+    """Create a process pool whose workers share the given models.
+
+    The models are loaded once in the parent before the pool forks, so every
+    worker sees the same pages copy-on-write instead of loading its own copy.
+    The initializer is a no-op for inherited models and only loads them when
+    the platform cannot fork.
+    """
+    preload_models(model_names, variant)
+    if "fork" in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context("fork")
+    else:
+        mp_context = multiprocessing.get_context()
+    return concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=mp_context,
+        initializer=preload_models,
+        initargs=(model_names, variant),
+    )
+
+
+def memory_usage() -> dict[str, int]:
+    """Resident, proportional and shared memory of this process in bytes (Linux only)."""
+    usage = {"pid": os.getpid(), "rss": 0, "pss": 0, "shared": 0}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                key, value = line.split(":", 1)
+                size = int(value.split()[0]) * 1024
+                if key == "Rss":
+                    usage["rss"] = size
+                elif key == "Pss":
+                    usage["pss"] = size
+                elif key in ("Shared_Clean", "Shared_Dirty"):
+                    usage["shared"] += size
+    except (OSError, ValueError):
+        pass
+    return usage
+
+
+def _worker_memory_usage(delay: float) -> dict[str, int]:
+    # Sleep so that the probes spread over all workers instead of one idle worker taking them all
+    time.sleep(delay)
+    return memory_usage()
+
+
+def report_worker_memory(executor: concurrent.futures.ProcessPoolExecutor, num_workers: int, delay: float = 0.2):
+    futures = [executor.submit(_worker_memory_usage, delay) for _ in range(num_workers * 2)]
+    usages = {usage["pid"]: usage for usage in (future.result() for future in futures)}
+    mb = 1024 ** 2
+    print(f"Worker memory ({len(usages)} workers):")
+    for usage in sorted(usages.values(), key=lambda u: u["pid"]):
+        print(f"  pid {usage['pid']}: rss {usage['rss'] / mb:.1f} MB, pss {usage['pss'] / mb:.1f} MB, "
+              f"shared {usage['shared'] / mb:.1f} MB")
+    total_rss = sum(u["rss"] for u in usages.values())
+    total_pss = sum(u["pss"] for u in usages.values())
+    print(f"  total rss {total_rss / mb:.1f} MB, total pss {total_pss / mb:.1f} MB")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Compare worker memory with and without copy-on-write model sharing.")
+    arg_parser.add_argument("models", type=str, nargs="+", choices=list(MODEL_FILES), help="Models to load")
+    arg_parser.add_argument("-m", "--max_workers", type=int, default=8, help="Number of worker processes")
+    arg_parser.add_argument("--variant", type=str, default="bin", choices=MODEL_VARIANTS, help="Model variant to load")
+    args = arg_parser.parse_args()
+
+    print("Shared (loaded in parent before fork):")
+    with make_executor(args.max_workers, args.models, args.variant) as executor:
+        report_worker_memory(executor, args.max_workers)
+
+    print("Per-worker (loaded after spawn):")
+    spawn_executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=args.max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=preload_models,
+        initargs=(args.models, args.variant),
+    )
+    with spawn_executor:
+        report_worker_memory(spawn_executor, args.max_workers)
@@ -1,60 +1,133 @@
-import fasttext
-from cs336_data.gen_fasttext import preprocess_text
+import numpy as np
 
-global_model = None
+from cs336_data.gen_fasttext import preprocess_text
+from cs336_data.model_registry import get_model
 
 def predict_wiki_like(text: str) -> tuple[str, float]:
     text = preprocess_text(text)
-    global global_model
-    if global_model is None:
-        global_model = fasttext.load_model("model/wiki_model.bin")
-    model = global_model
+    model = get_model("wiki")
     output = model.predict(text)
     label = output[0][0].replace("__label__", "")
     confidence = output[1][0]
     return "wiki" if label == "positive" else "cc", confidence
 
-def roc_auc_score(all_labels, all_preds):
-    # Calculate the ROC AUC score
-    pos_count = sum(all_labels)
-    neg_count = len(all_labels) - pos_count
+def roc_auc_score(all_labels, all_preds) -> float:
+    """Rank-based (Mann-Whitney) ROC AUC in O(n log n). Tied scores count as half-correct pairs."""
+    labels = np.asarray(all_labels, dtype=bool)
+    preds = np.asarray(all_preds, dtype=np.float64)
+    pos_count = int(labels.sum())
+    neg_count = len(labels) - pos_count
     if pos_count == 0 or neg_count == 0:
         return 0.0
-    
-    # Sort by predictions in descending order, along with their labels
-    sorted_pairs = sorted(zip(all_preds, all_labels), reverse=True)
-    
-    # Count how many negative examples are ranked lower than each positive example
-    num_correct_pairs = 0
-    
-    for i, (pred_i, label_i) in enumerate(sorted_pairs):
-        if label_i == 1:  # For each positive example
-            # Count how many negatives come after it (have lower rank/score)
-            for j in range(i + 1, len(sorted_pairs)):
-                _, label_j = sorted_pairs[j]
-                if label_j == 0:  # Negative example ranked lower
-                    num_correct_pairs += 1
-    
-    auc = num_correct_pairs / (pos_count * neg_count)
-    return auc
 
-if __name__ == "__main__":
-    import sys
+    # average 1-based rank of every distinct score, so ties share their rank
+    unique_preds, inverse, counts = np.unique(preds, return_inverse=True, return_counts=True)
+    rank_ends = np.cumsum(counts)
+    average_ranks = rank_ends - (counts - 1) / 2.0
+    pos_rank_sum = average_ranks[inverse[labels]].sum()
+    auc = (pos_rank_sum - pos_count * (pos_count + 1) / 2.0) / (pos_count * neg_count)
+    return float(auc)
+
+
+SWEEP_DTYPE = np.dtype([
+    ("threshold", np.float32),
+    ("precision", np.float32),
+    ("recall", np.float32),
+    ("keep_rate", np.float32),
+    ("kept", np.int64),
+    ("true_positives", np.int64),
+])
+
+
+def threshold_sweep(labels, scores, thresholds=None) -> np.ndarray:
+    """Precision, recall and keep-rate when keeping every document with score >= threshold."""
+    labels = np.asarray(labels, dtype=bool)
+    scores = np.asarray(scores, dtype=np.float64)
+    if thresholds is None:
+        thresholds = np.linspace(0.0, 1.0, 101)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+
+    sorted_scores = np.sort(scores)
+    sorted_pos_scores = np.sort(scores[labels])
+    kept = len(scores) - np.searchsorted(sorted_scores, thresholds, side="left")
+    true_positives = len(sorted_pos_scores) - np.searchsorted(sorted_pos_scores, thresholds, side="left")
+
+    sweep = np.zeros(len(thresholds), dtype=SWEEP_DTYPE)
+    sweep["threshold"] = thresholds
+    sweep["kept"] = kept
+    sweep["true_positives"] = true_positives
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sweep["precision"] = np.where(kept > 0, true_positives / kept, np.nan)
+        sweep["recall"] = true_positives / max(len(sorted_pos_scores), 1)
+        sweep["keep_rate"] = kept / max(len(scores), 1)
+    return sweep
+
+
+def positive_scores_batch(texts: list[str], model_name: str = "qc") -> np.ndarray:
+    """Probability of __label__positive for each text, the score filter_01 --by_model thresholds."""
+    model = get_model(model_name)
+    labels, confidences = model.predict([preprocess_text(text) for text in texts])
+    scores = np.empty(len(texts), dtype=np.float32)
+    for i, (doc_labels, doc_confidences) in enumerate(zip(labels, confidences)):
+        scores[i] = doc_confidences[0] if doc_labels[0] == "__label__positive" else 1.0 - doc_confidences[0]
+    return scores
 
-    file_path = sys.argv[1]
-    all_labels = []
-    all_preds = []
+
+def score_labeled_file(file_path: str, model_name: str = "qc", batch_size: int = 4096) -> tuple[np.ndarray, np.ndarray]:
+    """Batch-predict a fastText-format file of "__label__positive|negative text" lines.
+
+    Lines are read and scored `batch_size` at a time, so only the labels and
+    scores of the whole file are kept in memory.
+    """
+    all_labels: list[np.ndarray] = []
+    all_scores: list[np.ndarray] = []
+    labels: list[bool] = []
+    texts: list[str] = []
     with open(file_path, "r", encoding="utf-8") as f:
         for line in f:
             label, text = line.split(" ", 1)
-            if label == "__label__positive":
-                label = 1
-            else:
-                label = 0
-            pred_label, confidence = predict_wiki_like(text)
-            all_labels.append(label)
-            all_preds.append(confidence if pred_label == "wiki" else 1 - confidence)
+            labels.append(label == "__label__positive")
+            texts.append(text)
+            if len(texts) >= batch_size:
+                all_labels.append(np.array(labels, dtype=bool))
+                all_scores.append(positive_scores_batch(texts, model_name))
+                labels, texts = [], []
+    if texts:
+        all_labels.append(np.array(labels, dtype=bool))
+        all_scores.append(positive_scores_batch(texts, model_name))
+    if not all_labels:
+        return np.empty(0, dtype=bool), np.empty(0, dtype=np.float32)
+    return np.concatenate(all_labels), np.concatenate(all_scores)
+
+
+def print_sweep(sweep: np.ndarray, every: int = 5):
+    print(f"{'threshold':>9} {'precision':>9} {'recall':>7} {'keep_rate':>9} {'kept':>9}")
+    for row in sweep[::every]:
+        print(f"{row['threshold']:9.2f} {row['precision']:9.4f} {row['recall']:7.4f} {row['keep_rate']:9.4f} {row['kept']:9d}")
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    arg_parser = argparse.ArgumentParser(description="ROC AUC and threshold sweep of a quality classifier on a labeled file.")
+    arg_parser.add_argument("file_path", type=str, help="fastText-format validation file")
+    arg_parser.add_argument("--model", type=str, default="qc", choices=["wiki", "qc"], help="Classifier to evaluate")
+    arg_parser.add_argument("--batch_size", type=int, default=4096)
+    arg_parser.add_argument("--step", type=float, default=0.01, help="Threshold step of the sweep")
+    arg_parser.add_argument("--output", type=str, default=None, help="Write the full sweep as TSV")
+    args = arg_parser.parse_args()
+
+    start_time = time.time()
+    all_labels, all_preds = score_labeled_file(args.file_path, args.model, args.batch_size)
+    print(f"Scored {len(all_labels)} examples ({int(all_labels.sum())} positive) in {time.time() - start_time:.2f} seconds")
     auc = roc_auc_score(all_labels, all_preds)
     print(f"AUC: {auc:.4f}")
 
-
+    sweep = threshold_sweep(all_labels, all_preds, np.arange(0.0, 1.0 + args.step / 2, args.step))
+    print_sweep(sweep)
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write("\t".join(SWEEP_DTYPE.names) + "\n")
+            for row in sweep:
+                f.write("\t".join(str(row[name]) for name in SWEEP_DTYPE.names) + "\n")
@@ -1,9 +1,61 @@
 from nltk import word_tokenize
+import re as std_re
 import regex as re
 import enum
+import itertools
+from dataclasses import dataclass, field
+import numpy as np
 
 ELLIPSIS_LINE_RE = re.compile(r"(?m)^[^\n\r]*?(?:\s*(?:\.\.\.|…))\s*$")
 LINE_START_RE = re.compile(r"(?m)^")
+ALPHA_RE = re.compile(r"[a-zA-Z]")
+
+# Approximates nltk.word_tokenize: punctuation that the Treebank tokenizer splits off becomes its own
+# token, contractions are split before "n't" / "'s" etc., and ".", ":", "," stay inside words like
+# "3.14", "10:30" or "1,000". Compiled with the stdlib re, which runs this pattern several times
+# faster than the regex module.
+_SEP = r"""\[\](){}<>;@#$%&?!*"`“”‘’„«»–—"""
+TOKEN_RE = std_re.compile(
+    rf"""\.\.\.|--|[{_SEP}]|[:,](?!\d)"""
+    rf"""|[^\s{_SEP}:,.']+?(?=n't(?![^\s{_SEP}:,.]))"""
+    rf"""|n't(?![^\s{_SEP}:,.])|'(?:s|m|d|ll|re|ve)(?![^\s{_SEP}:,.'])"""
+    rf"""|[^\s{_SEP}:,.']+(?:\.[^\s{_SEP}:,.']+|[:,](?=\d)[^\s{_SEP}:,.']+"""
+    rf"""|'(?!(?:s|m|d|ll|re|ve)(?![^\s{_SEP}:,.']))[^\s{_SEP}:,.']+)*"""
+    rf"""|[.:,']""",
+    std_re.IGNORECASE,
+)
+FAST_ALPHA_RE = std_re.compile(r"[a-zA-Z]")
+# one match per line that ends with an ellipsis, same lines as ELLIPSIS_LINE_RE: like its lazy prefix, a
+# line may only contain "\r" in the whitespace around the final ellipsis, and "\x1c"-"\x1f" (whitespace to
+# the stdlib re, not to regex) are not whitespace. The prefix ends in a non-space, so this stays linear.
+ELLIPSIS_END_RE = std_re.compile(r"(?m)^(?:[^\r\n]*[\S\x1c-\x1f])?[^\S\n\x1c-\x1f]*(?:\.\.\.|…)[^\S\n\x1c-\x1f]*$")
+MAX_TOKENS = 100_000
+MIN_ALPHA_RATIO = 0.8
+MIN_MEAN_WORD_LENGTH = 3
+MAX_MEAN_WORD_LENGTH = 10
+MAX_ELLIPSIS_LINE_FRACTION = 0.3
+# no document with more non-whitespace characters can pass both the token limit and the mean word length bound
+MAX_SCANNED_CHARS = MAX_TOKENS * MAX_MEAN_WORD_LENGTH
+
+QUALITY_METRICS_DTYPE = np.dtype([
+    ("token_count", np.int64),
+    ("alpha_ratio", np.float64),
+    ("mean_word_length", np.float64),
+    ("ellipsis_line_fraction", np.float64),
+    ("ellipsis_line_count", np.int64),
+    ("line_count", np.int64),
+    ("char_count", np.int64),
+])
+
+GOPHER_STOP_WORDS = frozenset({"the", "be", "to", "of", "and", "that", "have", "with"})
+BULLET_PREFIXES = ("•", "●", "◦", "‣", "▪", "-", "*")
+PARAGRAPH_SPLIT_RE = std_re.compile(r"\n{2,}")
+# (n, maximum fraction of characters in the most frequent n-gram)
+TOP_NGRAM_THRESHOLDS = ((2, 0.20), (3, 0.18), (4, 0.16))
+# (n, maximum fraction of characters covered by n-grams that occur more than once)
+DUPLICATE_NGRAM_THRESHOLDS = ((5, 0.15), (6, 0.14), (7, 0.13), (8, 0.12), (9, 0.11), (10, 0.10))
+_HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+_ID_MULTIPLIER = np.uint64(0xFF51AFD7ED558CCD)
 
 
 class Reason(enum.Enum):
@@ -12,23 +64,30 @@ class Reason(enum.Enum):
     LOW_ALPHABETIC_CONTENT = "Low Alphabetic Content"
     AVG_WORD_LENGTH_OUT_OF_BOUNDS = "Average Word Length Out of Bounds"
     TOO_MANY_ELLIPSIS_LINES = "Too Many Ellipsis Lines"
+    NO_STOP_WORDS = "Too Few Stop Words"
+    TOO_MANY_BULLET_LINES = "Too Many Bullet Lines"
+    DUPLICATE_LINES = "Too Many Duplicate Lines"
+    DUPLICATE_PARAGRAPHS = "Too Many Duplicate Paragraphs"
+    TOP_NGRAM_REPETITION = "Top N-gram Repetition"
+    DUPLICATE_NGRAMS = "Too Many Duplicate N-grams"
     Ok = "Ok"
 
 
 
-def more_than_30_percent_ellipsis_lines_regex(s: str) -> bool:
+def more_than_30_percent_ellipsis_lines_regex(s: str, timeout: float | None = None) -> bool:
     if not s:
         return False
 
-    total_lines = len(LINE_START_RE.findall(s))
+    total_lines = len(LINE_START_RE.findall(s, timeout=timeout))
     if total_lines == 0:
         return False
 
-    ellipsis_lines = len(ELLIPSIS_LINE_RE.findall(s))
+    # the lazy prefix makes this quadratic in the length of a whitespace-heavy line
+    ellipsis_lines = len(ELLIPSIS_LINE_RE.findall(s, timeout=timeout))
     return ellipsis_lines > 0.3 * total_lines
 
 
-def gopher_quality_filter(text: str, word_limit: int = 50) -> tuple[bool, Reason]:
+def gopher_quality_filter(text: str, word_limit: int = 50, timeout: float | None = None) -> tuple[bool, Reason]:
     tokens = word_tokenize(text)
     total_tokens = len(tokens)
     if total_tokens < word_limit:
@@ -36,11 +95,10 @@ def gopher_quality_filter(text: str, word_limit: int = 50) -> tuple[bool, Reason
     if total_tokens > 100_000:
         return False, Reason.TOO_LONG
     
-    regex = re.compile(r"[a-zA-Z]")
     count = 0
     word_length_sum = 0
     for token in tokens:
-        if regex.search(token):
+        if ALPHA_RE.search(token):
             count += 1
         word_length_sum += len(token)
     if count / total_tokens < 0.8:
@@ -49,16 +107,327 @@ def gopher_quality_filter(text: str, word_limit: int = 50) -> tuple[bool, Reason
     if avg_word_length < 3 or avg_word_length > 10:
         return False, Reason.AVG_WORD_LENGTH_OUT_OF_BOUNDS
     
-    if more_than_30_percent_ellipsis_lines_regex(text):
+    if more_than_30_percent_ellipsis_lines_regex(text, timeout):
         return False, Reason.TOO_MANY_ELLIPSIS_LINES
     
     return True, Reason.Ok
-    
+
+
+def gopher_quality_filter_fast(text: str, word_limit: int = 50) -> tuple[bool, Reason]:
+    """Same rules and Reason values as gopher_quality_filter without nltk.word_tokenize.
+
+    Tokens come from one scan with the compiled TOKEN_RE, and TOO_SHORT/TOO_LONG
+    are decided from cheap length bounds before tokenizing whenever possible.
+
+    The stdlib re scans cannot be interrupted by a CPU budget, so they only ever see
+    at most MAX_SCANNED_CHARS non-whitespace characters: tokens partition those
+    characters, and a longer document fails either the token limit or the mean word
+    length bound. Such documents are reported as TOO_LONG without being scanned.
+    """
+    # every token is at least one character long, and never spans whitespace
+    if len(text) < word_limit:
+        return False, Reason.TOO_SHORT
+    if len(text) > MAX_TOKENS:
+        words = text.split()
+        if len(words) > MAX_TOKENS or sum(map(len, words)) > MAX_SCANNED_CHARS:
+            return False, Reason.TOO_LONG
+
+    tokens = TOKEN_RE.findall(text)
+    total_tokens = len(tokens)
+    if total_tokens < word_limit:
+        return False, Reason.TOO_SHORT
+    if total_tokens > MAX_TOKENS:
+        return False, Reason.TOO_LONG
+
+    alpha_tokens = sum(map(bool, map(FAST_ALPHA_RE.search, tokens)))
+    if alpha_tokens / total_tokens < MIN_ALPHA_RATIO:
+        return False, Reason.LOW_ALPHABETIC_CONTENT
+    avg_word_length = sum(map(len, tokens)) / total_tokens
+    if avg_word_length < MIN_MEAN_WORD_LENGTH or avg_word_length > MAX_MEAN_WORD_LENGTH:
+        return False, Reason.AVG_WORD_LENGTH_OUT_OF_BOUNDS
+
+    total_lines = text.count("\n") + 1
+    if ("..." in text or "…" in text) and len(ELLIPSIS_END_RE.findall(text)) > MAX_ELLIPSIS_LINE_FRACTION * total_lines:
+        return False, Reason.TOO_MANY_ELLIPSIS_LINES
+    return True, Reason.Ok
+
+
+def gopher_quality_metrics(texts: list[str]) -> np.ndarray:
+    """Compute the per-document Gopher metrics of a batch as a QUALITY_METRICS_DTYPE structured array.
+
+    Tokens of all documents go into one flat buffer whose lengths and alphabetic
+    flags are reduced per document with NumPy. Ellipsis lines are found with a
+    single scan over the newline-joined batch.
+    """
+    num_docs = len(texts)
+    metrics = np.zeros(num_docs, dtype=QUALITY_METRICS_DTYPE)
+    if num_docs == 0:
+        return metrics
+
+    char_counts = np.fromiter(map(len, texts), dtype=np.int64, count=num_docs)
+    line_counts = np.fromiter((text.count("\n") + 1 for text in texts), dtype=np.int64, count=num_docs)
+
+    per_doc_tokens = list(map(TOKEN_RE.findall, texts))
+    token_counts = np.fromiter(map(len, per_doc_tokens), dtype=np.int64, count=num_docs)
+    # tokens never contain whitespace, so "\n" safely terminates each token in the UTF-32 buffer
+    buffer = "\n".join(itertools.chain.from_iterable(per_doc_tokens)) + "\n"
+    del per_doc_tokens
+    codes = np.frombuffer(buffer.encode("utf-32-le"), dtype=np.uint32)
+    token_ends = np.flatnonzero(codes == ord("\n"))[: token_counts.sum()]
+    token_starts = np.concatenate(([0], token_ends + 1))[: len(token_ends)]
+    token_lengths = token_ends - token_starts
+    lowered = codes | 0x20
+    alpha_prefix = np.concatenate(([0], np.cumsum((lowered >= ord("a")) & (lowered <= ord("z")))))
+    token_alpha = alpha_prefix[token_ends] > alpha_prefix[token_starts]
+
+    doc_ids = np.repeat(np.arange(num_docs), token_counts)
+    length_sums = np.bincount(doc_ids, weights=token_lengths, minlength=num_docs)
+    alpha_counts = np.bincount(doc_ids, weights=token_alpha, minlength=num_docs)
+
+    # every document is followed by exactly one "\n", so a match belongs to the document it starts in
+    doc_starts = np.concatenate(([0], np.cumsum(char_counts + 1)[:-1]))
+    match_starts = np.fromiter(
+        (m.start() for m in ELLIPSIS_END_RE.finditer("\n".join(texts) + "\n")), dtype=np.int64
+    )
+    ellipsis_counts = np.bincount(np.searchsorted(doc_starts, match_starts, side="right") - 1, minlength=num_docs)
+
+    safe_token_counts = np.maximum(token_counts, 1)
+    metrics["token_count"] = token_counts
+    metrics["alpha_ratio"] = alpha_counts / safe_token_counts
+    metrics["mean_word_length"] = length_sums / safe_token_counts
+    metrics["ellipsis_line_fraction"] = ellipsis_counts / line_counts
+    metrics["ellipsis_line_count"] = ellipsis_counts
+    metrics["line_count"] = line_counts
+    metrics["char_count"] = char_counts
+    return metrics
+
+
+def gopher_thresholds(
+    metrics: np.ndarray,
+    word_limit: int = 50,
+    max_tokens: int = MAX_TOKENS,
+    min_alpha_ratio: float = MIN_ALPHA_RATIO,
+    min_mean_word_length: float = MIN_MEAN_WORD_LENGTH,
+    max_mean_word_length: float = MAX_MEAN_WORD_LENGTH,
+    max_ellipsis_line_fraction: float = MAX_ELLIPSIS_LINE_FRACTION,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Apply the Gopher thresholds to a metrics array. Returns (passed, reasons).
+
+    Rules are checked in the same order as gopher_quality_filter, so each
+    document gets the Reason of the first rule it fails. The ellipsis rule compares
+    line counts exactly like gopher_quality_filter_fast.
+    """
+    token_count = metrics["token_count"]
+    mean_word_length = metrics["mean_word_length"]
+    conditions = [
+        token_count < word_limit,
+        token_count > max_tokens,
+        metrics["alpha_ratio"] < min_alpha_ratio,
+        (mean_word_length < min_mean_word_length) | (mean_word_length > max_mean_word_length),
+        metrics["ellipsis_line_count"] > max_ellipsis_line_fraction * metrics["line_count"],
+    ]
+    choices = [
+        Reason.TOO_SHORT,
+        Reason.TOO_LONG,
+        Reason.LOW_ALPHABETIC_CONTENT,
+        Reason.AVG_WORD_LENGTH_OUT_OF_BOUNDS,
+        Reason.TOO_MANY_ELLIPSIS_LINES,
+    ]
+    reason_index = np.select(conditions, list(range(len(choices))), default=len(choices))
+    reasons = np.array(choices + [Reason.Ok], dtype=object)[reason_index]
+    return reason_index == len(choices), reasons
+
+
+def gopher_quality_filter_batch(texts: list[str], word_limit: int = 50) -> tuple[np.ndarray, np.ndarray]:
+    return gopher_thresholds(gopher_quality_metrics(texts), word_limit)
+
+
+@dataclass
+class RepetitionDocument:
+    """Words, lines and paragraphs of one document, plus n-gram hashes shared by all repetition rules.
+
+    `hashes[n][i]` is a 64-bit rolling hash of words[i:i + n]. Hashes for n are derived
+    from those for n - 1, so every word is hashed once no matter how many rules run.
+    Lines and paragraphs are likewise hashed once, with their lengths kept alongside.
+    """
+    text: str
+    words: list[str]
+    lines: list[str]
+    word_lengths: np.ndarray
+    total_chars: int
+    line_hashes: np.ndarray
+    line_lengths: np.ndarray
+    paragraph_hashes: np.ndarray
+    paragraph_lengths: np.ndarray
+    hashes: dict[int, np.ndarray] = field(default_factory=dict)
+
+    @classmethod
+    def from_text(cls, text: str, max_n: int = 10) -> "RepetitionDocument":
+        words = text.split()
+        lines = [line for line in text.split("\n") if line.strip()]
+        paragraphs = PARAGRAPH_SPLIT_RE.split(text.strip())
+        word_lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        doc = cls(
+            text,
+            words,
+            lines,
+            word_lengths,
+            int(word_lengths.sum()),
+            np.fromiter(map(hash, lines), dtype=np.int64, count=len(lines)),
+            np.fromiter(map(len, lines), dtype=np.int64, count=len(lines)),
+            np.fromiter(map(hash, paragraphs), dtype=np.int64, count=len(paragraphs)),
+            np.fromiter(map(len, paragraphs), dtype=np.int64, count=len(paragraphs)),
+        )
+
+        vocab: dict[str, int] = {}
+        ids = np.fromiter((vocab.setdefault(w, len(vocab)) for w in words), dtype=np.uint64, count=len(words))
+        mixed = (ids + np.uint64(1)) * _ID_MULTIPLIER
+        doc.hashes[1] = mixed
+        for n in range(2, min(max_n, len(words)) + 1):
+            doc.hashes[n] = doc.hashes[n - 1][:-1] * _HASH_MULTIPLIER + mixed[n - 1:]
+        return doc
+
+
+def later_occurrences(hashes: np.ndarray) -> np.ndarray:
+    """Mask of the elements whose hash already occurred earlier in the array."""
+    _, first_index = np.unique(hashes, return_index=True)
+    repeated = np.ones(len(hashes), dtype=bool)
+    repeated[first_index] = False
+    return repeated
+
+
+def duplicate_fractions(hashes: np.ndarray, lengths: np.ndarray) -> tuple[float, float]:
+    """Fraction of elements, and of their characters, that repeat an earlier element."""
+    if len(hashes) == 0:
+        return 0.0, 0.0
+    repeated = later_occurrences(hashes)
+    return float(repeated.mean()), float(lengths[repeated].sum() / max(int(lengths.sum()), 1))
+
+
+def top_ngram_char_fraction(doc: RepetitionDocument, n: int) -> float:
+    """Fraction of word characters taken up by the most frequent n-gram."""
+    hashes = doc.hashes.get(n)
+    if hashes is None or len(hashes) == 0 or doc.total_chars == 0:
+        return 0.0
+    _, first_index, counts = np.unique(hashes, return_index=True, return_counts=True)
+    top = np.argmax(counts)
+    if counts[top] < 2:
+        return 0.0
+    start = first_index[top]
+    return float(counts[top] * doc.word_lengths[start:start + n].sum() / doc.total_chars)
+
+
+def duplicate_ngram_char_fraction(doc: RepetitionDocument, n: int) -> float:
+    """Fraction of word characters covered by repeats of an earlier n-gram.
+
+    As in Gopher, the first occurrence of an n-gram is not a duplicate; words inside
+    several overlapping repeats are counted once.
+    """
+    hashes = doc.hashes.get(n)
+    if hashes is None or len(hashes) == 0 or doc.total_chars == 0:
+        return 0.0
+    starts = np.flatnonzero(later_occurrences(hashes))
+    if len(starts) == 0:
+        return 0.0
+    num_words = len(doc.words)
+    coverage = np.bincount(starts, minlength=num_words + 1) - np.bincount(starts + n, minlength=num_words + 1)
+    covered = np.cumsum(coverage[:num_words]) > 0
+    return float(doc.word_lengths[covered].sum() / doc.total_chars)
+
+
+def check_stop_words(doc: RepetitionDocument) -> bool:
+    return len(GOPHER_STOP_WORDS.intersection(doc.words)) >= 2
+
+
+def check_bullet_lines(doc: RepetitionDocument) -> bool:
+    if not doc.lines:
+        return True
+    bullet_lines = sum(1 for line in doc.lines if line.lstrip().startswith(BULLET_PREFIXES))
+    return bullet_lines <= 0.9 * len(doc.lines)
+
+
+def check_duplicate_lines(doc: RepetitionDocument) -> bool:
+    line_fraction, char_fraction = duplicate_fractions(doc.line_hashes, doc.line_lengths)
+    return line_fraction <= 0.3 and char_fraction <= 0.2
+
+
+def check_duplicate_paragraphs(doc: RepetitionDocument) -> bool:
+    paragraph_fraction, char_fraction = duplicate_fractions(doc.paragraph_hashes, doc.paragraph_lengths)
+    return paragraph_fraction <= 0.3 and char_fraction <= 0.2
+
+
+def check_top_ngrams(doc: RepetitionDocument) -> bool:
+    return all(top_ngram_char_fraction(doc, n) <= threshold for n, threshold in TOP_NGRAM_THRESHOLDS)
+
+
+def check_duplicate_ngrams(doc: RepetitionDocument) -> bool:
+    return all(duplicate_ngram_char_fraction(doc, n) <= threshold for n, threshold in DUPLICATE_NGRAM_THRESHOLDS)
+
+
+# cheapest rules first so that most rejections exit early
+REPETITION_RULES = (
+    (check_stop_words, Reason.NO_STOP_WORDS),
+    (check_bullet_lines, Reason.TOO_MANY_BULLET_LINES),
+    (check_duplicate_lines, Reason.DUPLICATE_LINES),
+    (check_duplicate_paragraphs, Reason.DUPLICATE_PARAGRAPHS),
+    (check_top_ngrams, Reason.TOP_NGRAM_REPETITION),
+    (check_duplicate_ngrams, Reason.DUPLICATE_NGRAMS),
+)
+
+
+def gopher_repetition_filter(text: str) -> tuple[bool, Reason]:
+    doc = RepetitionDocument.from_text(text)
+    for rule, reason in REPETITION_RULES:
+        if not rule(doc):
+            return False, reason
+    return True, Reason.Ok
+
+
+def gopher_full_filter(text: str, word_limit: int = 50) -> tuple[bool, Reason]:
+    """gopher_quality_filter_fast followed by the Gopher repetition and content rules."""
+    passed, reason = gopher_quality_filter_fast(text, word_limit)
+    if not passed:
+        return passed, reason
+    return gopher_repetition_filter(text)
+
+
+def benchmark_gopher_rules(texts: list[str]):
+    import time
+
+    start_time = time.perf_counter()
+    docs = [RepetitionDocument.from_text(text) for text in texts]
+    build_time = time.perf_counter() - start_time
+    print(f"Documents: {len(texts)}, words: {sum(len(d.words) for d in docs):,}")
+    print(f"{'shared n-gram hashing':<28} {build_time * 1e3:9.1f} ms")
+
+    start_time = time.perf_counter()
+    for text in texts:
+        gopher_quality_filter_fast(text)
+    print(f"{'gopher_quality_filter_fast':<28} {(time.perf_counter() - start_time) * 1e3:9.1f} ms")
+
+    for rule, reason in REPETITION_RULES:
+        start_time = time.perf_counter()
+        failed = sum(1 for doc in docs if not rule(doc))
+        elapsed = time.perf_counter() - start_time
+        print(f"{rule.__name__:<28} {elapsed * 1e3:9.1f} ms  rejects {failed} ({failed / max(len(docs), 1):.2%})")
 
 
 if __name__ == "__main__":
+    import sys
     from rich import print
 
+    if len(sys.argv) > 1:
+        # python -m cs336_data.quality_filters <shard.warc.wet.gz>
+        from fastwarc.warc import ArchiveIterator, WarcRecordType
+        from cs336_data.extract_text import decode_bytes
+        with open(sys.argv[1], "rb") as f:
+            wet_texts = [
+                decode_bytes(record.reader.read())
+                for record in ArchiveIterator(f, record_types=WarcRecordType.conversion)
+            ]
+        benchmark_gopher_rules(wet_texts)
+        sys.exit(0)
+
     texts = [
         "This is a normal text with enough content and no issues.",
         "...\n...\n...\nThis text has too many ellipsis lines.\n...\n...\n...",
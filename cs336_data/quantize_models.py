@@ -0,0 +1,142 @@
+import concurrent.futures
+import multiprocessing
+import os
+import time
+
+import fasttext
+import numpy as np
+
+from cs336_data.model_registry import MODEL_FILES, get_model, memory_usage, model_path
+
+# Training data for the classifiers trained in this repo, needed to retrain after pruning
+TRAIN_FILES = {
+    "qc": "data/filter_CC/qc_fasttext_tr.txt",
+    "wiki": "data/wiki_ft_train.txt",
+}
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "fixtures")
+
+
+def quantize_model(
+    model_name: str,
+    cutoff: int = 0,
+    retrain: bool = False,
+    dsub: int = 2,
+    qnorm: bool = True,
+    train_path: str | None = None,
+) -> str:
+    """Write the quantized variant of a model next to it and return its path.
+
+    `cutoff` keeps only that many words and n-gram buckets (pruning), which
+    needs `retrain` and the training data. Without them only the matrices
+    are product-quantized. The official lid.176.ftz can be downloaded instead.
+    """
+    train_path = train_path or TRAIN_FILES.get(model_name)
+    if retrain and (train_path is None or not os.path.exists(train_path)):
+        raise FileNotFoundError(f"Retraining {model_name} needs its training data, got {train_path}")
+    # load a private copy: quantize() works in place and the registry copy may be shared
+    model = fasttext.load_model(model_path(model_name, "bin"))
+    model.quantize(
+        input=train_path if retrain else None,
+        cutoff=cutoff,
+        retrain=retrain,
+        dsub=dsub,
+        qnorm=qnorm,
+        thread=1 if retrain else None,
+    )
+    output_path = model_path(model_name, "ftz")
+    model.save_model(output_path)
+    return output_path
+
+
+def _normalize(model_name: str, text: str) -> str:
+    if model_name in ("wiki", "qc"):
+        from cs336_data.gen_fasttext import preprocess_text
+        return preprocess_text(text)
+    return text.replace("\n", " ").strip()
+
+
+def load_benchmark_texts(wet_path: str | None = None, max_records: int = 5000) -> list[str]:
+    """The test fixtures plus up to `max_records` documents from a WET shard."""
+    texts: list[str] = []
+    for root, _, filenames in os.walk(FIXTURES_DIR):
+        for filename in sorted(filenames):
+            if filename.endswith((".txt", ".html")) or "." not in filename:
+                with open(os.path.join(root, filename), encoding="utf-8", errors="replace") as f:
+                    texts.append(f.read())
+    if wet_path is not None:
+        from fastwarc.warc import ArchiveIterator, WarcRecordType
+        from cs336_data.extract_text import decode_bytes
+
+        with open(wet_path, "rb") as f:
+            for i, record in enumerate(ArchiveIterator(f, record_types=WarcRecordType.conversion)):
+                if i >= max_records:
+                    break
+                texts.append(decode_bytes(record.reader.read()))
+    return texts
+
+
+def _measure_variant(model_name: str, variant: str, texts: list[str]) -> dict:
+    # runs in a fresh process so that load time and RSS belong to this variant only
+    rss_before = memory_usage()["rss"]
+    start_time = time.perf_counter()
+    model = get_model(model_name, variant)
+    load_time = time.perf_counter() - start_time
+    rss_after_load = memory_usage()["rss"]
+
+    normalized = [_normalize(model_name, text) for text in texts]
+    start_time = time.perf_counter()
+    labels, confidences = model.predict(normalized)
+    predict_time = time.perf_counter() - start_time
+    return {
+        "size": os.path.getsize(model_path(model_name, variant)),
+        "load_time": load_time,
+        "rss": rss_after_load - rss_before,
+        "predict_time": predict_time,
+        "labels": [doc_labels[0] for doc_labels in labels],
+        "confidences": np.array([doc_confidences[0] for doc_confidences in confidences], dtype=np.float32),
+    }
+
+
+def benchmark_variants(model_name: str, texts: list[str]) -> dict[str, dict]:
+    """Compare the full and quantized variants of a model: size, load time, RSS, throughput and agreement."""
+    results: dict[str, dict] = {}
+    for variant in ("bin", "ftz"):
+        if not os.path.exists(model_path(model_name, variant)):
+            continue
+        mp_context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=mp_context) as executor:
+            results[variant] = executor.submit(_measure_variant, model_name, variant, texts).result()
+
+    mb = 1024 ** 2
+    print(f"{model_name} ({len(texts)} documents)")
+    for variant, r in results.items():
+        print(f"  {variant}: file {r['size'] / mb:.1f} MB, load {r['load_time']:.2f}s, rss +{r['rss'] / mb:.1f} MB, "
+              f"{len(texts) / r['predict_time']:.0f} docs/s")
+    if "bin" in results and "ftz" in results:
+        full, quantized = results["bin"], results["ftz"]
+        agreement = np.mean([a == b for a, b in zip(full["labels"], quantized["labels"])])
+        confidence_diff = np.abs(full["confidences"] - quantized["confidences"])
+        print(f"  label agreement {agreement:.4%}, mean |confidence diff| {confidence_diff.mean():.4f}")
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Quantize fastText classifiers and benchmark the variants.")
+    arg_parser.add_argument("models", type=str, nargs="+", choices=list(MODEL_FILES), help="Models to process")
+    arg_parser.add_argument("--quantize", action="store_true", help="Write the .ftz variant before benchmarking")
+    arg_parser.add_argument("--cutoff", type=int, default=0, help="Words/buckets to keep when pruning (needs --retrain)")
+    arg_parser.add_argument("--retrain", action="store_true", help="Fine-tune on the training data after pruning")
+    arg_parser.add_argument("--dsub", type=int, default=2, help="Product quantization sub-vector size")
+    arg_parser.add_argument("--wet_path", type=str, default=None, help="Local WET shard to benchmark on")
+    arg_parser.add_argument("--max_records", type=int, default=5000)
+    args = arg_parser.parse_args()
+
+    texts = load_benchmark_texts(args.wet_path, args.max_records)
+    for model_name in args.models:
+        if args.quantize:
+            start_time = time.time()
+            output_path = quantize_model(model_name, cutoff=args.cutoff, retrain=args.retrain, dsub=args.dsub)
+            print(f"Wrote {output_path} in {time.time() - start_time:.1f} seconds")
+        benchmark_variants(model_name, texts)
@@ -0,0 +1,201 @@
+import contextlib
+import os
+import random
+import signal
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable
+
+DEFAULT_REGEX_TIMEOUT = 0.5
+DEFAULT_CPU_BUDGET = 5.0
+QUARANTINE_SUFFIX = ".quarantine.tsv"
+QUARANTINE_HEADER = "record_id\tstage\treason\tcpu_seconds\tlength\n"
+
+
+class RecordBudgetExceeded(Exception):
+    pass
+
+
+def _raise_budget_exceeded(signum, frame):
+    raise RecordBudgetExceeded("per-record CPU budget exceeded")
+
+
+@contextlib.contextmanager
+def cpu_budget(seconds: float | None):
+    """Raise RecordBudgetExceeded once the block has used `seconds` of CPU time.
+
+    Uses a SIGPROF interval timer, so it only works in the main thread on
+    POSIX and is a no-op elsewhere. Python handles the signal between
+    bytecodes: a single long call into C (the stdlib re engine, fastText) is
+    only interrupted when it returns, which is why regex-module calls also
+    get their own timeout.
+    """
+    if not seconds or not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    previous = signal.signal(signal.SIGPROF, _raise_budget_exceeded)
+    signal.setitimer(signal.ITIMER_PROF, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, previous)
+
+
+class RecordGuard:
+    """Run per-record stages under a regex timeout and CPU budget, quarantining records that exceed them.
+
+    Quarantined records are appended to a TSV file (one line per record and
+    stage) so they can be inspected or replayed later, and the worker moves
+    on to the next record instead of stalling the whole shard. The file of
+    a previous run is removed up front, so it only exists when this run
+    quarantined something.
+    """
+
+    def __init__(
+        self,
+        quarantine_path: str | None,
+        regex_timeout: float | None = DEFAULT_REGEX_TIMEOUT,
+        cpu_budget: float | None = DEFAULT_CPU_BUDGET,
+    ):
+        self.quarantine_path = quarantine_path
+        self.regex_timeout = regex_timeout
+        self.cpu_budget = cpu_budget
+        self.counter: dict[str, int] = defaultdict(int)
+        self.max_cpu_seconds: dict[str, float] = defaultdict(float)
+        self._quarantine_file = None
+        if quarantine_path is not None:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(quarantine_path)
+
+    def run(self, record_id: str, stage: str, fn: Callable, *args, **kwargs) -> tuple[bool, object]:
+        """Call fn(*args, **kwargs). Returns (True, result), or (False, None) if the record was quarantined."""
+        start = time.process_time()
+        try:
+            with cpu_budget(self.cpu_budget):
+                result = fn(*args, **kwargs)
+        except (TimeoutError, RecordBudgetExceeded) as e:
+            length = len(args[0]) if args and isinstance(args[0], str) else 0
+            self.quarantine(record_id, stage, type(e).__name__, time.process_time() - start, length)
+            return False, None
+        elapsed = time.process_time() - start
+        if elapsed > self.max_cpu_seconds[stage]:
+            self.max_cpu_seconds[stage] = elapsed
+        return True, result
+
+    def quarantine(self, record_id: str, stage: str, reason: str, cpu_seconds: float, length: int = 0):
+        self.counter[f"quarantined_{stage}"] += 1
+        if self.quarantine_path is None:
+            return
+        if self._quarantine_file is None:
+            self._quarantine_file = open(self.quarantine_path, "w", encoding="utf-8")
+            self._quarantine_file.write(QUARANTINE_HEADER)
+        self._quarantine_file.write(f"{record_id}\t{stage}\t{reason}\t{cpu_seconds:.3f}\t{length}\n")
+        self._quarantine_file.flush()
+
+    def close(self):
+        if self._quarantine_file is not None:
+            self._quarantine_file.close()
+            self._quarantine_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_quarantine(quarantine_path: str) -> list[tuple[str, str, str]]:
+    """Return (record_id, stage, reason) for every quarantined record."""
+    entries = []
+    with open(quarantine_path, encoding="utf-8") as f:
+        next(f)
+        for line in f:
+            record_id, stage, reason, _, _ = line.rstrip("\n").split("\t")
+            entries.append((record_id, stage, reason))
+    return entries
+
+
+def worst_case_corpus(size: int = 20000) -> dict[str, str]:
+    """Inputs that push the per-record regexes towards their worst case, each about `size` characters long."""
+    return {
+        # ELLIPSIS_LINE_RE: lazy prefix followed by \s* retries the whitespace tail at every position
+        "whitespace_line": " " * size + "x",
+        "whitespace_line_with_dots": "\t " * (size // 2) + "..x",
+        # EMAIL_PATTERN: every start position scans the local part up to an "@" without a domain
+        "email_local_part": "a" * size + "@",
+        "email_dotted_domain": "a@" + "a." * (size // 2),
+        "many_at_signs": "a@" * (size // 2),
+        # phone and IP patterns: long digit runs with separators the lookarounds keep rejecting
+        "digit_run": "1" * size,
+        "digit_groups": "123 " * (size // 4),
+        "dotted_digits": "1." * (size // 2),
+        "paren_digits": "(123) " * (size // 6),
+        # one giant line and many tiny ones for the line-based rules
+        "single_long_word": "x" * size,
+        "many_empty_lines": "\n" * size,
+        "ellipsis_lines": "word ...\n" * (size // 9),
+    }
+
+
+def fuzz_corpus(num_docs: int = 200, size: int = 20000, seed: int = 42) -> list[str]:
+    """Random concatenations of worst-case fragments and ordinary prose."""
+    rng = random.Random(seed)
+    fragments = list(worst_case_corpus(size // 10).values())
+    fragments.append("The quick brown fox jumps over the lazy dog. " * (size // 450))
+    docs = []
+    for _ in range(num_docs):
+        parts = [rng.choice(fragments) for _ in range(rng.randint(1, 10))]
+        docs.append(rng.choice(["", " ", "\n"]).join(parts))
+    return docs
+
+
+def _stages() -> dict[str, Callable]:
+    from cs336_data.mask_pii import mask_pii
+    from cs336_data.quality_filters import gopher_quality_filter_fast, more_than_30_percent_ellipsis_lines_regex
+
+    return {
+        "mask_pii": mask_pii,
+        "ellipsis_lines": more_than_30_percent_ellipsis_lines_regex,
+        "gopher_fast": gopher_quality_filter_fast,
+    }
+
+
+def benchmark_worst_case(size: int = 20000, regex_timeout: float = DEFAULT_REGEX_TIMEOUT,
+                         budget: float = DEFAULT_CPU_BUDGET, num_fuzz_docs: int = 200):
+    """Report the slowest record per stage, unguarded and guarded, on the worst-case and fuzz corpora."""
+    corpus = worst_case_corpus(size)
+    corpus.update({f"fuzz_{i}": doc for i, doc in enumerate(fuzz_corpus(num_fuzz_docs, size))})
+    guard = RecordGuard(None, regex_timeout=regex_timeout, cpu_budget=budget)
+    for stage, fn in _stages().items():
+        takes_timeout = stage != "gopher_fast"
+        worst_name, worst_time = "", 0.0
+        guarded_worst = 0.0
+        for name, text in corpus.items():
+            start_time = time.perf_counter()
+            fn(text)
+            elapsed = time.perf_counter() - start_time
+            if elapsed > worst_time:
+                worst_name, worst_time = name, elapsed
+
+            start_time = time.perf_counter()
+            if takes_timeout:
+                guard.run(name, stage, fn, text, timeout=regex_timeout)
+            else:
+                guard.run(name, stage, fn, text)
+            guarded_worst = max(guarded_worst, time.perf_counter() - start_time)
+        print(f"{stage:>15}: unguarded worst {worst_time:.3f}s ({worst_name}), guarded worst {guarded_worst:.3f}s, "
+              f"quarantined {guard.counter[f'quarantined_{stage}']}/{len(corpus)}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description="Time the per-record stages on pathological inputs.")
+    arg_parser.add_argument("--size", type=int, default=20000, help="Characters per worst-case input")
+    arg_parser.add_argument("--regex_timeout", type=float, default=DEFAULT_REGEX_TIMEOUT)
+    arg_parser.add_argument("--cpu_budget", type=float, default=DEFAULT_CPU_BUDGET)
+    arg_parser.add_argument("--num_fuzz_docs", type=int, default=200)
+    args = arg_parser.parse_args()
+    benchmark_worst_case(args.size, args.regex_timeout, args.cpu_budget, args.num_fuzz_docs)
@@ -0,0 +1,162 @@
+import io
+import os
+import random
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+from fastwarc.warc import ArchiveIterator, WarcRecord
+
+INDEX_SUFFIX = ".idx"
+INDEX_HEADER = "record_id\ttype\toffset\tlength\turl\n"
+
+
+@dataclass
+class IndexEntry:
+    record_id: str
+    record_type: str
+    offset: int
+    length: int
+    url: str
+
+
+def index_path_for(warc_path: str) -> str:
+    return warc_path + INDEX_SUFFIX
+
+
+def build_index(warc_path: str, index_path: str | None = None) -> list[IndexEntry]:
+    """Walk a WARC/WET file once and write a sidecar with one line per record.
+
+    Common Crawl writes every record as its own gzip member, so `offset` and
+    `length` describe a byte range that can be decompressed on its own.
+    """
+    index_path = index_path or index_path_for(warc_path)
+    entries: list[IndexEntry] = []
+    with open(warc_path, "rb") as f:
+        for record in ArchiveIterator(f, parse_http=False):
+            if entries:
+                entries[-1].length = record.stream_pos - entries[-1].offset
+            url: str = record.headers.get("WARC-Target-URI", "")  # type: ignore
+            entries.append(IndexEntry(
+                record_id=record.record_id,
+                record_type=record.headers.get("WARC-Type", ""),  # type: ignore
+                offset=record.stream_pos,
+                length=0,
+                url=url,
+            ))
+    if entries:
+        entries[-1].length = os.path.getsize(warc_path) - entries[-1].offset
+
+    tmp_path = index_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out_f:
+        out_f.write(INDEX_HEADER)
+        for e in entries:
+            url = e.url.replace("\t", "%09").replace("\n", "%0A")
+            out_f.write(f"{e.record_id}\t{e.record_type}\t{e.offset}\t{e.length}\t{url}\n")
+    os.replace(tmp_path, index_path)
+    return entries
+
+
+def index_is_current(warc_path: str) -> bool:
+    index_path = index_path_for(warc_path)
+    return os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(warc_path)
+
+
+def load_index(warc_path: str, build: bool = False) -> list[IndexEntry]:
+    """Read the sidecar index of a WARC file.
+
+    A missing or stale index raises FileNotFoundError unless `build` is set,
+    in which case it is (re)built and written next to the shard.
+    """
+    if not index_is_current(warc_path):
+        if not build:
+            raise FileNotFoundError(f"No up-to-date index for {warc_path}")
+        return build_index(warc_path)
+
+    entries: list[IndexEntry] = []
+    with open(index_path_for(warc_path), encoding="utf-8") as f:
+        next(f)
+        for line in f:
+            record_id, record_type, offset, length, url = line.rstrip("\n").split("\t")
+            entries.append(IndexEntry(record_id, record_type, int(offset), int(length), url))
+    return entries
+
+
+def count_records(warc_path: str, record_type: str | None = None, build: bool = False) -> int:
+    """Number of records (of `record_type`, if given), from the index when it is up to date.
+
+    Without an index the shard is scanned and nothing is written, unless
+    `build` is set, in which case the index is built for later calls.
+    """
+    if index_is_current(warc_path) or build:
+        record_types = [e.record_type for e in load_index(warc_path, build)]
+    else:
+        with open(warc_path, "rb") as f:
+            record_types = [record.headers.get("WARC-Type", "") for record in ArchiveIterator(f, parse_http=False)]
+    if record_type is None:
+        return len(record_types)
+    return sum(1 for t in record_types if t == record_type)
+
+
+def iter_byte_range(warc_path: str, offset: int, length: int, parse_http: bool = True) -> Iterator[WarcRecord]:
+    """Iterate over the records stored in bytes [offset, offset + length) of a WARC file."""
+    with open(warc_path, "rb") as f:
+        f.seek(offset)
+        data = f.read(length)
+    yield from ArchiveIterator(io.BytesIO(data), parse_http=parse_http)
+
+
+def read_record(warc_path: str, entry: IndexEntry, parse_http: bool = True) -> WarcRecord:
+    """Seek straight to a single record. The returned record's payload is already buffered."""
+    return next(iter_byte_range(warc_path, entry.offset, entry.length, parse_http))
+
+
+def read_record_at(warc_path: str, n: int, parse_http: bool = True, build: bool = False) -> WarcRecord:
+    return read_record(warc_path, load_index(warc_path, build)[n], parse_http)
+
+
+def split_ranges(entries: list[IndexEntry], num_splits: int) -> list[tuple[int, int]]:
+    """Split a shard into at most `num_splits` contiguous (offset, length) ranges of similar size.
+
+    Boundaries always fall on record boundaries, so every range can be handed
+    to a different worker and read with iter_byte_range.
+    """
+    if not entries:
+        return []
+    start = entries[0].offset
+    end = entries[-1].offset + entries[-1].length
+    target = (end - start) / max(num_splits, 1)
+    ranges: list[tuple[int, int]] = []
+    range_start = start
+    for e in entries[1:]:
+        if e.offset - range_start >= target and len(ranges) < num_splits - 1:
+            ranges.append((range_start, e.offset - range_start))
+            range_start = e.offset
+    ranges.append((range_start, end - range_start))
+    return ranges
+
+
+def sample_entries(
+    entries: list[IndexEntry], k: int, record_type: str | None = None, seed: int = 42
+) -> list[IndexEntry]:
+    if record_type is not None:
+        entries = [e for e in entries if e.record_type == record_type]
+    rng = random.Random(seed)
+    return sorted(rng.sample(entries, min(k, len(entries))), key=lambda e: e.offset)
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    arg_parser = argparse.ArgumentParser(description="Build offset index sidecars for WARC/WET files.")
+    arg_parser.add_argument("warc_paths", type=str, nargs="+", help="Paths to the input WARC/WET files.")
+    arg_parser.add_argument("--force", action="store_true", help="Rebuild even when an up-to-date index exists")
+    args = arg_parser.parse_args()
+
+    for warc_path in args.warc_paths:
+        start_time = time.time()
+        entries = build_index(warc_path) if args.force else load_index(warc_path, build=True)
+        type_counts: dict[str, int] = {}
+        for e in entries:
+            type_counts[e.record_type] = type_counts.get(e.record_type, 0) + 1
+        print(f"{warc_path}: {len(entries)} records {type_counts} in {time.time() - start_time:.2f} seconds")
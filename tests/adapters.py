@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import os
+from collections.abc import Callable
 from typing import Any
 
 
@@ -10,11 +11,24 @@ def run_extract_text_from_html_bytes(html_bytes: bytes) -> str | None:
     return extract_warc(html_bytes)
 
 
+def run_decode_bytes(content_bytes: bytes, content_type: str | None = None) -> tuple[str, list[str]]:
+    """Decoded text and the decode tiers that were counted for it."""
+    from cs336_data.extract_text import decode_bytes, pop_decode_stats
+    pop_decode_stats()
+    text = decode_bytes(content_bytes, content_type)
+    return text, sorted(pop_decode_stats())
+
+
 def run_identify_language(text: str) -> tuple[Any, float]:
     from cs336_data.language_identification import detect_language
     return detect_language(text)
 
 
+def run_identify_language_batch(texts: list[str], k: int = 1) -> tuple[Any, Any]:
+    from cs336_data.language_identification import detect_language_batch
+    return detect_language_batch(texts, k=k)
+
+
 def run_mask_emails(text: str) -> tuple[str, int]:
     from cs336_data.mask_pii import mask_email
     return mask_email(text)
@@ -30,6 +44,20 @@ def run_mask_ips(text: str) -> tuple[str, int]:
     return mask_ip_addresses(text)
 
 
+def run_mask_pii(text: str, timeout: float | None = None) -> tuple[str, int, int, int]:
+    from cs336_data.mask_pii import mask_pii
+    return mask_pii(text, timeout=timeout)
+
+
+def run_guarded_mask_pii(
+    record_id: str, text: str, quarantine_path: os.PathLike, regex_timeout: float
+) -> tuple[bool, Any]:
+    from cs336_data.mask_pii import mask_pii
+    from cs336_data.record_guard import RecordGuard
+    with RecordGuard(str(quarantine_path), regex_timeout=regex_timeout) as guard:
+        return guard.run(record_id, "mask_pii", mask_pii, text, timeout=regex_timeout)
+
+
 def run_classify_nsfw(text: str) -> tuple[Any, float]:
     from cs336_data.harmful_content import classify_nsfw
     return classify_nsfw(text)
@@ -40,21 +68,233 @@ def run_classify_toxic_speech(text: str) -> tuple[Any, float]:
     return classify_toxicity(text)
 
 
+def run_classify_harmful_batch(texts: list[str], short_circuit: bool = True) -> Any:
+    from cs336_data.harmful_content import classify_harmful_batch
+    return classify_harmful_batch(texts, short_circuit=short_circuit)
+
+
 def run_classify_quality(text: str) -> tuple[Any, float]:
     from cs336_data.quality_classifier import predict_wiki_like
     return predict_wiki_like(text)
 
 
+def run_roc_auc_score(labels: list[int], scores: list[float]) -> float:
+    from cs336_data.quality_classifier import roc_auc_score
+    return roc_auc_score(labels, scores)
+
+
+def run_threshold_sweep(labels: list[int], scores: list[float], thresholds: list[float]) -> Any:
+    from cs336_data.quality_classifier import threshold_sweep
+    return threshold_sweep(labels, scores, thresholds)
+
+
 def run_gopher_quality_filter(text: str) -> bool:
     from cs336_data.quality_filters import gopher_quality_filter
     return gopher_quality_filter(text)[0]
 
 
+def run_gopher_quality_filter_fast(text: str) -> bool:
+    from cs336_data.quality_filters import gopher_quality_filter_fast
+    return gopher_quality_filter_fast(text)[0]
+
+
+def run_gopher_quality_filter_batch(texts: list[str]) -> list[bool]:
+    from cs336_data.quality_filters import gopher_quality_filter_batch
+    passed, _ = gopher_quality_filter_batch(texts)
+    return passed.tolist()
+
+
+def run_gopher_quality_metrics(texts: list[str]) -> list[dict[str, float]]:
+    from cs336_data.quality_filters import gopher_quality_metrics
+    metrics = gopher_quality_metrics(texts)
+    return [{name: row[name].item() for name in metrics.dtype.names} for row in metrics]
+
+
+def run_gopher_thresholds(texts: list[str], word_limit: int = 50) -> list[tuple[bool, str]]:
+    from cs336_data.quality_filters import gopher_quality_metrics, gopher_thresholds
+    passed, reasons = gopher_thresholds(gopher_quality_metrics(texts), word_limit)
+    return [(bool(p), reason.name) for p, reason in zip(passed, reasons)]
+
+
+def run_gopher_quality_filter_fast_reason(text: str, word_limit: int = 50) -> tuple[bool, str]:
+    from cs336_data.quality_filters import gopher_quality_filter_fast
+    passed, reason = gopher_quality_filter_fast(text, word_limit)
+    return passed, reason.name
+
+
+def run_gopher_repetition_filter(text: str) -> tuple[bool, Any]:
+    from cs336_data.quality_filters import gopher_repetition_filter
+    passed, reason = gopher_repetition_filter(text)
+    return passed, reason.name
+
+
+def run_gopher_repetition_fractions(text: str, n: int) -> tuple[float, float, float]:
+    """Duplicate-line and duplicate-paragraph character fractions, and the duplicate n-gram fraction for n."""
+    from cs336_data.quality_filters import RepetitionDocument, duplicate_fractions, duplicate_ngram_char_fraction
+    doc = RepetitionDocument.from_text(text)
+    _, line_chars = duplicate_fractions(doc.line_hashes, doc.line_lengths)
+    _, paragraph_chars = duplicate_fractions(doc.paragraph_hashes, doc.paragraph_lengths)
+    return line_chars, paragraph_chars, duplicate_ngram_char_fraction(doc, n)
+
+
 def run_exact_line_deduplication(
-    input_files: list[os.PathLike], output_directory: os.PathLike
+    input_files: list[os.PathLike], output_directory: os.PathLike, hash_bits: int = 64
 ):
     from cs336_data.exact_deduplication import exact_deduplication
-    exact_deduplication(input_files, output_directory)
+    exact_deduplication(input_files, output_directory, hash_bits=hash_bits)
+
+
+def run_counting_bloom_counts(lines: list[str], num_slots: int, num_hashes: int) -> list[int]:
+    from cs336_data.approx_line_counts import CountingBloomFilter
+    from cs336_data.exact_deduplication import hash_lines
+    bloom = CountingBloomFilter(num_slots, num_hashes)
+    hashes = hash_lines(lines)
+    bloom.add(hashes)
+    return bloom.counts(hashes).tolist()
+
+
+def run_line_hash_index_counts(batches: list[list[str]], index_directory: os.PathLike, queries: list[str]) -> list[int]:
+    """Add every batch of lines to a persistent index, reopening it each time, and count `queries`."""
+    import numpy as np
+    from cs336_data.exact_deduplication import hash_lines
+    from cs336_data.line_hash_index import LineHashIndex
+    for i, lines in enumerate(batches):
+        hashes, counts = np.unique(hash_lines(lines), return_counts=True)
+        LineHashIndex(str(index_directory)).add([f"batch{i}"], hashes, counts)
+    return LineHashIndex(str(index_directory)).counts(hash_lines(queries)).tolist()
+
+
+def run_minhash_preprocess(texts: list[str]) -> tuple[list[str], list[str]]:
+    from cs336_data.minhash_deduplication import preprocess, preprocess_reference
+    return [preprocess(text) for text in texts], [preprocess_reference(text) for text in texts]
+
+
+def run_minhash_signatures(shingle_sets: list[set[str]], num_hashes: int) -> Any:
+    from cs336_data.minhash_deduplication import minhash_signatures
+    return minhash_signatures(shingle_sets, num_hashes)
+
+
+def run_lsh_candidate_pairs(signatures: Any, num_bands: int, max_bucket_size: int | None = None) -> set[tuple[int, int]]:
+    from cs336_data.minhash_deduplication import lsh_candidate_pairs
+    return {(i, j) for i, j in lsh_candidate_pairs(signatures, num_bands, max_bucket_size).tolist()}
+
+
+def run_lsh_clusters(
+    signatures: Any, num_bands: int, similarity: Callable[[int, int], float], threshold: float,
+    max_bucket_size: int | None = None,
+) -> list[list[int]]:
+    from cs336_data.minhash_deduplication import lsh_clusters
+    roots, _ = lsh_clusters(signatures, num_bands, similarity, threshold, max_bucket_size)
+    clusters: dict[int, list[int]] = {}
+    for doc, root in enumerate(roots.tolist()):
+        clusters.setdefault(root, []).append(doc)
+    return sorted(clusters.values())
+
+
+def run_shingle_storage_similarity(
+    shingle_sets: list[set[str]], num_hashes: int, shingle_storage: str, pairs: list[tuple[int, int]]
+) -> list[float]:
+    from cs336_data.minhash_deduplication import shingle_storage_similarity
+    _, similarity, _ = shingle_storage_similarity(shingle_sets, num_hashes, shingle_storage)
+    return [similarity(i, j) for i, j in pairs]
+
+
+def _read_wet_shards(directory: os.PathLike) -> list[list[tuple[str, str]]]:
+    """(url, text) of every conversion record of every shard in `directory`, shards in name order."""
+    import glob
+
+    from fastwarc.warc import ArchiveIterator, WarcRecordType
+
+    from cs336_data.filter_CC.filter_01 import decode_content
+
+    shards = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.warc.wet.gz"))):
+        with open(path, "rb") as f:
+            shards.append([
+                (record.headers.get("WARC-Target-URI", ""), decode_content(record.reader.read()))
+                for record in ArchiveIterator(f, record_types=WarcRecordType.conversion)
+            ])
+    return shards
+
+
+def _fork_executor():
+    import concurrent.futures
+    import multiprocessing
+
+    # fork, so that workers see the same module state as the caller
+    return concurrent.futures.ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("fork"))
+
+
+def run_fuzzy_dedup(
+    input_directory: os.PathLike,
+    output_directory: os.PathLike,
+    num_hashes: int,
+    num_bands: int,
+    ngram_size: int,
+    threshold: float,
+) -> list[list[str]]:
+    from cs336_data.filter_CC.filter_01 import fuzzy_dedup
+
+    with _fork_executor() as executor:
+        fuzzy_dedup(
+            executor, str(input_directory), str(output_directory), num_hashes=num_hashes, num_bands=num_bands,
+            ngram_size=ngram_size, threshold=threshold,
+        )
+    return [[text for _, text in shard] for shard in _read_wet_shards(output_directory)]
+
+
+def run_dedup_mapreduce(
+    input_directory: os.PathLike, output_directory: os.PathLike, num_partitions: int, spool_records: bool
+) -> tuple[list[int], list[list[tuple[str, str]]]]:
+    """The global duplicate line hashes in the order phase 2 searches them, and every output shard's (url, text) records."""
+    import numpy as np
+
+    from cs336_data.filter_CC.filter_01 import dedup_mapreduce
+
+    spool_dir = os.path.join(output_directory, "_line_hashes")
+    with _fork_executor() as executor:
+        dedup_mapreduce(
+            executor, str(input_directory), str(output_directory), num_partitions=num_partitions,
+            spool_dir=spool_dir, spool_records=spool_records, keep_spool=True,
+        )
+    duplicates = np.load(os.path.join(spool_dir, "duplicates.npy"))
+    return duplicates.tolist(), _read_wet_shards(output_directory)
+
+
+def run_strip_boilerplate(
+    input_directory: os.PathLike, output_directory: os.PathLike, min_pages: int, num_partitions: int = 4
+) -> tuple[list[list[tuple[str, str]]], dict[str, tuple[int, int]]]:
+    """Every output shard's (url, text) records, and the (bytes, bytes removed) report of every domain."""
+    from cs336_data.filter_CC.filter_01 import strip_boilerplate
+
+    os.makedirs(output_directory, exist_ok=True)
+    with _fork_executor() as executor:
+        strip_boilerplate(
+            executor, str(input_directory), str(output_directory), min_pages=min_pages, num_partitions=num_partitions
+        )
+    report = {}
+    with open(os.path.join(output_directory, "boilerplate_by_domain.tsv"), encoding="utf-8") as f:
+        next(f)
+        for line in f:
+            domain, num_bytes, removed = line.rstrip("\n").split("\t")
+            report[domain] = (int(num_bytes), int(removed))
+    return _read_wet_shards(output_directory), report
+
+
+def run_lsh_dedup_texts(
+    texts: list[str], num_hashes: int, num_bands: int, ngram_size: int, threshold: float
+) -> list[int]:
+    from cs336_data.minhash_deduplication import (
+        cluster_representatives,
+        lsh_clusters,
+        preprocess,
+        shingle_storage_similarity,
+        text_shingles,
+    )
+    shingle_sets = (text_shingles(preprocess(text), ngram_size) for text in texts)
+    signatures, similarity, _ = shingle_storage_similarity(shingle_sets, num_hashes, "none")
+    roots, _ = lsh_clusters(signatures, num_bands, similarity, threshold)
+    return cluster_representatives(roots).tolist()
 
 
 def run_minhash_deduplication(
@@ -74,3 +314,34 @@ def run_minhash_deduplication(
         jaccard_threshold,
         output_directory,
     )
+
+
+def run_build_warc_index(warc_path: os.PathLike) -> list[tuple[str, str, int, int, str]]:
+    from dataclasses import astuple
+
+    from cs336_data.warc_index import build_index
+    return [astuple(entry) for entry in build_index(str(warc_path))]
+
+
+def run_load_warc_index(warc_path: os.PathLike, build: bool = False) -> list[tuple[str, str, int, int, str]]:
+    from dataclasses import astuple
+
+    from cs336_data.warc_index import load_index
+    return [astuple(entry) for entry in load_index(str(warc_path), build)]
+
+
+def run_count_warc_records(warc_path: os.PathLike, record_type: str | None = None, build: bool = False) -> int:
+    from cs336_data.warc_index import count_records
+    return count_records(str(warc_path), record_type, build)
+
+
+def run_split_warc_ranges(warc_path: os.PathLike, num_splits: int) -> tuple[list[tuple[int, int]], list[list[str]]]:
+    """Ranges of the indexed shard and the record ids read back from each range."""
+    from cs336_data.warc_index import iter_byte_range, load_index, split_ranges
+    ranges = split_ranges(load_index(str(warc_path)), num_splits)
+    record_ids = [
+        [record.record_id for record in iter_byte_range(str(warc_path), offset, length, parse_http=False)]
+        for offset, length in ranges
+    ]
+    return ranges, record_ids
+
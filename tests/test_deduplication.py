@@ -1,13 +1,77 @@
+import collections
+import itertools
 import logging
+from io import BytesIO
+
+import numpy as np
+import pytest
+from warcio.warcwriter import WARCWriter
 
 from xopen import xopen
 
-from .adapters import run_exact_line_deduplication, run_minhash_deduplication
+from .adapters import (
+    run_counting_bloom_counts,
+    run_dedup_mapreduce,
+    run_exact_line_deduplication,
+    run_fuzzy_dedup,
+    run_line_hash_index_counts,
+    run_lsh_candidate_pairs,
+    run_lsh_clusters,
+    run_lsh_dedup_texts,
+    run_minhash_deduplication,
+    run_minhash_preprocess,
+    run_minhash_signatures,
+    run_shingle_storage_similarity,
+    run_strip_boilerplate,
+)
 from .common import FIXTURES_PATH
 
 logger = logging.getLogger(__name__)
 
 
+def write_wet_shards(directory, shards: list[list[str]], urls: list[list[str]] | None = None):
+    """Write every list of texts as a gzip WET shard of conversion records, shard{i}.warc.wet.gz."""
+    directory.mkdir()
+    for shard, texts in enumerate(shards):
+        with open(directory / f"shard{shard}.warc.wet.gz", "wb") as f:
+            writer = WARCWriter(f, gzip=True)
+            for i, text in enumerate(texts):
+                url = urls[shard][i] if urls else f"https://example.com/{shard}/{i}"
+                writer.write_record(writer.create_warc_record(url, "conversion", payload=BytesIO(text.encode())))
+    return directory
+
+
+def line_dedup_corpus(num_shards: int = 4, docs_per_shard: int = 15, seed: int = 0) -> list[list[str]]:
+    """Shards of pages mixing shared boilerplate, unique lines, lines repeated inside a page and odd line breaks."""
+    rng = np.random.default_rng(seed)
+    boilerplate = ["Home | About | Contact", "Copyright 2024 Example Inc.", "Subscribe to our newsletter", ""]
+    breaks = ["\n", "\n", "\r\n", "\r", "\u2028", "\x85", "\x0c"]
+    shards = []
+    for shard in range(num_shards):
+        texts = []
+        for doc in range(docs_per_shard):
+            lines = [f"unique line {shard} {doc} {i}" for i in range(rng.integers(0, 4))]
+            lines += rng.choice(boilerplate, rng.integers(0, 4)).tolist()
+            if doc % 4 == 0:
+                lines += ["repeated inside one page"] * 2
+            if doc % 5 == 0:
+                lines.append(f"shared by shard {shard} and the next" if doc % 2 else f"shared by shard {shard - 1} and the next")
+            rng.shuffle(lines)
+            texts.append("".join(line + str(rng.choice(breaks)) for line in lines) + "\u3000 ")
+        shards.append(texts)
+    return shards
+
+
+def brute_force_line_dedup(shards: list[list[str]]) -> tuple[collections.Counter, list[list[str]]]:
+    """Line counts over the whole corpus and the texts exact line dedup keeps, shard by shard."""
+    counts = collections.Counter(line for texts in shards for text in texts for line in text.splitlines())
+    kept = []
+    for texts in shards:
+        deduped = ["\n".join(line for line in text.splitlines() if counts[line] == 1) for text in texts]
+        kept.append([text for text in deduped if text.strip()])
+    return counts, kept
+
+
 def test_exact_line_deduplication(tmp_path):
     documents_with_line_duplicates_paths = list(
         (FIXTURES_PATH / "documents_with_line_duplicates").glob("doc*.txt")
@@ -40,6 +104,223 @@ def test_exact_line_deduplication(tmp_path):
     assert len(deduplicated_documents) == 0
 
 
+def test_exact_line_deduplication_128bit_matches_64bit(tmp_path):
+    documents_with_line_duplicates_paths = sorted(
+        (FIXTURES_PATH / "documents_with_line_duplicates").glob("doc*.txt")
+    )
+    run_exact_line_deduplication(
+        input_files=documents_with_line_duplicates_paths, output_directory=tmp_path / "64"
+    )
+    run_exact_line_deduplication(
+        input_files=documents_with_line_duplicates_paths, output_directory=tmp_path / "128", hash_bits=128
+    )
+    for path in documents_with_line_duplicates_paths:
+        with open(tmp_path / "64" / path.name) as f64, open(tmp_path / "128" / path.name) as f128:
+            assert f64.read() == f128.read()
+
+
+@pytest.mark.parametrize("num_partitions", [1, 3, 16])
+def test_dedup_mapreduce_matches_brute_force(tmp_path, num_partitions):
+    shards = line_dedup_corpus()
+    counts, expected = brute_force_line_dedup(shards)
+    duplicates, output = run_dedup_mapreduce(
+        write_wet_shards(tmp_path / "in", shards), tmp_path / "out", num_partitions, spool_records=False
+    )
+    # the partitions concatenate to one sorted duplicate set with an entry per line seen twice or more
+    assert duplicates == sorted(set(duplicates))
+    assert len(duplicates) == sum(1 for count in counts.values() if count >= 2)
+    assert [[text for _, text in records] for records in output] == expected
+    assert any(count == 1 for count in counts.values()) and any(count > 2 for count in counts.values())
+
+
+def test_dedup_mapreduce_spooled_matches_unspooled(tmp_path):
+    shards = line_dedup_corpus(seed=1)
+    input_dir = write_wet_shards(tmp_path / "in", shards)
+    spooled_duplicates, spooled = run_dedup_mapreduce(input_dir, tmp_path / "spooled", 5, spool_records=True)
+    duplicates, unspooled = run_dedup_mapreduce(input_dir, tmp_path / "unspooled", 5, spool_records=False)
+    assert spooled_duplicates == duplicates
+    # same urls and texts, including pages with "\r", empty lines and whitespace-only leftovers
+    assert spooled == unspooled
+    assert [[text for _, text in records] for records in spooled] == brute_force_line_dedup(shards)[1]
+
+
+def test_strip_boilerplate_per_domain(tmp_path):
+    site_footer = "BBC footer: terms, privacy, cookies"
+    shared_footer = "Powered by the same CMS"
+    pages = [
+        # bbc.co.uk, over three shards and two subdomains: its own footer is on 3 pages, the shared one on 2
+        ("https://www.bbc.co.uk/news/1", ["Election results are in", site_footer, shared_footer]),
+        ("https://news.bbc.co.uk/2", ["Weather turns cold", site_footer]),
+        ("https://www.bbc.co.uk/sport/3", ["Cup final tonight", site_footer, shared_footer]),
+        ("https://www.bbc.co.uk/4", ["Repeated on one page only"] * 3),
+        # example.org: the shared footer is on 3 of its pages, the BBC footer on 1
+        ("https://blog.example.org/a", ["First post", shared_footer]),
+        ("https://example.org/b", ["Second post", shared_footer, site_footer]),
+        ("https://example.org/c", [shared_footer]),
+    ]
+    shards = [[0, 4], [1, 5, 3], [2, 6]]
+    output, report = run_strip_boilerplate(
+        write_wet_shards(
+            tmp_path / "in",
+            [["\n".join(pages[i][1]) for i in shard] for shard in shards],
+            [[pages[i][0] for i in shard] for shard in shards],
+        ),
+        tmp_path / "out",
+        min_pages=3,
+    )
+
+    boilerplate = {"bbc.co.uk": {site_footer}, "example.org": {shared_footer}}
+    expected_output, expected_report = [], {}
+    for shard in shards:
+        expected_output.append([])
+        for i in shard:
+            url, lines = pages[i]
+            domain = "bbc.co.uk" if "bbc" in url else "example.org"
+            kept = [line for line in lines if line not in boilerplate[domain]]
+            num_bytes, removed = expected_report.get(domain, (0, 0))
+            line_bytes = sum(len(line.encode()) for line in lines)
+            expected_report[domain] = (num_bytes + line_bytes, removed + line_bytes - sum(len(line.encode()) for line in kept))
+            if kept:
+                expected_output[-1].append((url, "\n".join(kept)))
+    assert output == expected_output
+    assert report == expected_report
+
+
+def test_counting_bloom_never_undercounts(tmp_path):
+    lines = []
+    for path in sorted((FIXTURES_PATH / "documents_with_line_duplicates").glob("doc*.txt")):
+        with open(path) as f:
+            lines.extend(f.read().splitlines())
+    exact = collections.Counter(lines)
+    expected = [min(exact[line], 3) for line in lines]
+
+    # plenty of slots: every count is exact up to saturation
+    assert run_counting_bloom_counts(lines, num_slots=1 << 20, num_hashes=4) == expected
+    # far too few slots: counts collide but are never below the true count
+    for num_hashes in (1, 3):
+        approx = run_counting_bloom_counts(lines, num_slots=16, num_hashes=num_hashes)
+        assert all(a >= e for a, e in zip(approx, expected))
+
+
+def test_line_hash_index_incremental_counts(tmp_path):
+    batches = []
+    for path in sorted((FIXTURES_PATH / "documents_with_line_duplicates").glob("doc*.txt")):
+        with open(path) as f:
+            batches.append(f.read().splitlines())
+    exact = collections.Counter(line for lines in batches for line in lines)
+    queries = sorted(exact) + ["a line that was never added"]
+
+    counts = run_line_hash_index_counts(batches, tmp_path / "index", queries)
+    assert counts == [min(exact[line], 2) for line in queries[:-1]] + [0]
+
+
+def test_minhash_preprocess_matches_reference():
+    with open(FIXTURES_PATH / "high_quality_wiki_reference.txt") as f:
+        wiki = f.read()
+    texts = [
+        wiki,
+        "Café  NAÏVE\tcoöperate!\n\u00a0Ærøskøbing, São Paulo — «quoted» “smart” ‘quotes’…",
+        "Привет, мир! 東京の天気は？ ¿Qué tal? İstanbul Straße ﬁ Ⅻ",
+        "e\u0301 a\u0308\u0323 \u3000 ",
+        "",
+    ]
+    fast, reference = run_minhash_preprocess(texts)
+    assert fast == reference
+    assert fast[1].startswith("cafe naive cooperate ærøskøbing sao paulo")
+
+
+def test_minhash_signatures_batch_and_jaccard_estimate():
+    base = {f"shingle {i}" for i in range(1000)}
+    similar = {f"shingle {i}" for i in range(333, 1333)}  # Jaccard 0.5
+    shingle_sets = [base, set(), similar, set(base)]
+
+    batch = run_minhash_signatures(shingle_sets, num_hashes=500)
+    assert batch.shape == (4, 500)
+    for shingles, signature in zip(shingle_sets, batch):
+        assert (run_minhash_signatures([shingles], num_hashes=500)[0] == signature).all()
+    assert (batch[0] == batch[3]).all()
+    assert abs((batch[0] == batch[2]).mean() - 0.5) < 0.1
+
+
+def test_lsh_candidate_pairs_match_brute_force():
+    rng = np.random.default_rng(0)
+    # few distinct values, so many documents share bands
+    signatures = rng.integers(0, 3, (60, 12)).astype(np.uint32)
+    expected = {
+        (i, j)
+        for i, j in itertools.combinations(range(60), 2)
+        if any((signatures[i, band:band + 3] == signatures[j, band:band + 3]).all() for band in range(0, 12, 3))
+    }
+    assert run_lsh_candidate_pairs(signatures, num_bands=4) == expected
+    assert run_lsh_candidate_pairs(signatures, num_bands=4, max_bucket_size=1000) == expected
+    assert run_lsh_candidate_pairs(signatures, num_bands=4, max_bucket_size=2) <= expected
+
+
+def test_lsh_clusters_oversized_bucket_with_dissimilar_first_member():
+    # documents 0-5 share only the first band; 1-5 are near-duplicates, 0 is similar to none of them
+    signatures = np.arange(8 * 6, dtype=np.uint32).reshape(8, 6)
+    signatures[:6, :2] = 7
+
+    def similarity(i, j):
+        return 1.0 if 0 < i <= 5 and 0 < j <= 5 else 0.0
+
+    clusters = run_lsh_clusters(signatures, 3, similarity, 0.8)
+    assert clusters == [[0], [1, 2, 3, 4, 5], [6], [7]]
+    assert run_lsh_clusters(signatures, 3, similarity, 0.8, max_bucket_size=10) == clusters
+    # the opt-in cap only compares members with document 0, so the near-duplicates are missed
+    capped = run_lsh_clusters(signatures, 3, similarity, 0.8, max_bucket_size=4)
+    assert capped == [[i] for i in range(8)]
+
+
+def test_shingle_storage_similarity_matches_sets():
+    shingle_sets = [
+        {f"shingle {i}" for i in range(1000)},
+        {f"shingle {i}" for i in range(333, 1333)},
+        {f"shingle {i}" for i in range(900, 950)},
+        set(),
+        set(),
+    ]
+    pairs = [(0, 1), (0, 2), (1, 2), (2, 0), (0, 3), (3, 3), (3, 4)]
+    exact = run_shingle_storage_similarity(shingle_sets, 500, "sets", pairs)
+    assert exact[-3:] == [0.0, 0.0, 0.0]
+    assert run_shingle_storage_similarity(shingle_sets, 500, "hashes", pairs) == exact
+    estimated = run_shingle_storage_similarity(shingle_sets, 500, "none", pairs)
+    assert all(abs(e - x) < 0.1 for e, x in zip(estimated, exact))
+    # documents without shingles are never estimated as duplicates of each other
+    assert estimated[-3:] == [0.0, 0.0, 0.0]
+
+
+def test_fuzzy_dedup_matches_in_memory_clusters(tmp_path, monkeypatch):
+    # whitespace tokens keep the test independent of the nltk tokenizer data
+    monkeypatch.setattr("cs336_data.minhash_deduplication.word_tokenize", str.split)
+    rng = np.random.default_rng(0)
+    vocab = [f"word{i}" for i in range(500)]
+    templates = [rng.choice(vocab, 120).tolist() for _ in range(8)]
+    shards = []
+    for _ in range(3):
+        texts = []
+        for i in range(20):
+            if i % 5 == 3:
+                texts.append("tiny page")  # shorter than an n-gram: never a near-duplicate
+            elif i % 5 == 4:
+                texts.append(" ".join(rng.choice(vocab, 120).tolist()))
+            else:
+                tokens = list(templates[rng.integers(len(templates))])
+                tokens[rng.integers(len(tokens))] = str(rng.choice(vocab))
+                texts.append(" ".join(tokens))
+        shards.append(texts)
+    input_dir = write_wet_shards(tmp_path / "in", shards)
+
+    kept = run_fuzzy_dedup(input_dir, tmp_path / "out", num_hashes=100, num_bands=20, ngram_size=5, threshold=0.8)
+    corpus = [text for texts in shards for text in texts]
+    expected = [corpus[i] for i in run_lsh_dedup_texts(corpus, 100, 20, 5, 0.8)]
+    assert [text for texts in kept for text in texts] == expected
+    assert len(kept) == 3
+    assert sum(text == "tiny page" for texts in kept for text in texts) == 12
+    # 36 edited copies of 8 templates, 12 distinct random pages and 12 tiny pages
+    assert len(expected) <= 8 + 12 + 12 + 4
+
+
 def test_minhash_deduplication_exact_duplicates(tmp_path):
     """
     Check that minhash deduplication properly identifies and removes exact duplicates.
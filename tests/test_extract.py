@@ -1,6 +1,6 @@
 import logging
 
-from .adapters import run_extract_text_from_html_bytes
+from .adapters import run_decode_bytes, run_extract_text_from_html_bytes
 from .common import FIXTURES_PATH
 
 logger = logging.getLogger(__name__)
@@ -14,3 +14,20 @@ def test_extract_text_from_html_bytes():
     with open(moby_expected_path) as f:
         moby_expected_text = f.read()
     assert moby_expected_text == run_extract_text_from_html_bytes(moby_bytes)
+
+
+def test_decode_bytes_meta_charset_is_case_insensitive():
+    text = "Привет, мир! Это проверка кодировки страницы."
+    metas = [
+        '<meta charset="windows-1251">',
+        '<Meta Charset="windows-1251">',
+        '<META HTTP-EQUIV="Content-Type" CONTENT="text/html; CHARSET=windows-1251">',
+    ]
+    for meta in metas:
+        html = f"<html><head>{meta}</head><body><p>{text}</p></body></html>"
+        decoded, tiers = run_decode_bytes(html.encode("cp1251"))
+        assert decoded == html
+        assert tiers == ["meta"]
+    # the header wins over the page
+    html = f"<html><head><Meta charset=\"koi8-r\"></head><body><p>{text}</p></body></html>"
+    assert run_decode_bytes(html.encode("cp1251"), "text/html; charset=windows-1251") == (html, ["header"])
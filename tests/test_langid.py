@@ -1,6 +1,6 @@
 import logging
 
-from .adapters import run_identify_language
+from .adapters import run_identify_language, run_identify_language_batch
 from .common import FIXTURES_PATH
 
 logger = logging.getLogger(__name__)
@@ -25,3 +25,22 @@ def test_identify_language_chinese_simplified():
     assert predicted_language == "zh"
     assert isinstance(score, float)
     assert score > 0
+
+
+def test_identify_language_batch_matches_single():
+    moby_expected_path = FIXTURES_PATH / "moby_extracted.txt"
+    with open(moby_expected_path) as f:
+        moby_expected_text = f.read()
+    texts = [moby_expected_text, "欢迎来到我们的网站", "Bonjour tout le monde"]
+    labels, confidences = run_identify_language_batch(texts)
+    assert labels.shape == (3,)
+    assert confidences.shape == (3,)
+    for text, label, confidence in zip(texts, labels, confidences):
+        expected_label, expected_confidence = run_identify_language(text)
+        assert label == expected_label
+        assert abs(confidence - expected_confidence) < 1e-5
+
+    labels, confidences = run_identify_language_batch(texts, k=3)
+    assert labels.shape == (3, 3)
+    assert labels[0, 0] == "en"
+    assert labels[1, 0] == "zh"
@@ -1,6 +1,9 @@
 import logging
+import time
 
-from .adapters import run_mask_emails, run_mask_ips, run_mask_phone_numbers
+import pytest
+
+from .adapters import run_guarded_mask_pii, run_mask_emails, run_mask_ips, run_mask_phone_numbers, run_mask_pii
 
 logger = logging.getLogger(__name__)
 
@@ -57,3 +60,45 @@ def test_mask_ips():
     masked_text, num_masked = run_mask_ips(test_string)
     assert masked_text == expected_masked_text
     assert num_masked == 1
+
+
+def test_mask_pii_matches_chain():
+    test_strings = [
+        "Feel free to contact me at test@gmail.com or 283-182-3829 if you have any questions.",
+        "You can dial (+33) 18155704487 or +53 181-5570-4487 for info.",
+        "Server 192.0.2.146 answers on 10.0.0.1, admin is pl@fakedomain.ai (since 2019).",
+        "Call 555 123 4567x@fakedomain.ai or +1 555 1234 5678.",
+        "x@y.io192.168.1.1 and 2831823829283-182-3829",
+        "No PII here, only a year 2024 and a price of 3.50.",
+    ]
+    for test_string in test_strings:
+        masked_text, num_emails = run_mask_emails(test_string)
+        masked_text, num_phones = run_mask_phone_numbers(masked_text)
+        masked_text, num_ips = run_mask_ips(masked_text)
+        assert run_mask_pii(test_string) == (masked_text, num_emails, num_phones, num_ips)
+
+
+def test_mask_pii_times_out_on_pathological_input(tmp_path):
+    # every start position scans the whole local part before failing to find a domain
+    pathological = "a" * 50000 + "@"
+    with pytest.raises(TimeoutError):
+        run_mask_pii(pathological, timeout=0.01)
+
+    quarantine_path = tmp_path / "shard.quarantine.tsv"
+    ok, result = run_guarded_mask_pii("<urn:bad>", pathological, quarantine_path, regex_timeout=0.01)
+    assert not ok and result is None
+    lines = quarantine_path.read_text().splitlines()
+    assert len(lines) == 2 and lines[1].startswith("<urn:bad>\tmask_pii\tTimeoutError")
+    # a rerun that quarantines nothing does not leave the previous run's file behind
+    ok, result = run_guarded_mask_pii("<urn:good>", "mail pl@fakedomain.ai", quarantine_path, regex_timeout=0.01)
+    assert ok and result == ("mail |||EMAIL_ADDRESS|||", 1, 0, 0)
+    assert not quarantine_path.exists()
+
+
+def test_mask_pii_timeout_is_per_record():
+    # every window takes a few milliseconds, far below the timeout, but there are hundreds of them
+    many_windows = ("a" * 1000 + "@x ") * 200
+    start_time = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        run_mask_pii(many_windows, timeout=0.1)
+    assert time.perf_counter() - start_time < 0.5
@@ -1,6 +1,21 @@
 import logging
+import random
 
-from .adapters import run_classify_quality, run_gopher_quality_filter
+import pytest
+
+from .adapters import (
+    run_classify_quality,
+    run_gopher_quality_filter,
+    run_gopher_quality_filter_batch,
+    run_gopher_quality_filter_fast,
+    run_gopher_quality_filter_fast_reason,
+    run_gopher_quality_metrics,
+    run_gopher_thresholds,
+    run_gopher_repetition_filter,
+    run_gopher_repetition_fractions,
+    run_roc_auc_score,
+    run_threshold_sweep,
+)
 from .common import FIXTURES_PATH
 
 logger = logging.getLogger(__name__)
@@ -28,6 +43,35 @@ def test_classify_quality():
     assert score > 0
 
 
+def test_roc_auc_and_threshold_sweep():
+    rng = random.Random(0)
+    labels = [int(rng.random() < 0.4) for _ in range(300)]
+    # rounded scores so that some positive/negative pairs tie
+    scores = [round(rng.random() * 0.5 + 0.3 * label, 1) for label in labels]
+    pairs = [
+        1.0 if p > n else 0.5 if p == n else 0.0
+        for p, lp in zip(scores, labels) if lp
+        for n, ln in zip(scores, labels) if not ln
+    ]
+    assert abs(run_roc_auc_score(labels, scores) - sum(pairs) / len(pairs)) < 1e-9
+    assert run_roc_auc_score([1, 1], [0.2, 0.9]) == 0.0
+
+    # a tied positive/negative pair counts as half-correct, whatever order the scores come in
+    assert run_roc_auc_score([1, 0], [0.7, 0.7]) == 0.5
+    assert run_roc_auc_score([0, 1, 0, 1], [0.5] * 4) == 0.5
+    assert run_roc_auc_score([0, 1, 1, 0], [0.5, 0.9, 0.5, 0.1]) == 0.875
+
+    thresholds = [0.0, 0.35, 0.5, 1.0]
+    sweep = run_threshold_sweep(labels, scores, thresholds)
+    for row, threshold in zip(sweep, thresholds):
+        kept = [label for label, score in zip(labels, scores) if score >= threshold]
+        assert row["kept"] == len(kept)
+        assert abs(row["keep_rate"] - len(kept) / len(labels)) < 1e-6
+        assert abs(row["recall"] - sum(kept) / sum(labels)) < 1e-6
+        if kept:
+            assert abs(row["precision"] - sum(kept) / len(kept)) < 1e-6
+
+
 def test_gopher_valid_input():
     text = (
         "This should definitely be a valid input text "
@@ -92,3 +136,143 @@ def test_gopher_less_than_80_percent_words_with_alphabetic_character():
     words += ["word" for _ in range(2)]
     text = "the and " + " ".join(words)
     assert not run_gopher_quality_filter(text)
+
+
+def test_gopher_fast_matches_rules():
+    ellipsis_lines = ["The line here is an example of line ending with an ellipsis..." for _ in range(70)]
+    ellipsis_lines += ["This is a normal line." for _ in range(30)]
+    few_ellipsis_lines = ["The line here is an example of ending with ellipsis..." for _ in range(30)]
+    few_ellipsis_lines += ["This is a normal line." for _ in range(230)]
+    cases = [
+        ("This should definitely be a valid input text and of high quality according to Gopher rules. " * 100, True),
+        ("The string you are reading is a short snippet of text.", False),
+        ("The string you are reading is a long snippet of text." * 100, True),
+        ("The string you are reading is too long of a text. " * 50000, False),
+        ("The string you are reading is an okay example of text. " * 5000, True),
+        ("the be " * 100, False),
+        ("the with " * 100, True),
+        ("the and " + "extraordinarily extraordinarily extraordinarily longesest " * 100, False),
+        ("the and this is fine " * 100, True),
+        ("\n".join(ellipsis_lines), False),
+        ("\n".join(few_ellipsis_lines), True),
+        ("the and " + " ".join(["123"] * 8 + ["word"] * 2), False),
+    ]
+    for text, expected in cases:
+        assert run_gopher_quality_filter_fast(text) == expected
+    assert run_gopher_quality_filter_batch([text for text, _ in cases]) == [expected for _, expected in cases]
+
+
+def test_gopher_quality_metrics_columns():
+    valid = "This should definitely be a valid input text and of high quality according to Gopher rules. " * 100
+    texts = [
+        "",
+        "Hello world... \nok",
+        "It's 3.14 -- and 1,000 cats!\nfine",
+        valid,
+        "\n".join(["The line here is an example of line ending with an ellipsis..."] * 70 + ["A normal line."] * 30),
+        "the and " + " ".join(["123"] * 8 + ["word"] * 2),
+    ]
+    metrics = run_gopher_quality_metrics(texts)
+    assert metrics[0] == {
+        "token_count": 0, "alpha_ratio": 0.0, "mean_word_length": 0.0, "ellipsis_line_fraction": 0.0,
+        "ellipsis_line_count": 0, "line_count": 1, "char_count": 0,
+    }
+    # "Hello", "world", "...", "ok"
+    assert metrics[1] == {
+        "token_count": 4, "alpha_ratio": 0.75, "mean_word_length": 3.75, "ellipsis_line_fraction": 0.5,
+        "ellipsis_line_count": 1, "line_count": 2, "char_count": 18,
+    }
+    # "It", "'s", "3.14", "--", "and", "1,000", "cats", "!", "fine"
+    assert metrics[2]["token_count"] == 9
+    assert metrics[2]["alpha_ratio"] == pytest.approx(5 / 9)
+    assert metrics[2]["mean_word_length"] == pytest.approx(27 / 9)
+    assert metrics[2]["ellipsis_line_fraction"] == 0.0
+    assert metrics[3]["token_count"] == 1700
+    assert metrics[3]["alpha_ratio"] == pytest.approx(16 / 17)
+    assert metrics[4]["ellipsis_line_fraction"] == pytest.approx(0.7)
+    assert metrics[4]["ellipsis_line_count"] == 70
+    assert metrics[4]["line_count"] == 100
+    assert metrics[5]["alpha_ratio"] == pytest.approx(4 / 12)
+
+    # gopher_thresholds reports the first failing rule, like the per-document filter
+    for word_limit in (50, 4):
+        expected = [run_gopher_quality_filter_fast_reason(text, word_limit) for text in texts]
+        assert run_gopher_thresholds(texts, word_limit) == expected
+    assert [reason for _, reason in run_gopher_thresholds(texts)] == [
+        "TOO_SHORT", "TOO_SHORT", "TOO_SHORT", "Ok", "TOO_MANY_ELLIPSIS_LINES", "TOO_SHORT",
+    ]
+    assert [reason for _, reason in run_gopher_thresholds(texts, word_limit=4)] == [
+        "TOO_SHORT", "LOW_ALPHABETIC_CONTENT", "LOW_ALPHABETIC_CONTENT", "Ok", "TOO_MANY_ELLIPSIS_LINES",
+        "LOW_ALPHABETIC_CONTENT",
+    ]
+
+
+def test_gopher_fast_agrees_with_nltk_on_fixtures():
+    paths = [FIXTURES_PATH / "low_quality_cc.txt", FIXTURES_PATH / "high_quality_wiki_reference.txt"]
+    paths += sorted((FIXTURES_PATH / "documents_with_fuzzy_duplicates").glob("*.txt"))
+    for path in paths:
+        with open(path) as f:
+            text = f.read()
+        assert run_gopher_quality_filter_fast(text) == run_gopher_quality_filter(text)
+
+
+def test_gopher_repetition_rules():
+    with open(FIXTURES_PATH / "high_quality_wiki_reference.txt") as f:
+        assert run_gopher_repetition_filter(f.read()) == (True, "Ok")
+
+    text = "Lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod. " * 20
+    assert run_gopher_repetition_filter(text) == (False, "NO_STOP_WORDS")
+
+    text = "\n".join(f"- item {i} goes with the rest of the list" for i in range(20))
+    assert run_gopher_repetition_filter(text) == (False, "TOO_MANY_BULLET_LINES")
+
+    lines = [f"Line {i} is one of the unique lines to have here." for i in range(10)]
+    text = "\n".join(lines + ["This line is repeated with the same words."] * 10)
+    assert run_gopher_repetition_filter(text) == (False, "DUPLICATE_LINES")
+
+    text = " ".join(f"word{i} and the {i}" for i in range(100)) + " the and of the and of" * 20
+    assert run_gopher_repetition_filter(text)[1] in ("TOP_NGRAM_REPETITION", "DUPLICATE_NGRAMS")
+
+
+def test_gopher_repetition_counts_only_later_occurrences():
+    # the first occurrence of a line, paragraph or n-gram is not a duplicate
+    text = "aaaa\nbb\nbb\n\naaaa\nbb\nbb\n\ncccccc"
+    line_chars, paragraph_chars, _ = run_gopher_repetition_fractions(text, 5)
+    assert line_chars == pytest.approx(10 / 22)
+    assert paragraph_chars == pytest.approx(10 / 26)
+
+    _, _, ngram_chars = run_gopher_repetition_fractions("a b c d e x a b c d e", 5)
+    assert ngram_chars == pytest.approx(5 / 11)
+    _, _, ngram_chars = run_gopher_repetition_fractions("a b c d e f g", 5)
+    assert ngram_chars == 0.0
+
+
+def test_gopher_fast_bounds_scanned_text():
+    # 100,000 ten-letter words is the most text that can still pass
+    assert run_gopher_quality_filter_fast_reason("abcdefghij " * 100_000) == (True, "Ok")
+    # one more character per word cannot pass the mean word length bound, so it is never scanned
+    assert run_gopher_quality_filter_fast_reason("abcdefghijk " * 100_000) == (False, "TOO_LONG")
+    assert run_gopher_quality_filter_fast_reason("x" * 1_000_001) == (False, "TOO_LONG")
+
+
+def test_gopher_fast_ellipsis_lines_with_carriage_returns():
+    # a bare "\r" only counts as whitespace next to the final ellipsis, as in ELLIPSIS_LINE_RE
+    texts = ["foo...\rbar", "foo\rbar...", "a...\rb...", "foo\r...", "foo...\r\nbar", "foo\x1c...", "foo...\x1c"]
+    fractions = [metrics["ellipsis_line_fraction"] for metrics in run_gopher_quality_metrics(texts)]
+    assert fractions == [0.0, 0.0, 0.0, 1.0, 0.5, 1.0, 0.0]
+
+    words = " ".join(["quality"] * 60)
+    assert run_gopher_quality_filter_fast(f"{words}\nfoo...\rbar") == run_gopher_quality_filter_fast(f"{words}\nfoobar")
+    assert run_gopher_quality_filter_fast(f"{words}\nfoo\rbar...")
+    assert not run_gopher_quality_filter_fast(f"{words}\nfoo\r...")
+
+
+@pytest.mark.parametrize("num_lines", [10, 20, 100, 1000])
+def test_gopher_exactly_30_percent_ellipsis_lines(num_lines):
+    # exactly 30% is not "more than 30%", in both the per-document and the batch path
+    ellipsis_lines = num_lines * 3 // 10
+    lines = ["This line of the document ends with an ellipsis..."] * ellipsis_lines
+    lines += ["This line of the document ends without one."] * (num_lines - ellipsis_lines)
+    texts = ["\n".join(lines), "\n".join(lines[1:] + lines[:1] + ["..."])]
+    assert run_gopher_thresholds(texts) == [run_gopher_quality_filter_fast_reason(text) for text in texts]
+    assert run_gopher_thresholds(texts) == [(True, "Ok"), (False, "TOO_MANY_ELLIPSIS_LINES")]
@@ -1,6 +1,7 @@
 import logging
+import math
 
-from .adapters import run_classify_nsfw, run_classify_toxic_speech
+from .adapters import run_classify_harmful_batch, run_classify_nsfw, run_classify_toxic_speech
 
 logger = logging.getLogger(__name__)
 
@@ -55,3 +56,30 @@ def test_classify_toxic_speech():
     assert prediction == "non-toxic"
     assert isinstance(score, float)
     assert score > 0
+
+
+def test_classify_harmful_batch_matches_single():
+    texts = [
+        "SUCK MY C*CK WIKIPEDIA EDITORS...F*CKING *SSH*LE DORKS. "
+        "JUST TRYING TO MAKE THE SITE BETTER YOU UPTIGHT C*NTS",
+        "Why did that idiot revert the reversion I made?\n"
+        "Can that moron not have the decent common manners to post on the talk page? "
+        "What a rude fuck. Arrogant twat who doesn't know what he's talking about.",
+        "Umm, theres no actual article for prostitution ring.  - Crunch Captain.",
+    ]
+    scores = run_classify_harmful_batch(texts, short_circuit=False)
+    cascade_scores = run_classify_harmful_batch(texts)
+    for text, score, cascade_score in zip(texts, scores, cascade_scores):
+        nsfw_label, nsfw_confidence = run_classify_nsfw(text)
+        toxic_label, toxic_confidence = run_classify_toxic_speech(text)
+        expected_nsfw = nsfw_confidence if nsfw_label == "nsfw" else 1 - nsfw_confidence
+        expected_toxic = toxic_confidence if toxic_label == "toxic" else 1 - toxic_confidence
+        assert abs(score["nsfw"] - expected_nsfw) < 1e-5
+        assert abs(score["toxicity"] - expected_toxic) < 1e-5
+        is_harmful = (nsfw_label == "nsfw" and nsfw_confidence > 0.8) or (
+            toxic_label == "toxic" and toxic_confidence > 0.8
+        )
+        assert score["harmful"] == is_harmful
+        assert cascade_score["harmful"] == is_harmful
+        # the cascade skips the toxicity model once the NSFW model rejects
+        assert math.isnan(cascade_score["toxicity"]) == (score["nsfw"] > 0.8)
@@ -0,0 +1,79 @@
+import os
+from io import BytesIO
+
+import pytest
+from warcio.warcwriter import WARCWriter
+
+from .adapters import (
+    run_build_warc_index,
+    run_count_warc_records,
+    run_load_warc_index,
+    run_split_warc_ranges,
+)
+
+
+def write_wet(path, num_records: int = 12) -> list[str]:
+    """Write a gzip WET shard (one gzip member per record) with a warcinfo record first; returns the URLs."""
+    urls = [f"https://example.com/page/{i}" for i in range(num_records)]
+    with open(path, "wb") as f:
+        writer = WARCWriter(f, gzip=True)
+        writer.write_record(writer.create_warcinfo_record("shard.warc.wet.gz", {"software": "test"}))
+        for i, url in enumerate(urls):
+            payload = BytesIO(f"page {i}\n".encode() * (1 + 37 * i))
+            writer.write_record(writer.create_warc_record(url, "conversion", payload=payload))
+    return urls
+
+
+def test_warc_index_round_trip(tmp_path):
+    warc_path = tmp_path / "shard.warc.wet.gz"
+    urls = write_wet(warc_path)
+    index_path = tmp_path / "shard.warc.wet.gz.idx"
+
+    built = run_build_warc_index(warc_path)
+    assert index_path.exists()
+    assert run_load_warc_index(warc_path) == built
+    assert [record_type for _, record_type, _, _, _ in built] == ["warcinfo"] + ["conversion"] * len(urls)
+    assert [url for _, _, _, _, url in built[1:]] == urls
+    # records tile the file: every one starts where the previous one ends
+    assert built[0][2] == 0
+    assert all(a[2] + a[3] == b[2] for a, b in zip(built, built[1:]))
+    assert built[-1][2] + built[-1][3] == os.path.getsize(warc_path)
+
+
+def test_warc_index_read_only_helpers_do_not_write(tmp_path):
+    warc_path = tmp_path / "shard.warc.wet.gz"
+    urls = write_wet(warc_path)
+    index_path = tmp_path / "shard.warc.wet.gz.idx"
+
+    with pytest.raises(FileNotFoundError):
+        run_load_warc_index(warc_path)
+    assert run_count_warc_records(warc_path) == len(urls) + 1
+    assert run_count_warc_records(warc_path, "conversion") == len(urls)
+    assert not index_path.exists()
+
+    assert run_count_warc_records(warc_path, "conversion", build=True) == len(urls)
+    assert index_path.exists()
+    assert run_count_warc_records(warc_path, "warcinfo") == 1
+
+    # a shard newer than its index makes the index stale
+    stat = os.stat(index_path)
+    os.utime(warc_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    with pytest.raises(FileNotFoundError):
+        run_load_warc_index(warc_path)
+    assert len(run_load_warc_index(warc_path, build=True)) == len(urls) + 1
+
+
+@pytest.mark.parametrize("num_splits", [1, 3, 5, 100])
+def test_split_ranges_read_back_every_record_once(tmp_path, num_splits):
+    warc_path = tmp_path / "shard.warc.wet.gz"
+    write_wet(warc_path)
+    entries = run_build_warc_index(warc_path)
+
+    ranges, record_ids = run_split_warc_ranges(warc_path, num_splits)
+    assert 1 <= len(ranges) <= num_splits
+    assert ranges[0][0] == 0
+    assert all(offset + length == next_offset for (offset, length), (next_offset, _) in zip(ranges, ranges[1:]))
+    assert ranges[-1][0] + ranges[-1][1] == os.path.getsize(warc_path)
+    assert {offset for offset, _ in ranges} <= {offset for _, _, offset, _, _ in entries}
+    assert all(ids for ids in record_ids)
+    assert [record_id for ids in record_ids for record_id in ids] == [record_id for record_id, *_ in entries]